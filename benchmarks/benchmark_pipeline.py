@@ -0,0 +1,122 @@
+'''
+Benchmark of the REMPI pipeline on synthetic FELIX HDF5 files (see `packages/SyntheticData.py`).
+Every stage is timed and its memory is profiled with `tracemalloc`:
+1. reading the HDF5 files (`extract_FELIX_data`)
+2. `compile_FELIX_data`
+3. the baseline correction, as the column-by-column loop of the notebook and with `baseline_fullrange`
+4. the depletion spectrum, as the `make_depletion_spectra_multi_peak` loop of the notebook and with `make_depletion_spectra_batch`
+5. the streaming pipeline (`StreamData_FELIX_HDF5`)
+
+Usage, from the main folder of the repository:
+    python benchmarks/benchmark_pipeline.py --files 8 --wavenumbers 86 --samples 100000
+    python benchmarks/benchmark_pipeline.py --data path/to/existing/synthetic/files --output bench_output.txt
+'''
+
+import argparse
+import contextlib
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests'))
+from packages import *
+# the loops of the notebook, the same ones the tests compare with
+from conftest import baseline_loop, depletion_loop
+
+
+def measure(results, stage, function):
+    '''
+    Runs `function()` and appends wall time, peak traced memory and memory still allocated afterwards to `results`.
+    '''
+    tracemalloc.start()
+    start = time.perf_counter()
+    output = function()
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    results.append({"stage": stage, "time_s": elapsed, "peak_MB": peak/1e6, "retained_MB": current/1e6})
+    print(f"{stage:<40} {elapsed:9.3f} s {peak/1e6:10.1f} MB peak")
+    return output
+
+
+def quiet(function, *args, **kwargs):
+    # the readers print the wavenumbers of every file, keep the benchmark output readable
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        return function(*args, **kwargs)
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Benchmark the REMPI pipeline on synthetic FELIX HDF5 files")
+    parser.add_argument("--data", help = "folder with existing .h5 files, otherwise synthetic files are generated in a temporary folder")
+    parser.add_argument("--files", type = int, default = 8)
+    parser.add_argument("--wavenumbers", type = int, default = 86)
+    parser.add_argument("--samples", type = int, default = 100000, help = "samples per trace in the files")
+    parser.add_argument("--read-samples", type = int, default = 60000, help = "samples per trace used by the pipeline")
+    parser.add_argument("--duplicated", type = int, default = 1)
+    parser.add_argument("--skipped", type = int, default = 1)
+    parser.add_argument("--workers", type = int, default = 0, help = "also benchmark the parallel ingest with this many workers")
+    parser.add_argument("--skip-loops", action = "store_true", help = "skip the slow column-by-column loops of the notebook")
+    parser.add_argument("--output", help = "save the results table as CSV")
+    args = parser.parse_args(argv)
+
+    alpha, t_off = 7.7092e-7, 106
+    baseline_reference, interval = 390, 0.5
+    list_mass_isotope, scan_width = [393.3, 394.3], 0.1
+
+    temporary = None
+    if args.data is None:
+        temporary = tempfile.mkdtemp(prefix = "felix_benchmark_")
+        print(f"Generating {args.files} files x {args.wavenumbers} wavenumbers x {args.samples} samples in {temporary}")
+        files = generate_FELIX_HDF5(temporary, n_files = args.files, n_wavenumbers = args.wavenumbers, n_samples = args.samples,
+                                    duplicated = args.duplicated, skipped = args.skipped, alpha = alpha, t_off = t_off)
+    else:
+        files = sorted(glob.glob(os.path.join(args.data, "*.h5")))
+
+    x_mass = alpha*(np.linspace(1, args.read_samples, args.read_samples) - t_off)**2
+    mass_axis = MassAxis(alpha, t_off, args.read_samples)
+    results = []
+    try:
+        raw_data = ProcessData_FELIX_HDF5(files, n_samples = args.read_samples)
+        measure(results, "read: extract_FELIX_data", lambda: quiet(raw_data.extract_FELIX_data))
+        if args.workers > 1:
+            parallel = ProcessData_FELIX_HDF5(files, n_samples = args.read_samples)
+            measure(results, f"read: extract_FELIX_data (workers={args.workers})", lambda: quiet(parallel.extract_FELIX_data, workers = args.workers))
+            del parallel
+
+        compiled_data = measure(results, "compile_FELIX_data", raw_data.compile_FELIX_data)
+        raw_data.data = []
+
+        if not args.skip_loops:
+            tables = measure(results, "baseline: notebook loop", lambda: baseline_loop(compiled_data, baseline_reference, interval, x_mass))
+            measure(results, "depletion: notebook loop", lambda: depletion_loop(tables, list_mass_isotope, scan_width, x_mass))
+            del tables
+
+        fullrange = baseline_fullrange(baseline_reference = baseline_reference, interval = interval, target_mass = mass_axis, compiled_data = compiled_data)
+        measure(results, "baseline: baseline_fullrange", fullrange.run)
+        spectrum = depletion(mass_complex = list_mass_isotope, scan_width = scan_width, target_mass = mass_axis)
+        measure(results, "depletion: make_depletion_spectra_batch", lambda: spectrum.make_depletion_spectra_batch(compiled_data.wavenumbers, fullrange.sums2.T))
+        del fullrange, compiled_data
+
+        stream = StreamData_FELIX_HDF5(files, mass_axis, baseline_reference, interval, list_mass_isotope, scan_width, n_samples = args.read_samples)
+        measure(results, "streaming: StreamData_FELIX_HDF5", stream.run)
+    finally:
+        if temporary is not None:
+            shutil.rmtree(temporary, ignore_errors = True)
+
+    table = pd.DataFrame(results)
+    print("\n" + table.to_string(index = False, float_format = lambda value: f"{value:.3f}"))
+    if args.output:
+        table.to_csv(args.output, index = False)
+    return table
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,18 @@
 
+from collections.abc import Mapping
+
 import h5py
 import numpy as np
 import pandas as pd
 
+from .MassCalibration import *
+from .Instrumentation import *
+
 
 '''
 This section contains functions necessary to perform a baseline calibration.
 '''
-__all__ = ['mass_range', 'baseline']
+__all__ = ['mass_range', 'baseline', 'baseline_fullrange', 'rolling_baseline']
 
 def mass_range(n,m, mass_element, mass_messenger, x_mass):
 
@@ -26,7 +31,8 @@ def mass_range(n,m, mass_element, mass_messenger, x_mass):
     mass_range_max = mass_complex + interval
 
     # get the range of values that are approximately on the same mass
-    mass_range_indices = np.where((x_mass >= mass_range_min) & (x_mass <= mass_range_max))[0]
+    # x_mass can be a MassAxis object, in which case this is a slice
+    mass_range_indices = mass_window(x_mass, mass_range_min, mass_range_max)
 
     return complex, mass_complex, mass_range_indices
 
@@ -60,10 +66,11 @@ class baseline:
         self.baseline_range_min = self.baseline_reference
         self.baseline_range_max = self.baseline_reference + self.interval
         # get the range of values corresponding to the baseline ranges
-        self.baseline_range_indices = np.where((self.mass >= self.baseline_range_min) & (self.mass <= self.baseline_range_max))[0]
+        self.baseline_range_indices = mass_window(self.mass, self.baseline_range_min, self.baseline_range_max)
         return self.baseline_range_indices
 
 
+    @instrumented('baseline.baseline_mean')
     def baseline_mean(self):
         
         # self.baseline_range()
@@ -84,6 +91,7 @@ class baseline:
 
         return self.mean_value_withoutIR, self.mean_value_withIR
 
+    @instrumented('baseline.baseline_correction')
     def baseline_correction(self):
         self.baseline_corrected = pd.DataFrame({
             # "baseline_corrected_"+self.column_withoutIR: abs(self.data_withoutIR)-abs(self.mean_value_withoutIR),
@@ -91,14 +99,17 @@ class baseline:
             "baseline_corrected_"+self.column_withoutIR: (-self.data_withoutIR +abs(self.mean_value_withoutIR)),
             # "baseline_corrected_"+self.column_withIR: (-self.data_withIR-abs(self.mean_value_withIR))
         })
+        instrumentation.add_array(self.baseline_corrected)
         return self.baseline_corrected
 
+    @instrumented('baseline.baseline_compile')
     def baseline_compile(self):
         # check if key already exists in dictionary
 
         if self.wavenumber in self.compiled_data:
             
             self.compiled_data[self.wavenumber] = pd.concat([self.compiled_data[self.wavenumber], self.baseline_corrected], axis=1, ignore_index=False)
+            instrumentation.add_array(self.compiled_data[self.wavenumber])
             return self.compiled_data[self.wavenumber]
 
             # I will disable this part because some wavenumbers are measured more than once per file
@@ -116,6 +127,7 @@ class baseline:
             self.compiled_data[self.wavenumber] = self.baseline_corrected
             return self.compiled_data[self.wavenumber]
         
+    @instrumented('baseline.baseline_sum')
     def baseline_sum(self):
 
         dataset = self.compiled_data[self.wavenumber]
@@ -143,9 +155,11 @@ class baseline:
             # "sum_baseline_corrected_"+str(self.wavenumber)+"_withIR":sum_withIR
         })
         self.compiled_data[self.wavenumber] = pd.concat([dataset.iloc[:,0:end_column_withoutIR], new_table],axis=1)
+        instrumentation.add_array(self.compiled_data[self.wavenumber])
         return self.compiled_data[self.wavenumber]
     
 
+    @instrumented('baseline.baseline_sum_correction')
     def baseline_sum_correction(self):
         
         new_table = {}
@@ -163,5 +177,240 @@ class baseline:
         })
         
         self.compiled_data2[self.wavenumber] = pd.concat([self.compiled_data[self.wavenumber], new_table], axis=1)
+        instrumentation.add_array(self.compiled_data2[self.wavenumber])
         return self.compiled_data2[self.wavenumber]
-    
\ No newline at end of file
+
+
+def _rolling_extreme(data, window, function):
+    '''
+    Minimum (`function=np.minimum`) or maximum (`np.maximum`) of every column over a centered window of `window` samples (odd),
+    with the van Herk / Gil-Werman algorithm: the cost does not depend on the window size.
+    Near the ends of a column the window is cut off.
+    '''
+    half = window // 2
+    n_samples, n_columns = data.shape
+    fill = np.inf if function is np.minimum else -np.inf
+    # pad the ends with +-inf and split every column into blocks of `window` samples
+    n_blocks = -(-(n_samples + 2*half) // window)
+    padded = np.full((n_blocks * window, n_columns), fill)
+    padded[half:half+n_samples] = data
+    blocks = padded.reshape(n_blocks, window, n_columns)
+    # running extreme from the start and from the end of every block
+    prefix = function.accumulate(blocks, axis=1).reshape(-1, n_columns)
+    suffix = function.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].reshape(-1, n_columns)
+    # the window [i, i+window-1] covers the end of one block and the start of the next one
+    return function(suffix[:n_samples], prefix[window-1:window-1+n_samples])
+
+
+def _moving_average(data, window):
+    '''
+    Mean of every column over a centered window of `window` samples, from cumulative sums. Near the ends the window is cut off.
+    '''
+    half = window // 2
+    n_samples = data.shape[0]
+    cumulative = np.zeros((n_samples + 1, data.shape[1]))
+    np.cumsum(data, axis=0, out=cumulative[1:])
+    stop = np.minimum(np.arange(n_samples) + half + 1, n_samples)
+    start = np.maximum(np.arange(n_samples) - half, 0)
+    return (cumulative[stop] - cumulative[start]) / (stop - start)[:, None]
+
+
+def rolling_baseline(data, window, smooth = None, block = 8):
+    '''
+    Smooth lower envelope of every column of `data` (samples x columns), e.g. a baseline that drifts over the mass range.
+    1. moving average over `smooth` samples (`window // 4` by default), so the envelope follows the baseline and not the minima of the noise
+    2. rolling minimum and then rolling maximum over `window` samples (a morphological opening): peaks narrower than the window are cut off
+    3. the same moving average again, to take out the steps of the opening
+    All columns are done together, `block` columns at a time to stay in the CPU cache, with a cost linear in the number of samples.
+    Peaks should be positive (inverted signal), `window` should be wider than the widest peak plus `smooth`. Even widths are made odd.
+    '''
+    data = np.asarray(data)
+    squeeze = data.ndim == 1
+    data = data.reshape(len(data), -1)
+    window = int(window) | 1
+    smooth = int(smooth if smooth is not None else window // 4) | 1
+    baseline = np.empty(data.shape, dtype=np.float64, order='F')
+    instrumentation.add_array(baseline)
+    for start in range(0, data.shape[1], block):
+        columns = slice(start, start + block)
+        smoothed = _moving_average(data[:, columns], smooth) if smooth > 1 else data[:, columns]
+        opened = _rolling_extreme(_rolling_extreme(smoothed, window, np.minimum), window, np.maximum)
+        baseline[:, columns] = _moving_average(opened, smooth) if smooth > 1 else opened
+    return baseline[:, 0] if squeeze else baseline
+
+
+class _baseline_tables(Mapping):
+    '''
+    Read-only dictionary view on the arrays of `baseline_fullrange`.
+    For every wavenumber it gives the same table as `baseline.compiled_data2[wavenumber]`:
+    the baseline corrected columns, the sum and the corrected sum.
+    When the sums came from the cache, only the columns of the requested wavenumber are corrected.
+    '''
+
+    def __init__(self, fullrange):
+        self.fullrange = fullrange
+
+    def __getitem__(self, wavenumber):
+        fullrange = self.fullrange
+        compiled_data = fullrange.compiled_data
+        k = compiled_data._index[wavenumber]
+        columns = compiled_data.columns(wavenumber)
+        table = np.empty((fullrange.sums.shape[0], columns.stop - columns.start + 2), dtype=fullrange.sums.dtype, order='F')
+        table[:, :-2] = fullrange.corrected[:, columns] if fullrange.corrected is not None else fullrange.correct_columns(columns)
+        table[:, -2] = fullrange.sums[:, k]
+        table[:, -1] = fullrange.sums2[:, k]
+        labels = ["baseline_corrected_"+label for label in compiled_data.labels[columns]]
+        labels += ["sum_baseline_corrected_"+str(wavenumber)+"_withoutIR", "sum_baseline_corrected2_"+str(wavenumber)+"_withoutIR"]
+        return pd.DataFrame(table, columns=labels, copy=False)
+
+    def __iter__(self):
+        return iter(self.fullrange.compiled_data)
+
+    def __len__(self):
+        return len(self.fullrange.compiled_data)
+
+
+class baseline_fullrange:
+    '''
+    Vectorized version of the `baseline` class for the full dataset.
+
+    Instead of looping over every column with `baseline_range` -> `baseline_mean` -> `baseline_correction` -> `baseline_compile`,
+    and then `baseline_sum` -> `baseline_sum_correction` per wavenumber, every step is done at once on the whole
+    (samples x traces) array of a `CompiledData_FELIX_HDF5` object (the output of `compile_FELIX_data`):
+    1. mean of every column inside the baseline range
+    2. inversion and offset of every column
+    3. sum of the columns of every wavenumber
+    4. second baseline correction of every sum
+
+    Every column of the compiled data is used.
+    `compiled_data2[wavenumber]` gives the same table as `baseline.compiled_data2[wavenumber]` of the column-by-column loop.
+
+    The corrected columns keep the dtype of the compiled data (e.g. float32), but means and sums are always accumulated in float64.
+
+    With `window` (in samples), step 1 and 2 subtract a smooth baseline of every column instead of one mean (see `rolling_baseline`),
+    for a baseline that drifts over the mass range. `smooth` is the width of its moving averages, `window // 4` by default.
+    `mean_values` is then the mean of that baseline inside the baseline range, steps 3 and 4 stay the same.
+    '''
+
+    def __init__(self, baseline_reference = None, interval = None, target_mass = None, compiled_data = None, window = None, smooth = None):
+        self.baseline_reference = baseline_reference
+        # define a minimum and maximum mass range, based on the interval
+        self.interval = interval
+        self.mass = target_mass
+        self.compiled_data = compiled_data
+        self.window = window # width of the rolling baseline in samples, None == one mean inside the baseline range
+        self.smooth = smooth
+
+        self.baseline_range_indices = 0
+        self.mean_values = None # mean of every column inside the baseline range
+        self.corrected = None # baseline corrected columns (samples x traces), stays None when `.run()` takes the sums from the cache
+        self.sums = None # sum of the corrected columns per wavenumber (samples x wavenumbers)
+        self.sums2 = None # sums after the second baseline correction (samples x wavenumbers)
+
+    @property
+    def compiled_data2(self):
+        # made on request rather than stored, to avoid a reference cycle that would keep the arrays alive until garbage collection
+        return _baseline_tables(self)
+
+    def baseline_range(self):
+        self.baseline_range_min = self.baseline_reference
+        self.baseline_range_max = self.baseline_reference + self.interval
+        # get the range of values corresponding to the baseline ranges
+        self.baseline_range_indices = mass_window(self.mass, self.baseline_range_min, self.baseline_range_max)
+        return self.baseline_range_indices
+
+    @instrumented('baseline_fullrange.baseline_mean')
+    def baseline_mean(self):
+        if self.window is not None:
+            # done together with the correction, the baseline of every column is not kept
+            return self.mean_values
+        # a slice keeps every column contiguous, so the mean is taken exactly as for a single column
+        self.mean_values = self.compiled_data.traces[as_slice(self.baseline_range_indices)].mean(axis=0, dtype=np.float64)
+        return self.mean_values
+
+    @instrumented('baseline_fullrange.baseline_correction')
+    def baseline_correction(self):
+        '''
+        CAUTION! The y-axis values are inverted here, same as `baseline.baseline_correction`.
+        '''
+        traces = self.compiled_data.traces
+        self.corrected = np.empty(traces.shape, dtype=traces.dtype, order='F')
+        instrumentation.add_array(self.corrected)
+        np.negative(traces, out=self.corrected)
+        if self.window is None:
+            self.corrected += np.abs(self.mean_values)
+            return self.corrected
+
+        # the inverted traces have positive peaks, their baseline is the lower envelope
+        block = 64
+        self.mean_values = np.empty(traces.shape[1])
+        for start in range(0, traces.shape[1], block):
+            columns = slice(start, start + block)
+            curves = rolling_baseline(self.corrected[:, columns], self.window, self.smooth)
+            self.mean_values[columns] = -curves[as_slice(self.baseline_range_indices)].mean(axis=0)
+            self.corrected[:, columns] -= curves
+        return self.corrected
+
+    def correct_columns(self, columns):
+        '''
+        The baseline corrected columns (a slice) of the traces, the same numbers as `.baseline_correction()` gives for them,
+        without correcting the whole dataset. Used by `compiled_data2` after `.run()` took the sums from the cache.
+        '''
+        corrected = np.negative(self.compiled_data.traces[:, columns], order='F')
+        if self.window is None:
+            corrected += np.abs(self.mean_values[columns])
+        else:
+            corrected -= rolling_baseline(corrected, self.window, self.smooth)
+        return corrected
+
+    @instrumented('baseline_fullrange.baseline_sum')
+    def baseline_sum(self):
+        # sum the columns of each wavenumber, one block of columns after another
+        # the columns are added one by one in file order, same as `DataFrame.sum(axis=1)`
+        offsets = self.compiled_data.offsets
+        self.sums = np.empty((self.corrected.shape[0], len(offsets) - 1), dtype=np.float64, order='F')
+        instrumentation.add_array(self.sums)
+        for k in range(len(offsets) - 1):
+            np.sum(self.corrected[:, offsets[k]:offsets[k+1]], axis=1, dtype=np.float64, out=self.sums[:, k])
+        return self.sums
+
+    @instrumented('baseline_fullrange.baseline_sum_correction')
+    def baseline_sum_correction(self):
+        mean_values = self.sums[as_slice(self.baseline_range_indices)].mean(axis=0)
+        self.sums2 = self.sums - np.abs(mean_values)
+        instrumentation.add_array(self.sums2)
+        return self.sums2
+
+    @instrumented('baseline_fullrange.run')
+    def run(self, cache=None):
+        '''
+        Runs all steps and returns `compiled_data2`.
+
+        With a `ProcessingCache` as `cache`, the sums are saved and reused when the same compiled data
+        (see `ProcessData_FELIX_HDF5.cached_compile_FELIX_data`), mass axis, `baseline_reference` and `interval` come back.
+        A cache hit only loads `mean_values`, `sums` and `sums2`: `corrected` stays None and `compiled_data2` corrects the columns
+        of a wavenumber when its table is asked for.
+        '''
+        self.baseline_range()
+        key = None
+        if cache is not None:
+            compiled_key = self.compiled_data.cache_key or cache.array_hash(self.compiled_data.traces)
+            mass = np.asarray(self.mass)
+            key = cache.key('baseline', compiled_key, getattr(self.mass, 'alpha', None), getattr(self.mass, 't_off', None),
+                            cache.array_hash(mass), self.baseline_reference, self.interval, self.window, self.smooth)
+            cached = cache.load(key)
+            if cached is not None:
+                arrays, _ = cached
+                self.mean_values = np.asarray(arrays['mean_values'])
+                self.corrected = None
+                self.sums = arrays['sums']
+                self.sums2 = arrays['sums2']
+                return self.compiled_data2
+
+        self.baseline_mean()
+        self.baseline_correction()
+        self.baseline_sum()
+        self.baseline_sum_correction()
+        if key is not None:
+            cache.store(key, {'mean_values': self.mean_values, 'sums': self.sums, 'sums2': self.sums2})
+        return self.compiled_data2
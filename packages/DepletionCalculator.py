@@ -1,11 +1,130 @@
 import h5py
 import numpy as np
 import pandas as pd
+
+from .MassCalibration import *
+from .Instrumentation import *
 '''
 This section contains functions necessary to perform single peak and multipeak integration. 
 '''
 
-__all__ = ['depletion']
+__all__ = ['depletion', 'integration_index', 'integrate_isotope_windows', 'complex_grid', 'integrate_complex_grid']
+
+
+@instrumented('integrate_isotope_windows')
+def integrate_isotope_windows(data, mass, list_mass_isotope, scan_width):
+    '''
+    Vectorized version of `get_actual_mass_peak` + the isotope sum of `get_depletion_multi_peak` for many spectra at once.
+
+    `data` is a 2D array with one (summed, baseline corrected) spectrum per row, e.g. wavenumbers x samples.
+    `mass` is the calibrated x-axis (array or MassAxis).
+    For every isotope:
+    1. the maximum of each spectrum inside [isotope - scan_width, isotope + scan_width] gives the actual peak mass
+    2. each spectrum is summed inside [peak - scan_width, peak + scan_width]
+    The sums of all isotopes are added up per spectrum, always in float64.
+
+    Returns the sums (one per row), the peak masses (rows x isotopes) and the start/stop indices of the integration windows (rows x isotopes).
+    '''
+    data = np.atleast_2d(np.asarray(data))
+    mass_axis = MassAxis.from_mass(mass)
+    rows = np.arange(data.shape[0])
+
+    signal_withoutIR = np.zeros(data.shape[0], dtype=np.float64)
+    peak_masses = np.empty((data.shape[0], len(list_mass_isotope)))
+    window_start = np.empty((data.shape[0], len(list_mass_isotope)), dtype=np.intp)
+    window_stop = np.empty((data.shape[0], len(list_mass_isotope)), dtype=np.intp)
+
+    for index, mass_isotope in enumerate(list_mass_isotope):
+        # get the peak of every spectrum inside the expected scan width
+        indices = mass_window(mass_axis, mass_isotope - scan_width, mass_isotope + scan_width)
+        range_x = mass_axis[indices]
+        peak = range_x[np.argmax(data[:, indices], axis=1)]
+        peak_masses[:, index] = peak
+
+        # updated scan width around each peak
+        start, stop = mass_axis.index_range(peak - scan_width, peak + scan_width)
+        window_start[:, index] = start
+        window_stop[:, index] = stop
+
+        # sum the data inside each window: gather all windows padded to the widest one, then mask the padding
+        width = int((stop - start).max()) if len(start) else 0
+        columns = start[:, None] + np.arange(width)
+        inside = columns < stop[:, None]
+        values = data[rows[:, None], np.minimum(columns, data.shape[1] - 1)]
+        signal_withoutIR += np.where(inside, values, 0).sum(axis=1, dtype=np.float64)
+
+    return signal_withoutIR, peak_masses, (window_start, window_stop)
+
+
+def complex_grid(n_values, m_values, mass_element, mass_messenger, isotope_offsets = (0,)):
+    '''
+    Isotope masses of every Fe_n-Ar_m complex of a grid, with the same name and mass as `mass_range`.
+    `isotope_offsets` == mass of every isotope peak relative to the complex mass, e.g. (0, 1)
+    Returns a dictionary "Fe{n}-Ar{m}" -> list of isotope masses, for `integrate_complex_grid`.
+    '''
+    if len(isotope_offsets) == 0:
+        raise ValueError("At least one isotope offset is needed")
+    complexes = {}
+    for n in n_values:
+        for m in m_values:
+            mass_complex = mass_element*n + mass_messenger*m
+            complexes[f"Fe{n}-Ar{m}"] = [mass_complex + offset for offset in isotope_offsets]
+    return complexes
+
+
+@instrumented('integrate_complex_grid')
+def integrate_complex_grid(wavenumbers, data, mass, complexes, scan_width):
+    '''
+    Same as `integrate_isotope_windows` for many complexes at once, e.g. a whole cluster distribution from `complex_grid`.
+
+    `data` is the wavenumbers x samples array of the summed, baseline corrected signal, e.g. `baseline_fullrange.sums2.T`.
+    `complexes` is a dictionary name -> list of isotope masses.
+    The windows of all isotopes of all complexes are gathered from the data in one go:
+    1. the maximum inside [isotope - scan_width, isotope + scan_width] gives the actual peak mass, per wavenumber
+    2. the data is summed inside [peak - scan_width, peak + scan_width]
+    3. the isotope sums are added up per complex (a segment reduction over the isotopes of each complex)
+
+    Returns a DataFrame with the column `wavenumber` and one column per complex.
+    Complexes with an isotope outside the mass axis get NaN.
+    The values agree with `integrate_isotope_windows` per complex up to rounding in the last digit.
+    '''
+    data = np.atleast_2d(np.asarray(data))
+    mass_axis = MassAxis.from_mass(mass)
+    n_samples = data.shape[1]
+    labels = list(complexes)
+    if any(len(complexes[label]) == 0 for label in labels):
+        raise ValueError("Every complex needs at least one isotope mass")
+
+    # all isotopes of all complexes in one flat array, the isotopes of complex k start at first_isotope[k]
+    isotopes = np.asarray([isotope for label in labels for isotope in complexes[label]], dtype=np.float64)
+    first_isotope = np.cumsum([0] + [len(complexes[label]) for label in labels[:-1]])
+
+    # 1. peak of every isotope inside the expected scan width (isotopes x width windows, padding masked with -inf)
+    start, stop = mass_axis.index_range(isotopes - scan_width, isotopes + scan_width)
+    valid = stop > start
+    width = int((stop - start).max()) if len(start) else 0
+    columns = start[:, None] + np.arange(width)
+    values = data[:, np.minimum(columns, n_samples - 1)]
+    values = np.where(columns < stop[:, None], values, -np.inf)
+    peak_index = np.minimum(start + np.argmax(values, axis=2), len(mass_axis) - 1)
+    del values
+    peak_masses = np.where(valid, mass_axis.mass[peak_index], isotopes)
+
+    # 2. sum inside the updated scan width around every peak (wavenumbers x isotopes x width windows, padding masked with 0)
+    start, stop = mass_axis.index_range(peak_masses - scan_width, peak_masses + scan_width)
+    width = int((stop - start).max()) if start.size else 0
+    columns = start[:, :, None] + np.arange(width)
+    values = data[np.arange(data.shape[0])[:, None, None], np.minimum(columns, n_samples - 1)]
+    isotope_sums = np.where(columns < stop[:, :, None], values, 0).sum(axis=2, dtype=np.float64)
+    del values
+
+    # 3. isotopes of every complex are added up in their order, as in `integrate_isotope_windows`
+    signal_withoutIR = np.add.reduceat(isotope_sums, first_isotope, axis=1)
+    signal_withoutIR[:, ~np.logical_and.reduceat(valid, first_isotope)] = np.nan
+
+    table = pd.DataFrame(signal_withoutIR, columns=labels)
+    table.insert(0, "wavenumber", np.asarray(wavenumbers, dtype=np.float64))
+    return table
 
 class depletion:
 
@@ -31,6 +150,8 @@ class depletion:
 
         self.list_mass_isotope = []
         self.list_scanwidth_isotope = []
+        self.peak_masses = None
+        self.peak_windows = None
         
     def get_range_scan_width(self, mass_input):
         '''
@@ -42,8 +163,8 @@ class depletion:
         mass_isotope = mass_input
         scan_width_min = mass_isotope - self.scan_width
         scan_width_max = mass_isotope + self.scan_width
-        self.scan_width_range_indices = np.where((self.mass >= scan_width_min)&(self.mass <=scan_width_max))[0]
-        # x_mass is the calibrated x-range of the plot.
+        self.scan_width_range_indices = mass_window(self.mass, scan_width_min, scan_width_max)
+        # x_mass is the calibrated x-range of the plot, or a MassAxis object in which case the indices are a slice.
         # It was declared just after the Part2 heading.
         # print(mass_isotope, scan_width_min, scan_width_max)
         return self.scan_width_range_indices
@@ -128,6 +249,7 @@ class depletion:
         return self.depletion_spectra
 
 
+    @instrumented('depletion.get_depletion_multi_peak')
     def get_depletion_multi_peak(self):
         '''
         This function does the following calculations:
@@ -179,6 +301,7 @@ class depletion:
         })
         return self.new_table
 
+    @instrumented('depletion.make_depletion_spectra_multi_peak')
     def make_depletion_spectra_multi_peak(self):
         '''
         creates a depletion spectra based on the `get_depletion_multiple_peak` method.
@@ -186,3 +309,219 @@ class depletion:
         self.get_depletion_multi_peak()
         self.depletion_spectra = pd.concat([self.depletion_spectra, self.new_table], axis=0)
         return self.depletion_spectra
+
+    @instrumented('depletion.make_depletion_spectra_batch')
+    def make_depletion_spectra_batch(self, wavenumbers, data):
+        '''
+        Batched version of `make_depletion_spectra_multi_peak` for all wavenumbers at once.
+
+        `data` is the wavenumbers x samples array of the summed, baseline corrected signal,
+        e.g. `baseline_fullrange.sums2.T` together with `compiled_data.wavenumbers`.
+        The peak search and integration of every isotope (`self.mass_complex`) is done for all wavenumbers together,
+        and the full spectrum is made in one step instead of appending one row per wavenumber.
+        The actual peak masses and integration windows are kept in `self.peak_masses` and `self.peak_windows`.
+        '''
+        signal_withoutIR, self.peak_masses, self.peak_windows = integrate_isotope_windows(data, self.mass, self.mass_complex, self.scan_width)
+        self.depletion_spectra = pd.DataFrame({
+            "wavenumber": np.asarray(wavenumbers, dtype=np.float64),
+            "sum_withoutIR": signal_withoutIR,
+        })
+        return self.depletion_spectra
+
+    @instrumented('depletion.make_depletion_spectra_grid')
+    def make_depletion_spectra_grid(self, wavenumbers, data, complexes):
+        '''
+        Depletion spectra of many complexes in one sweep over the data, see `integrate_complex_grid`.
+        `complexes` is a dictionary name -> list of isotope masses, e.g. from `complex_grid`, `self.mass_complex` is not used.
+        Returns a wavenumber x complex table, with the column `wavenumber` and one column per complex, named after it (e.g. "Fe1-Ar0").
+        '''
+        self.depletion_spectra = integrate_complex_grid(wavenumbers, data, self.mass, complexes, self.scan_width)
+        return self.depletion_spectra
+
+
+class integration_index:
+    '''
+    Cumulative sums of the summed signal of every wavenumber, to try many `scan_width`, `baseline_reference`, `interval`
+    and isotope settings without redoing the baseline correction and the integration each time.
+
+    For a baseline window, `baseline_fullrange` gives per wavenumber
+        sums2 = -(sum of the traces) + offset
+    where `offset` is one number per wavenumber (from the baseline means of the traces and of their sum).
+    So:
+    1. the peak search (`argmax` of sums2) does not depend on the baseline settings
+    2. the integral of any window is a difference of two cumulative sums plus offset*(number of points), independent of its width
+
+    `compiled_data` == output of `compile_FELIX_data` (a `CompiledData_FELIX_HDF5`)
+    `target_mass` == calibrated x-axis (array or `MassAxis`)
+    The spectra agree with `baseline_fullrange` + `depletion.make_depletion_spectra_batch` up to rounding.
+    '''
+
+    def __init__(self, compiled_data, target_mass):
+        self.compiled_data = compiled_data
+        self.mass = MassAxis.from_mass(target_mass)
+        self.wavenumbers = np.asarray(compiled_data.wavenumbers, dtype=np.float64)
+
+        # sum of the traces of every wavenumber (samples x wavenumbers), as in `baseline_fullrange.baseline_sum`
+        traces = compiled_data.traces
+        offsets = compiled_data.offsets
+        self.raw_sums = np.empty((traces.shape[0], len(offsets) - 1), dtype=np.float64, order='F')
+        for k in range(len(offsets) - 1):
+            np.sum(traces[:, offsets[k]:offsets[k+1]], axis=1, dtype=np.float64, out=self.raw_sums[:, k])
+
+        # cumulative sums around the mean of every column, which keeps them small and the differences precise
+        # prefix[i] == sum(raw_sums[:i]) - i*center
+        self.center = self.raw_sums.mean(axis=0)
+        self.prefix = np.zeros((self.raw_sums.shape[0] + 1, self.raw_sums.shape[1]), dtype=np.float64, order='F')
+        np.cumsum(self.raw_sums - self.center, axis=0, out=self.prefix[1:])
+
+        self.columns = np.arange(self.raw_sums.shape[1])
+        self.baseline_offsets = {} # (baseline_reference, interval) -> offset per wavenumber
+        self.peak_windows = {} # (isotope, scan_width) -> (peak masses, start, stop) per wavenumber
+        self.bootstrap_resamples = None # resampled spectra of the last `.bootstrap()`
+
+    def raw_window_sums(self, start, stop):
+        '''
+        Sum of `raw_sums[start:stop]` for every wavenumber, `start` and `stop` are arrays with one index per wavenumber.
+        '''
+        return (self.prefix[stop, self.columns] - self.prefix[start, self.columns]) + self.center * (stop - start)
+
+    def baseline_offset(self, baseline_reference, interval):
+        '''
+        Returns `offset` per wavenumber, so that sums2 == -raw_sums + offset for this baseline window.
+        '''
+        key = (baseline_reference, interval)
+        if key not in self.baseline_offsets:
+            indices = as_slice(mass_window(self.mass, baseline_reference, baseline_reference + interval))
+            # first correction: every trace gets abs(its mean in the baseline window), as in `baseline_fullrange.baseline_mean`
+            trace_means = np.abs(self.compiled_data.traces[indices].mean(axis=0, dtype=np.float64))
+            corrections = np.add.reduceat(trace_means, self.compiled_data.offsets[:-1]) if len(trace_means) else np.zeros(0)
+            # second correction: abs(mean of the corrected sum in the baseline window)
+            if isinstance(indices, slice):
+                raw_means = self.raw_window_sums(np.full(len(self.columns), indices.start), np.full(len(self.columns), indices.stop)) / (indices.stop - indices.start)
+            else:
+                raw_means = self.raw_sums[indices].mean(axis=0)
+            self.baseline_offsets[key] = corrections - np.abs(corrections - raw_means)
+        return self.baseline_offsets[key]
+
+    def sums2(self, baseline_reference, interval):
+        '''
+        The summed, baseline corrected signal (samples x wavenumbers), same as `baseline_fullrange.sums2`.
+        '''
+        return self.baseline_offset(baseline_reference, interval) - self.raw_sums
+
+    def peaks(self, mass_isotope, scan_width):
+        '''
+        Actual peak mass of an isotope for every wavenumber and the integration window around it (start, stop indices),
+        same as `integrate_isotope_windows`. The maximum of sums2 is the minimum of the raw sum, whatever the baseline.
+        '''
+        key = (mass_isotope, scan_width)
+        if key not in self.peak_windows:
+            indices = mass_window(self.mass, mass_isotope - scan_width, mass_isotope + scan_width)
+            peak = self.mass[indices][np.argmin(self.raw_sums[indices], axis=0)]
+            start, stop = self.mass.index_range(peak - scan_width, peak + scan_width)
+            self.peak_windows[key] = (peak, start, stop)
+        return self.peak_windows[key]
+
+    def integrate(self, list_mass_isotope, scan_width, baseline_reference, interval):
+        '''
+        Integrated signal of every wavenumber for one setting, the `sum_withoutIR` of `depletion.make_depletion_spectra_batch`.
+        '''
+        offset = self.baseline_offset(baseline_reference, interval)
+        signal_withoutIR = np.zeros(len(self.columns), dtype=np.float64)
+        for mass_isotope in list_mass_isotope:
+            _, start, stop = self.peaks(mass_isotope, scan_width)
+            signal_withoutIR += offset * (stop - start) - self.raw_window_sums(start, stop)
+        return signal_withoutIR
+
+    def spectrum(self, list_mass_isotope, scan_width, baseline_reference, interval):
+        '''
+        REMPI spectrum for one setting, the same table as `depletion.make_depletion_spectra_batch`.
+        '''
+        return pd.DataFrame({
+            "wavenumber": self.wavenumbers,
+            "sum_withoutIR": self.integrate(list_mass_isotope, scan_width, baseline_reference, interval),
+        })
+
+    @instrumented('integration_index.bootstrap')
+    def bootstrap(self, list_mass_isotope, scan_width, baseline_reference, interval, n_resamples = 1000, confidence = 0.95, seed = None):
+        '''
+        Bootstrap uncertainty of the REMPI spectrum: the traces (files) of every wavenumber are drawn with replacement `n_resamples` times.
+
+        The integration windows found on the full data are kept for every resample. Then the integrated signal of a resample only
+        depends on three numbers per trace (raw sum inside the windows, raw mean and absolute mean inside the baseline window),
+        weighted by how often the trace was drawn. So all resamples of a wavenumber are a few matrix-vector products.
+        Wavenumbers measured only once get a band of zero width.
+
+        Returns a DataFrame with the columns `wavenumber`, `sum_withoutIR` (full data), `std` and the `lower`/`upper` limits of the
+        `confidence` interval (percentiles). All resampled spectra are kept in `self.bootstrap_resamples` (resamples x wavenumbers).
+        '''
+        rng = np.random.default_rng(seed)
+        traces = self.compiled_data.traces
+        offsets = self.compiled_data.offsets
+        baseline_indices = as_slice(mass_window(self.mass, baseline_reference, baseline_reference + interval))
+        windows = [self.peaks(mass_isotope, scan_width) for mass_isotope in list_mass_isotope]
+
+        self.bootstrap_resamples = np.empty((n_resamples, len(self.columns)), dtype=np.float64)
+        for k in range(len(self.columns)):
+            block = traces[:, offsets[k]:offsets[k+1]]
+            n_traces = block.shape[1]
+            # per trace: raw sum inside the integration windows and raw mean inside the baseline window
+            integrals = np.zeros(n_traces, dtype=np.float64)
+            points = 0
+            for _, start, stop in windows:
+                integrals += block[start[k]:stop[k]].sum(axis=0, dtype=np.float64)
+                points += stop[k] - start[k]
+            means = block[baseline_indices].mean(axis=0, dtype=np.float64)
+
+            # how often every trace is drawn, one row per resample
+            counts = rng.multinomial(n_traces, np.full(n_traces, 1/n_traces), size=n_resamples).astype(np.float64)
+            corrections = counts @ np.abs(means)
+            offset = corrections - np.abs(corrections - counts @ means)
+            self.bootstrap_resamples[:, k] = offset * points - counts @ integrals
+
+        tail = (1 - confidence) / 2
+        lower, upper = np.quantile(self.bootstrap_resamples, [tail, 1 - tail], axis=0)
+        return pd.DataFrame({
+            "wavenumber": self.wavenumbers,
+            "sum_withoutIR": self.integrate(list_mass_isotope, scan_width, baseline_reference, interval),
+            "std": self.bootstrap_resamples.std(axis=0, ddof=1) if n_resamples > 1 else np.zeros(len(self.columns)),
+            "lower": lower,
+            "upper": upper,
+        })
+
+    @instrumented('integration_index.sweep')
+    def sweep(self, isotope_sets, scan_widths, baseline_references, intervals):
+        '''
+        REMPI spectra for every combination of the settings, e.g. to pick the scan width and baseline with a slider.
+        `isotope_sets` is a list of lists of isotope masses, the other arguments are lists of values.
+
+        Returns one long table with the columns `isotopes` (index into `isotope_sets`), `scan_width`, `baseline_reference`,
+        `interval`, `wavenumber` and `sum_withoutIR`, one row per combination and wavenumber.
+        '''
+        settings = []
+        spectra = []
+        n_wavenumbers = len(self.wavenumbers)
+        for isotopes_index, list_mass_isotope in enumerate(isotope_sets):
+            for scan_width in scan_widths:
+                # the part that does not depend on the baseline: window sums and number of points of all isotopes
+                raw = np.zeros(n_wavenumbers, dtype=np.float64)
+                points = np.zeros(n_wavenumbers, dtype=np.float64)
+                for mass_isotope in list_mass_isotope:
+                    _, start, stop = self.peaks(mass_isotope, scan_width)
+                    raw += self.raw_window_sums(start, stop)
+                    points += stop - start
+                for baseline_reference in baseline_references:
+                    for interval in intervals:
+                        settings.append((isotopes_index, scan_width, baseline_reference, interval))
+                        spectra.append(self.baseline_offset(baseline_reference, interval) * points - raw)
+
+        settings = np.asarray(settings, dtype=np.float64).reshape(-1, 4)
+        table = pd.DataFrame({
+            "isotopes": np.repeat(settings[:, 0].astype(np.intp), n_wavenumbers),
+            "scan_width": np.repeat(settings[:, 1], n_wavenumbers),
+            "baseline_reference": np.repeat(settings[:, 2], n_wavenumbers),
+            "interval": np.repeat(settings[:, 3], n_wavenumbers),
+            "wavenumber": np.tile(self.wavenumbers, len(settings)),
+            "sum_withoutIR": np.concatenate(spectra) if spectra else np.empty(0),
+        })
+        return table
@@ -0,0 +1,129 @@
+'''
+This block of code defines a "CompiledData_FELIX_HDF5" object.
+It stores the signal data of all files in one 2D array (samples x traces) with an index per wavenumber.
+`compiled_data[wavenumber]` gives a DataFrame view, as the dictionary of `compile_FELIX_data` did.
+'''
+
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+
+from .Instrumentation import *
+from .WavenumberGroups import *
+
+__all__ = ['CompiledData_FELIX_HDF5']
+
+class CompiledData_FELIX_HDF5(Mapping):
+
+    def __init__(self, traces, wavenumbers, offsets, labels, file_index=None, measurement_index=None):
+        self.traces = traces # 2D array (samples x traces), Fortran ordered so that every column is contiguous
+        self.wavenumbers = np.asarray(wavenumbers) # sorted unique wavenumbers
+        self.offsets = np.asarray(offsets) # columns of wavenumbers[k] are traces[:, offsets[k]:offsets[k+1]]
+        self.labels = list(labels) # column labels, e.g. "544.98_Data.0005_withoutIR"
+        self.file_index = file_index # index of the file each column came from
+        self.measurement_index = measurement_index # index of the measurement (wavenumber) within that file
+        self.cache_key = None # key in a `ProcessingCache`, if the data was saved there
+        self._index = {wavenumber: k for k, wavenumber in enumerate(wavenumbers)}
+
+    @classmethod
+    def from_readers(cls, readers, file_labels, skip_first=True, groups=None):
+        '''
+        Builds the compiled data from a list of `ReadData_FELIX_HDF5` objects (the output of `extract_FELIX_data`).
+
+        The FELIX measurement software first measures at the wavenumber where you are (index==0), so by default it is skipped.
+        All columns of one wavenumber are kept in file order, and doubly measured wavenumbers give extra columns.
+        Only the first channel of each `signal` is used (signal without IR irradiation).
+        Which measurements belong to the same wavenumber is decided by `groups` (a `WavenumberGroups`), by default identical wavenumbers.
+        '''
+        if groups is None:
+            groups = WavenumberGroups.from_readers(readers, skip_first=skip_first, file_labels=file_labels)
+        file_index = groups.file_index
+        measurement_index = groups.measurement_index
+        offsets = groups.offsets.tolist()
+        unique_wavenumbers = groups.wavenumbers
+
+        if len(file_index):
+            n_samples = {readers[f].signal.shape[1] for f in file_index}
+            if len(n_samples) > 1:
+                raise ValueError(f"Files have traces of different length {sorted(n_samples)}, set `n_samples` to read the same number of samples")
+            n_samples = n_samples.pop()
+            dtype = readers[file_index[0]].signal.dtype
+        else:
+            n_samples, dtype = 0, np.float64
+
+        # preallocate the full block and fill it column by column
+        traces = np.empty((n_samples, len(file_index)), dtype=dtype, order='F')
+        instrumentation.add_array(traces)
+        labels = []
+        for column, (f, measurement) in enumerate(zip(file_index, measurement_index)):
+            traces[:, column] = readers[f].signal[measurement][:, 0]
+            labels.append(str(readers[f].wavenumbers[measurement])+"_"+file_labels[f]+"_withoutIR")
+
+        return cls(traces, unique_wavenumbers, offsets, labels, file_index, measurement_index)
+
+    def to_arrays(self):
+        '''
+        Returns the content as a dictionary of numpy arrays and a dictionary of metadata, e.g. to save it in a `ProcessingCache`.
+        '''
+        arrays = {
+            'traces': self.traces,
+            'wavenumbers': np.asarray(self.wavenumbers, dtype=np.float64),
+            'offsets': self.offsets,
+            'file_index': np.asarray(self.file_index if self.file_index is not None else [], dtype=np.intp),
+            'measurement_index': np.asarray(self.measurement_index if self.measurement_index is not None else [], dtype=np.intp),
+        }
+        return arrays, {'labels': self.labels}
+
+    @classmethod
+    def from_arrays(cls, arrays, metadata):
+        '''
+        Inverse of `.to_arrays()`.
+        '''
+        traces = arrays['traces']
+        if not traces.flags.f_contiguous:
+            traces = np.asfortranarray(traces)
+        return cls(traces, list(arrays['wavenumbers']), arrays['offsets'], metadata['labels'], arrays['file_index'], arrays['measurement_index'])
+
+    def select(self, wavenumbers):
+        '''
+        Returns a new `CompiledData_FELIX_HDF5` with only the given wavenumbers, in that order. The traces are copied.
+        '''
+        ks = [self._index[wavenumber] for wavenumber in wavenumbers]
+        counts = [self.offsets[k+1] - self.offsets[k] for k in ks]
+        columns = np.concatenate([np.arange(self.offsets[k], self.offsets[k+1]) for k in ks]) if ks else np.zeros(0, dtype=np.intp)
+        traces = np.asfortranarray(self.traces[:, columns])
+        instrumentation.add_array(traces)
+        file_index = np.asarray(self.file_index)[columns] if self.file_index is not None else None
+        measurement_index = np.asarray(self.measurement_index)[columns] if self.measurement_index is not None else None
+        return CompiledData_FELIX_HDF5(traces, [self.wavenumbers[k] for k in ks], np.concatenate([[0], np.cumsum(counts, dtype=np.intp)]),
+                                       [self.labels[column] for column in columns], file_index, measurement_index)
+
+    def columns(self, wavenumber):
+        '''
+        Returns the slice of columns belonging to a wavenumber.
+        '''
+        k = self._index[wavenumber]
+        return slice(self.offsets[k], self.offsets[k+1])
+
+    def block(self, wavenumber):
+        '''
+        Returns the 2D array (samples x repeats) of a wavenumber. This is a view, not a copy.
+        '''
+        return self.traces[:, self.columns(wavenumber)]
+
+    def __getitem__(self, wavenumber):
+        columns = self.columns(wavenumber)
+        return pd.DataFrame(self.traces[:, columns], columns=self.labels[columns], copy=False)
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, wavenumber):
+        return wavenumber in self._index
+
+    def __repr__(self):
+        return f"CompiledData_FELIX_HDF5({len(self)} wavenumbers, {self.traces.shape[1]} traces of {self.traces.shape[0]} samples)"
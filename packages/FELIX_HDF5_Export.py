@@ -0,0 +1,218 @@
+'''
+This section contains the export of the processed data to a single chunked, compressed HDF5 file, and a lazy reader for it.
+The parts are 'calibration', 'compiled', 'baseline' and 'depletion', every part is optional.
+The reader only loads the small index arrays when the file is opened, traces and sums are read per wavenumber range.
+'''
+
+import h5py
+import numpy as np
+import pandas as pd
+
+from .MassCalibration import *
+from .FELIX_HDF5_CompiledData import *
+
+__all__ = ['export_FELIX_HDF5', 'ExportedData_FELIX_HDF5']
+
+FORMAT_VERSION = 1
+
+
+def _write_rows(group, name, rows, compression, compression_opts):
+    # one row (trace or sum) per chunk, so reading a range of wavenumbers only decompresses those rows
+    rows = np.ascontiguousarray(rows)
+    chunks = (1, rows.shape[1]) if rows.size else None
+    return group.create_dataset(name, data=rows, chunks=chunks, shuffle=rows.size > 0, compression=compression if rows.size else None,
+                                compression_opts=compression_opts if rows.size else None)
+
+
+def _set_attributes(node, attributes):
+    # HDF5 attributes cannot be None, those are left out
+    for key, value in attributes.items():
+        if value is not None:
+            node.attrs[key] = value
+
+
+def export_FELIX_HDF5(file_name, compiled_data = None, fullrange = None, spectrum = None, mass = None, compression = 'gzip', compression_opts = 4):
+    '''
+    Writes the processed data to `file_name`.
+
+    `compiled_data` == output of `compile_FELIX_data` (a `CompiledData_FELIX_HDF5`), by default the one of `fullrange`
+    `fullrange` == a `baseline_fullrange` object after `.run()`, gives the sums and the baseline settings
+    `spectrum` == a `depletion` object after `.make_depletion_spectra_batch()`, gives the REMPI spectrum and the isotopes
+    `mass` == calibrated x-axis (array or `MassAxis`), by default the one of `fullrange` or `spectrum`
+    `compression` == any h5py compression filter, e.g. 'gzip' (level `compression_opts`) or 'lzf' (faster, larger)
+    '''
+    if compiled_data is None and fullrange is not None:
+        compiled_data = fullrange.compiled_data
+    if mass is None:
+        mass = fullrange.mass if fullrange is not None else getattr(spectrum, 'mass', None)
+
+    with h5py.File(file_name, 'w') as file:
+        file.attrs['format_version'] = FORMAT_VERSION
+
+        if mass is not None:
+            calibration = file.create_group('calibration')
+            calibration.create_dataset('mass', data=np.asarray(mass, dtype=np.float64))
+            _set_attributes(calibration, {'alpha': getattr(mass, 'alpha', None), 't_off': getattr(mass, 't_off', None)})
+
+        if compiled_data is not None:
+            compiled = file.create_group('compiled')
+            # the traces are stored (traces x samples): every trace is contiguous, as the columns of the Fortran ordered array
+            _write_rows(compiled, 'traces', compiled_data.traces.T, compression, compression_opts)
+            arrays, metadata = compiled_data.to_arrays()
+            for name in ('wavenumbers', 'offsets', 'file_index', 'measurement_index'):
+                compiled.create_dataset(name, data=arrays[name])
+            compiled.create_dataset('labels', data=np.asarray(metadata['labels'], dtype=object), dtype=h5py.string_dtype())
+
+        if fullrange is not None and fullrange.sums2 is not None:
+            baseline = file.create_group('baseline')
+            baseline.create_dataset('mean_values', data=np.asarray(fullrange.mean_values))
+            _write_rows(baseline, 'sums', fullrange.sums.T, compression, compression_opts)
+            _write_rows(baseline, 'sums2', fullrange.sums2.T, compression, compression_opts)
+            _set_attributes(baseline, {'baseline_reference': fullrange.baseline_reference, 'interval': fullrange.interval,
+                                       'window': fullrange.window, 'smooth': fullrange.smooth})
+
+        if spectrum is not None and len(spectrum.depletion_spectra):
+            depletion = file.create_group('depletion')
+            for column in spectrum.depletion_spectra.columns:
+                depletion.create_dataset(column, data=spectrum.depletion_spectra[column].to_numpy())
+            if spectrum.peak_masses is not None:
+                depletion.create_dataset('peak_masses', data=np.asarray(spectrum.peak_masses))
+            _set_attributes(depletion, {'isotopes': np.atleast_1d(np.asarray(spectrum.mass_complex, dtype=np.float64)), 'scan_width': spectrum.scan_width})
+            # the datasets of a group are listed alphabetically, keep the order of the columns
+            depletion.attrs['columns'] = [str(column) for column in spectrum.depletion_spectra.columns]
+    return file_name
+
+
+class ExportedData_FELIX_HDF5:
+    '''
+    Lazy reader of a file written by `export_FELIX_HDF5`.
+    The file stays open until `.close()` (or the end of a `with` block), only the requested wavenumbers are read.
+
+        with ExportedData_FELIX_HDF5("export.h5") as exported:
+            compiled_data = exported.compiled(544, 546)    # CompiledData_FELIX_HDF5 with the wavenumbers 544 <= w <= 546
+            wavenumbers, sums2 = exported.sums2(544, 546)  # (samples x wavenumbers), as `baseline_fullrange.sums2`
+            spectrum = exported.depletion_spectra()        # the full REMPI spectrum
+            exported.metadata['baseline']['interval']      # the settings, per part of the file
+    '''
+
+    def __init__(self, file_name):
+        self.file = h5py.File(file_name, 'r')
+        self.metadata = {} # part of the file -> its attributes, e.g. self.metadata['depletion']['scan_width']
+        for group in ('calibration', 'baseline', 'depletion'):
+            if group in self.file:
+                self.metadata[group] = {key: value.tolist() if isinstance(value, np.ndarray) else value.item() if isinstance(value, np.generic) else value
+                                        for key, value in self.file[group].attrs.items() if key != 'columns'}
+
+        if 'compiled' in self.file:
+            compiled = self.file['compiled']
+            self.wavenumbers = compiled['wavenumbers'][()]
+            self.offsets = compiled['offsets'][()]
+        elif 'depletion' in self.file:
+            self.wavenumbers = self.file['depletion/wavenumber'][()]
+            self.offsets = None
+        else:
+            self.wavenumbers = np.empty(0)
+            self.offsets = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        self.file.close()
+
+    def group(self, name):
+        '''
+        Returns a part of the file ('calibration', 'compiled', 'baseline' or 'depletion'), a ValueError if it was not exported.
+        '''
+        if name not in self.file:
+            raise ValueError(f"{self.file.filename} has no '{name}' part, it was exported without it")
+        return self.file[name]
+
+    def wavenumber_range(self, wavenumber_min = None, wavenumber_max = None, wavenumbers = None):
+        '''
+        Returns the slice of `wavenumbers` (`self.wavenumbers` by default) with wavenumber_min <= wavenumber <= wavenumber_max.
+        '''
+        wavenumbers = self.wavenumbers if wavenumbers is None else wavenumbers
+        start = 0 if wavenumber_min is None else int(np.searchsorted(wavenumbers, wavenumber_min, side='left'))
+        stop = len(wavenumbers) if wavenumber_max is None else int(np.searchsorted(wavenumbers, wavenumber_max, side='right'))
+        return slice(start, max(start, stop))
+
+    def mass_axis(self):
+        '''
+        Returns the calibrated x-axis as a `MassAxis`.
+        '''
+        axis = MassAxis.from_mass(self.group('calibration')['mass'][()])
+        axis.alpha = self.metadata['calibration'].get('alpha')
+        axis.t_off = self.metadata['calibration'].get('t_off')
+        return axis
+
+    def _read_rows(self, name, rows):
+        # reads rows of a (rows x samples) dataset into a Fortran ordered (samples x rows) array
+        dataset = self.file[name]
+        out = np.empty((dataset.shape[1], rows.stop - rows.start), dtype=dataset.dtype, order='F')
+        if out.size:
+            dataset.read_direct(out.T, source_sel=np.s_[rows.start:rows.stop])
+        return out
+
+    def compiled(self, wavenumber_min = None, wavenumber_max = None):
+        '''
+        Returns the traces of the wavenumbers in the range as a `CompiledData_FELIX_HDF5`.
+        '''
+        compiled = self.group('compiled')
+        k = self.wavenumber_range(wavenumber_min, wavenumber_max)
+        columns = slice(int(self.offsets[k.start]), int(self.offsets[k.stop]))
+        traces = self._read_rows('compiled/traces', columns)
+        labels = [label.decode() if isinstance(label, bytes) else label for label in compiled['labels'][columns]]
+        file_index = compiled['file_index'][columns] if len(compiled['file_index']) else None
+        measurement_index = compiled['measurement_index'][columns] if len(compiled['measurement_index']) else None
+        return CompiledData_FELIX_HDF5(traces, list(self.wavenumbers[k]), self.offsets[k.start:k.stop+1] - columns.start, labels, file_index, measurement_index)
+
+    def sums(self, wavenumber_min = None, wavenumber_max = None):
+        '''
+        Returns the wavenumbers in the range and their summed, baseline corrected signal (samples x wavenumbers).
+        '''
+        self.group('baseline')
+        k = self.wavenumber_range(wavenumber_min, wavenumber_max)
+        return self.wavenumbers[k], self._read_rows('baseline/sums', k)
+
+    def sums2(self, wavenumber_min = None, wavenumber_max = None):
+        '''
+        Same as `.sums()`, after the second baseline correction.
+        '''
+        self.group('baseline')
+        k = self.wavenumber_range(wavenumber_min, wavenumber_max)
+        return self.wavenumbers[k], self._read_rows('baseline/sums2', k)
+
+    def mean_values(self, wavenumber_min = None, wavenumber_max = None):
+        '''
+        Returns the baseline of every trace of the wavenumbers in the range, in the order of the columns of `.compiled()`.
+        '''
+        mean_values = self.group('baseline')['mean_values']
+        self.group('compiled')
+        k = self.wavenumber_range(wavenumber_min, wavenumber_max)
+        return mean_values[int(self.offsets[k.start]):int(self.offsets[k.stop])]
+
+    def depletion_spectra(self, wavenumber_min = None, wavenumber_max = None):
+        '''
+        Returns the REMPI spectrum in the range as a DataFrame, the same table as `depletion.make_depletion_spectra_batch`.
+        '''
+        depletion = self.group('depletion')
+        k = self.wavenumber_range(wavenumber_min, wavenumber_max, depletion['wavenumber'][()])
+        return pd.DataFrame({name: depletion[name][k] for name in depletion.attrs['columns']})
+
+    def peak_masses(self, wavenumber_min = None, wavenumber_max = None):
+        '''
+        Returns the actual peak mass of every isotope (wavenumbers x isotopes) in the range, as `depletion.peak_masses`.
+        '''
+        depletion = self.group('depletion')
+        if 'peak_masses' not in depletion:
+            raise ValueError(f"{self.file.filename} has no peak masses, the spectrum was exported without them")
+        k = self.wavenumber_range(wavenumber_min, wavenumber_max, depletion['wavenumber'][()])
+        return depletion['peak_masses'][k]
+
+    def __repr__(self):
+        return f"ExportedData_FELIX_HDF5({self.file.filename}, {len(self.wavenumbers)} wavenumbers, groups {list(self.file)})"
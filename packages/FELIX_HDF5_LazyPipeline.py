@@ -0,0 +1,177 @@
+'''
+This block of code defines a "LazyPipeline_FELIX_HDF5" object.
+It replaces the "reset" cells of the notebook by stages (compiled, mass_axis, baseline, spectrum) with declared inputs.
+Nothing is computed until a result is asked for, and `.set(scan_width=0.2)` only throws away the stages downstream of the change.
+Baseline and spectrum are computed per wavenumber, only for the wavenumbers that are asked for.
+'''
+
+import numpy as np
+import pandas as pd
+
+from .MassCalibration import *
+from .FELIX_HDF5_ProcessData import *
+from .BaselineCorrection import *
+from .DepletionCalculator import *
+from .Instrumentation import *
+
+__all__ = ['LazyPipeline_FELIX_HDF5']
+
+# stage -> the parameters and stages it depends on, in the order the stages are computed
+STAGES = {
+    'compiled': ('files', 'channel', 'n_samples', 'precision', 'tolerance'),
+    'mass_axis': ('compiled', 'alpha', 't_off'),
+    'baseline': ('compiled', 'mass_axis', 'baseline_reference', 'interval', 'window', 'smooth'),
+    'spectrum': ('baseline', 'mass_axis', 'list_mass_isotope', 'scan_width'),
+}
+
+DEFAULT_PARAMETERS = {
+    'channel': 0, 'n_samples': None, 'precision': None, 'tolerance': 0.0,
+    'alpha': None, 't_off': None,
+    'baseline_reference': None, 'interval': None, 'window': None, 'smooth': None,
+    'list_mass_isotope': None, 'scan_width': None,
+}
+
+
+def _unchanged(old, new):
+    # parameters can be numbers, strings, lists or arrays
+    try:
+        return bool(np.array_equal(np.asarray(old, dtype=object), np.asarray(new, dtype=object)))
+    except ValueError:
+        return old is new
+
+
+class LazyPipeline_FELIX_HDF5:
+
+    def __init__(self, list_of_files, directory = '', cache = None, workers = None, **parameters):
+        self.directory = directory
+        self.cache = cache # optional `ProcessingCache` for the compiled data and the baseline
+        self.workers = workers # worker processes to read the files with
+        self.parameters = {'files': list(list_of_files), **DEFAULT_PARAMETERS}
+        self._check(parameters)
+        self.parameters.update(parameters)
+
+        self.raw_data = None # `ProcessData_FELIX_HDF5` of the last read, with the wavenumber groups
+        self._compiled_data = None
+        self._mass_axis = None
+        self._sums2 = {} # wavenumber -> summed signal after the second baseline correction
+        self._spectrum = {} # wavenumber -> (integrated signal, actual peak mass of every isotope)
+        self.history = [] # (stage, number of wavenumbers) of every computation, in order
+
+    def _check(self, parameters):
+        unknown = set(parameters) - set(self.parameters)
+        if unknown:
+            raise TypeError(f"Unknown parameters {sorted(unknown)}, the parameters are {list(self.parameters)}")
+
+    def set(self, **parameters):
+        '''
+        Changes parameters and throws away the results of every stage downstream of a changed one.
+        Setting a parameter to its current value keeps everything. Returns the stages that were invalidated.
+        '''
+        self._check(parameters)
+        changed = {name for name, value in parameters.items() if not _unchanged(self.parameters[name], value)}
+        self.parameters.update(parameters)
+        return self.invalidate(*changed)
+
+    def invalidate(self, *names):
+        '''
+        Throws away the stages that depend on the given parameters or stages (and the stages themselves), e.g. after a file changed on disk.
+        '''
+        invalid = set(names)
+        for stage, inputs in STAGES.items():
+            if stage in invalid or invalid.intersection(inputs):
+                invalid.add(stage)
+        stages = [stage for stage in STAGES if stage in invalid]
+        if 'compiled' in invalid:
+            self._compiled_data = None
+            self.raw_data = None
+        if 'mass_axis' in invalid:
+            self._mass_axis = None
+        if 'baseline' in invalid:
+            self._sums2 = {}
+        if 'spectrum' in invalid:
+            self._spectrum = {}
+        return stages
+
+    @property
+    def compiled_data(self):
+        '''
+        The compiled data (`CompiledData_FELIX_HDF5`), read from the files the first time it is needed.
+        '''
+        if self._compiled_data is None:
+            parameters = self.parameters
+            self.raw_data = ProcessData_FELIX_HDF5(parameters['files'], directory = self.directory, channel = parameters['channel'], n_samples = parameters['n_samples'],
+                                                   cache = self.cache, precision = parameters['precision'], tolerance = parameters['tolerance'])
+            self._compiled_data = self.raw_data.cached_compile_FELIX_data(self.workers)
+            self.history.append(('compiled', len(self._compiled_data)))
+        return self._compiled_data
+
+    @property
+    def mass_axis(self):
+        '''
+        The calibrated x-axis (`MassAxis`) with one point per sample of the compiled data.
+        '''
+        if self._mass_axis is None:
+            self._mass_axis = MassAxis(self.parameters['alpha'], self.parameters['t_off'], self.compiled_data.traces.shape[0])
+            self.history.append(('mass_axis', None))
+        return self._mass_axis
+
+    def _wavenumbers(self, wavenumbers):
+        return list(self.compiled_data.wavenumbers) if wavenumbers is None else list(np.atleast_1d(wavenumbers))
+
+    @instrumented('LazyPipeline.baseline')
+    def sums2(self, wavenumbers = None):
+        '''
+        Returns the summed signal after the second baseline correction (samples x wavenumbers), as `baseline_fullrange.sums2`.
+        Only the wavenumbers that are not known yet are baseline corrected. All wavenumbers by default.
+        '''
+        wavenumbers = self._wavenumbers(wavenumbers)
+        missing = list(dict.fromkeys(wavenumber for wavenumber in wavenumbers if wavenumber not in self._sums2))
+        if missing:
+            compiled_data = self.compiled_data
+            # every column is corrected on its own and every wavenumber is summed on its own, so a subset gives the same numbers
+            subset = compiled_data if len(missing) == len(compiled_data) else compiled_data.select(missing)
+            parameters = self.parameters
+            fullrange = baseline_fullrange(baseline_reference = parameters['baseline_reference'], interval = parameters['interval'], target_mass = self.mass_axis, \
+                                           compiled_data = subset, window = parameters['window'], smooth = parameters['smooth'])
+            fullrange.run(self.cache if subset is compiled_data else None)
+            for k, wavenumber in enumerate(subset.wavenumbers):
+                self._sums2[wavenumber] = fullrange.sums2[:, k]
+            self.history.append(('baseline', len(missing)))
+
+        sums2 = np.empty((len(self.mass_axis), len(wavenumbers)), dtype=np.float64, order='F')
+        for k, wavenumber in enumerate(wavenumbers):
+            sums2[:, k] = self._sums2[wavenumber]
+        return sums2
+
+    @instrumented('LazyPipeline.spectrum')
+    def spectrum(self, wavenumbers = None):
+        '''
+        Returns the REMPI spectrum as a DataFrame (`wavenumber`, `sum_withoutIR`), as `depletion.make_depletion_spectra_batch`.
+        Only the wavenumbers that are not known yet are integrated (and baseline corrected, if needed). All wavenumbers by default.
+        '''
+        wavenumbers = self._wavenumbers(wavenumbers)
+        missing = list(dict.fromkeys(wavenumber for wavenumber in wavenumbers if wavenumber not in self._spectrum))
+        if missing:
+            spectrum = depletion(mass_complex = self.parameters['list_mass_isotope'], scan_width = self.parameters['scan_width'], target_mass = self.mass_axis)
+            depletion_spectra = spectrum.make_depletion_spectra_batch(missing, self.sums2(missing).T)
+            for k, wavenumber in enumerate(missing):
+                self._spectrum[wavenumber] = (depletion_spectra["sum_withoutIR"].iat[k], spectrum.peak_masses[k])
+            self.history.append(('spectrum', len(missing)))
+
+        return pd.DataFrame({
+            "wavenumber": np.asarray(wavenumbers, dtype=np.float64),
+            "sum_withoutIR": np.asarray([self._spectrum[wavenumber][0] for wavenumber in wavenumbers], dtype=np.float64),
+        })
+
+    def peak_masses(self, wavenumbers = None):
+        '''
+        Returns the actual peak mass of every isotope (wavenumbers x isotopes), computing the spectrum where needed.
+        '''
+        wavenumbers = self._wavenumbers(wavenumbers)
+        self.spectrum(wavenumbers)
+        return np.asarray([self._spectrum[wavenumber][1] for wavenumber in wavenumbers])
+
+    def __repr__(self):
+        known = {'compiled': self._compiled_data is not None, 'mass_axis': self._mass_axis is not None,
+                 'baseline': f"{len(self._sums2)} wavenumbers", 'spectrum': f"{len(self._spectrum)} wavenumbers"}
+        return f"LazyPipeline_FELIX_HDF5({known})"
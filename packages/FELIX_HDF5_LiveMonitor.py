@@ -0,0 +1,226 @@
+'''
+This block of code defines a "LiveData_FELIX_HDF5" object for use during a FELIX shift.
+It watches the data directory and only processes the HDF5 files that are new since the last look:
+1. every new file is baseline corrected and added to a running sum per wavenumber
+2. only the wavenumbers that got new data are corrected again and integrated
+Files that are still being written are picked up at a later poll.
+'''
+
+import glob
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from .FELIX_HDF5_ReadData import *
+from .FELIX_HDF5_CompiledData import *
+from .FELIX_HDF5_ProcessData import *
+from .BaselineCorrection import *
+from .DepletionCalculator import *
+from .MassCalibration import *
+from .ReadAhead import *
+from .WavenumberGroups import *
+
+__all__ = ['LiveData_FELIX_HDF5']
+
+
+def _read_new_file(job):
+    # worker of the read-ahead, a file that cannot be read yet is reported instead of stopping the other reads
+    try:
+        return extract_file(job)
+    except (OSError, KeyError, ValueError) as error:
+        return error
+
+class LiveData_FELIX_HDF5:
+
+    def __init__(self, directory, target_mass = None, baseline_reference = None, interval = None, list_mass_isotope = None, scan_width = None, pattern = '*.h5', channel = 0, n_samples = None, wait_for_complete = True, precision = None, prefetch = None, tolerance = 0.0, max_retries = 5):
+        self.directory = directory
+        self.pattern = pattern
+        self.mass = MassAxis.from_mass(target_mass) if target_mass is not None else None
+        self.baseline_reference = baseline_reference
+        self.interval = interval
+        self.list_mass_isotope = list_mass_isotope
+        self.scan_width = scan_width
+        self.channel = channel
+        self.n_samples = n_samples
+        self.precision = np.dtype(precision) if precision is not None else None # dtype of the traces, the running sums are always float64
+        # only read a file once its size did not change between two polls
+        self.wait_for_complete = wait_for_complete
+        self.prefetch = prefetch # number of new files read ahead in the background, None == read when needed
+        self.tolerance = tolerance # readings closer than this are the same wavenumber, see `WavenumberGroups`
+        self.max_retries = max_retries # failed polls of a file before it is left out
+
+        self.files = [] # files that have been processed, in order
+        self.seen = set() # the same files, to look them up at every poll
+        self.file_sizes = {} # size of files that were seen but not processed yet
+        self.retries = {} # file -> number of polls in a row that failed to process it
+        self.failed = {} # file -> (size, error) of files that are left out until their size changes
+        self.known = np.empty(0) # the wavenumbers of `self.sums`, sorted
+        self.sums = {} # wavenumber -> running sum of the baseline corrected traces
+        self.counts = {} # wavenumber -> number of traces in the running sum
+        self.sums2 = {} # wavenumber -> running sum after the second baseline correction
+        self.spectrum = {} # wavenumber -> integrated signal
+        self.peak_masses = {} # wavenumber -> actual peak mass of every isotope
+        self.depletion_spectra = pd.DataFrame()
+
+    def new_files(self):
+        '''
+        Returns the files in the directory that are ready to be processed.
+        '''
+        ready = []
+        for file_name in sorted(glob.glob(os.path.join(self.directory, self.pattern))):
+            if file_name in self.seen:
+                continue
+            size = os.path.getsize(file_name)
+            if file_name in self.failed:
+                if self.failed[file_name][0] == size:
+                    continue
+                # the file changed, try again
+                del self.failed[file_name]
+                self.retries.pop(file_name, None)
+            if self.wait_for_complete and self.file_sizes.get(file_name) != size:
+                # first time seen or still growing, look again next time
+                self.file_sizes[file_name] = size
+                continue
+            ready.append(file_name)
+        return ready
+
+    def ingest_file(self, file_name, data = None):
+        '''
+        Reads one file, baseline corrects its traces and adds them to the running sums.
+        `data` == (group names, wavenumbers, signal) of the file if it was already read, e.g. by the read-ahead.
+        Returns the wavenumbers that got new data. When a ValueError is raised, nothing has been changed.
+        '''
+        current_file = ReadData_FELIX_HDF5(file_name)
+        if data is None:
+            current_file.extract_data(channel=self.channel, n_samples=self.n_samples, verbose=False, dtype=self.precision)
+        else:
+            current_file.group_names, wavenumbers, current_file.signal = data
+            current_file.wavenumbers.extend(wavenumbers)
+            if self.n_samples is not None:
+                # files read ahead before the first one set the number of samples
+                current_file.signal = current_file.signal[:, :self.n_samples]
+        # the first file sets the number of samples for all others
+        n_samples = self.n_samples if self.n_samples is not None else current_file.signal.shape[1]
+        if current_file.signal.shape[1] != n_samples:
+            raise ValueError(f"Traces of {file_name} have {current_file.signal.shape[1]} samples, expected {n_samples}")
+
+        file_labels = [file_label(file_name)]
+        groups = WavenumberGroups.from_readers([current_file], self.tolerance, file_labels=file_labels)
+        compiled_data = CompiledData_FELIX_HDF5.from_readers([current_file], file_labels, groups=groups)
+        fullrange = baseline_fullrange(baseline_reference = self.baseline_reference, interval = self.interval, target_mass = self.mass, compiled_data = compiled_data)
+        fullrange.run()
+
+        # the update of the file is made first and only then added, a file that fails is not added halfway
+        update = {}
+        for k, wavenumber in enumerate(compiled_data):
+            wavenumber = self.known_wavenumber(wavenumber)
+            count = compiled_data.offsets[k+1] - compiled_data.offsets[k]
+            if wavenumber in update:
+                update[wavenumber] = (update[wavenumber][0] + fullrange.sums[:, k], update[wavenumber][1] + count)
+            else:
+                update[wavenumber] = (fullrange.sums[:, k].astype(np.float64), count)
+
+        for wavenumber, (sums, count) in update.items():
+            if wavenumber in self.sums:
+                self.sums[wavenumber] += sums
+                self.counts[wavenumber] += count
+            else:
+                self.sums[wavenumber] = sums
+                self.counts[wavenumber] = count
+        new = np.asarray([wavenumber for wavenumber in update if wavenumber not in self.known], dtype=np.float64)
+        self.known = np.sort(np.concatenate([self.known, new]))
+        self.n_samples = n_samples
+        self.files.append(file_name)
+        self.seen.add(file_name)
+        self.file_sizes.pop(file_name, None)
+        self.retries.pop(file_name, None)
+        return list(update)
+
+    def known_wavenumber(self, wavenumber):
+        '''
+        The wavenumber seen before that `wavenumber` belongs to: the nearest one within `self.tolerance`, or `wavenumber` itself.
+        '''
+        if wavenumber in self.sums or self.tolerance <= 0 or not len(self.known):
+            return wavenumber
+        # the known wavenumbers on both sides of it
+        position = np.searchsorted(self.known, wavenumber)
+        neighbours = self.known[max(position - 1, 0):position + 1]
+        nearest = neighbours[np.argmin(np.abs(neighbours - wavenumber))]
+        return nearest if abs(nearest - wavenumber) <= self.tolerance else wavenumber
+
+    def update_spectrum(self, wavenumbers):
+        '''
+        Redoes the second baseline correction and the integration for the given wavenumbers only.
+        '''
+        wavenumbers = [wavenumber for wavenumber in wavenumbers if wavenumber in self.sums]
+        if wavenumbers:
+            baseline_range_indices = mass_window(self.mass, self.baseline_reference, self.baseline_reference + self.interval)
+            sums2 = np.empty((len(wavenumbers), self.n_samples))
+            for row, wavenumber in enumerate(wavenumbers):
+                signal_withoutIR = self.sums[wavenumber]
+                sums2[row] = signal_withoutIR - abs(np.mean(signal_withoutIR[baseline_range_indices]))
+                self.sums2[wavenumber] = sums2[row]
+
+            signal_withoutIR, peak_masses, _ = integrate_isotope_windows(sums2, self.mass, self.list_mass_isotope, self.scan_width)
+            for row, wavenumber in enumerate(wavenumbers):
+                self.spectrum[wavenumber] = signal_withoutIR[row]
+                self.peak_masses[wavenumber] = peak_masses[row]
+
+        spectrum = sorted(self.spectrum.items())
+        self.depletion_spectra = pd.DataFrame({
+            "wavenumber": np.asarray([wavenumber for wavenumber, _ in spectrum], dtype=np.float64),
+            "sum_withoutIR": np.asarray([value for _, value in spectrum], dtype=np.float64),
+        })
+        return self.depletion_spectra
+
+    def poll(self):
+        '''
+        Processes all new files and updates the spectrum. Returns the list of new files.
+        '''
+        new_files = []
+        updated = set()
+        ready = self.new_files()
+        if self.prefetch and ready:
+            jobs = [(file_name, self.channel, self.n_samples, self.precision, None) for file_name in ready]
+            files = ((job[0], data) for job, data in ReadAhead(_read_new_file, jobs, self.prefetch))
+        else:
+            files = ((file_name, None) for file_name in ready)
+        for file_name, data in files:
+            try:
+                if isinstance(data, Exception):
+                    raise data
+                updated.update(self.ingest_file(file_name, data))
+            except (OSError, KeyError, ValueError) as error:
+                # the file cannot be opened yet or its traces are still short (still being written), try again next poll
+                self.file_sizes.pop(file_name, None)
+                self.retries[file_name] = self.retries.get(file_name, 0) + 1
+                if self.retries[file_name] >= self.max_retries:
+                    print(f"Leaving out {file_name} after {self.retries[file_name]} failed polls: {error!r}")
+                    self.failed[file_name] = (os.path.getsize(file_name) if os.path.exists(file_name) else None, error)
+                continue
+            new_files.append(file_name)
+        if new_files:
+            self.update_spectrum(updated)
+        return new_files
+
+    def watch(self, poll_interval = 30, callback = None, max_polls = None):
+        '''
+        Polls the directory every `poll_interval` seconds until interrupted (Ctrl+C / stop the cell) or until `max_polls` polls.
+        After every poll with new files, `callback(self, new_files)` is called, e.g. to redraw the plot of `self.depletion_spectra`.
+        '''
+        polls = 0
+        try:
+            while max_polls is None or polls < max_polls:
+                new_files = self.poll()
+                polls += 1
+                if new_files:
+                    print(f"{len(new_files)} new file(s), {len(self.files)} in total: {[os.path.basename(file) for file in new_files]}")
+                    if callback is not None:
+                        callback(self, new_files)
+                if max_polls is None or polls < max_polls:
+                    time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            print("Stopped watching")
+        return self.depletion_spectra
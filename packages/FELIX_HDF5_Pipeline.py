@@ -0,0 +1,220 @@
+'''
+This section contains the full REMPI pipeline without the notebook, for batch processing on an analysis node:
+read -> compile -> baseline (`baseline_fullrange`) -> depletion spectrum -> write the outputs.
+All settings come from a config file (JSON, or TOML with python >= 3.11), see the README for the keys.
+From the command line: python -m packages config.json [more_configs.json ...] --workers 8
+'''
+
+import argparse
+import glob
+import json
+import os
+import traceback
+
+import numpy as np
+import pandas as pd
+
+from .MassCalibration import *
+from .ProcessingCache import *
+from .FELIX_HDF5_ProcessData import *
+from .FELIX_HDF5_ReadData import *
+from .TraceSegments import *
+from .BaselineCorrection import *
+from .DepletionCalculator import *
+from .FELIX_HDF5_Export import *
+
+__all__ = ['load_pipeline_config', 'run_REMPI_pipeline']
+
+# settings that can be left out of the config file
+DEFAULT_CONFIG = {
+    "file_index": None, # which of the sorted files to use, all by default
+    "output_directory": None, # default: `temp/export` next to the HDF5 files, as in the notebook
+    "channel": 0,
+    "n_samples": None,
+    "precision": None,
+    "tolerance": 0.0, # readings closer than this are merged into one wavenumber
+    "workers": None,
+    "prefetch": None, # number of files read ahead by the workers, bounds the memory of the parallel read (see `ReadAhead`)
+    "memory_budget": None, # bytes of signal that may be read ahead, None == only limited by `prefetch`
+    "cache": False, # use a `ProcessingCache` in the `temp/cache` folder next to the HDF5 files
+    "sparse": False, # keep only the analysed mass windows of the traces (true or a dictionary, see `TraceSegments`)
+    "scratch": None, # folder with a memory-mapped copy of the traces, written on the first run and opened on the next ones (see `FELIX_HDF5_Scratch.py`)
+    "export_hdf5": False, # also write the compiled traces, the sums and the spectrum to one compressed HDF5 file
+    "bootstrap": 0, # number of bootstrap resamples for the uncertainty of the spectrum, 0 == no uncertainty
+    "confidence": 0.95,
+    "seed": None,
+    "name": "REMPI",
+}
+
+
+def load_pipeline_config(file_name):
+    '''
+    Reads a pipeline config file (.json or .toml) and returns it as a dictionary with the defaults filled in.
+    '''
+    if file_name.endswith(".toml"):
+        try:
+            import tomllib
+        except ImportError:
+            raise ValueError(f"{file_name}: TOML config files need python >= 3.11, use a JSON config file instead") from None
+        with open(file_name, "rb") as file:
+            config = tomllib.load(file)
+    else:
+        with open(file_name) as file:
+            config = json.load(file)
+
+    missing = [key for key in ("files", "calibration", "baseline", "isotopes", "scan_width") if key not in config]
+    if missing:
+        raise ValueError(f"{file_name} is missing the settings {missing}")
+
+    # paths are relative to the config file
+    folder = os.path.dirname(os.path.abspath(file_name))
+    if isinstance(config["files"], str):
+        config["files"] = os.path.join(folder, config["files"])
+    else:
+        config["files"] = [os.path.join(folder, file) for file in config["files"]]
+    for key in ("output_directory", "scratch"):
+        if config.get(key) is not None:
+            config[key] = os.path.join(folder, config[key])
+    return {**DEFAULT_CONFIG, **config}
+
+
+def run_REMPI_pipeline(config, workers = None, output_directory = None):
+    '''
+    Runs read -> compile -> baseline -> depletion for one dataset and writes the outputs.
+    `config` is a dictionary (see `load_pipeline_config`) or the name of a config file.
+    `workers` and `output_directory` override the config.
+
+    Writes to the output directory:
+    1. `fullrange_depletion_data_{name}_{first}-{last}.csv` == the REMPI spectrum, as in the export cell of the notebook
+    2. `wavenumbers_per_file_{name}.csv` == measured wavenumbers of every file (the `check_wavenumbers` table)
+    3. `measurements_per_wavenumber_{name}.csv` == number of measurements of every wavenumber per file, 0 == skipped (see `WavenumberGroups.table`)
+    4. `config_{name}.json` == the settings used
+    5. `processed_{name}.h5` == compiled traces, sums and spectrum with their metadata (only with `export_hdf5`, see `export_FELIX_HDF5`)
+    6. `fullrange_depletion_uncertainty_{name}.csv` == the spectrum with bootstrap confidence bands (only with `bootstrap`, see `integration_index.bootstrap`)
+
+    Returns the REMPI spectrum as a DataFrame.
+    '''
+    if isinstance(config, (str, os.PathLike)):
+        config = load_pipeline_config(os.fspath(config))
+    else:
+        config = {**DEFAULT_CONFIG, **config}
+    workers = workers if workers is not None else config["workers"]
+    if config["bootstrap"] and config["baseline"].get("window") is not None:
+        raise ValueError("The bootstrap only supports the baseline of a single window, leave out `window` or `bootstrap`")
+    sparse = {} if config["sparse"] is True else (config["sparse"] or None)
+    if sparse is not None and config["baseline"].get("window") is not None:
+        raise ValueError("The rolling baseline needs the full traces, leave out `window` or `sparse`")
+    unknown = set(sparse or {}) - {"threshold", "padding", "margin"}
+    if unknown:
+        raise ValueError(f"Unknown sparse settings {sorted(unknown)}, use threshold, padding and margin")
+
+    files = sorted(glob.glob(config["files"])) if isinstance(config["files"], str) else list(config["files"])
+    if config["file_index"] is not None:
+        files = [files[index] for index in config["file_index"]]
+    if not files:
+        raise FileNotFoundError(f"No HDF5 files found for {config['files']}")
+
+    directory = os.path.dirname(os.path.abspath(files[0]))
+    output_directory = output_directory or config["output_directory"] or os.path.join(directory, "temp", "export")
+    os.makedirs(output_directory, exist_ok=True)
+
+    '''
+    Part 1: read and compile
+    '''
+    cache = ProcessingCache(directory) if config["cache"] else None
+    calibration = config["calibration"]
+    segments = None
+    if sparse is not None and "threshold" not in sparse:
+        # the mass windows only depend on the calibration: only they are read from the files
+        n_samples = config["n_samples"] or ReadData_FELIX_HDF5(files[0]).extract_shape(config["channel"])[0][1]
+        segments = TraceSegments.for_analysis(MassAxis(calibration["alpha"], calibration["t_off"], n_samples), config["baseline"]["reference"], \
+                                              config["baseline"]["interval"], config["isotopes"], config["scan_width"], sparse.get("margin", 0.0))
+    raw_data = ProcessData_FELIX_HDF5(files, directory = directory, channel = config["channel"], n_samples = config["n_samples"], \
+                                      cache = cache, precision = config["precision"], tolerance = config["tolerance"], segments = segments)
+    if config["scratch"]:
+        try:
+            compiled_data = raw_data.open_scratch(config["scratch"])
+        except (OSError, ValueError):
+            # not written yet, or for other files or settings
+            raw_data.write_scratch(config["scratch"])
+            compiled_data = raw_data.open_scratch(config["scratch"])
+    else:
+        compiled_data = raw_data.cached_compile_FELIX_data(workers, config["prefetch"], config["memory_budget"], verbose = False)
+
+    if raw_data.data:
+        # nothing is read when the compiled data comes from the cache
+        wavenumbers_per_file = pd.DataFrame({file_label(file): pd.Series(reader.wavenumbers, dtype=np.float64) for file, reader in zip(files, raw_data.data)})
+        wavenumbers_per_file.to_csv(os.path.join(output_directory, f"wavenumbers_per_file_{config['name']}.csv"))
+        raw_data.groups.table().to_csv(os.path.join(output_directory, f"measurements_per_wavenumber_{config['name']}.csv"))
+    if len(compiled_data) == 0:
+        # nothing to correct or integrate, and no wavenumber range for the name of the spectrum file
+        raise ValueError(f"No wavenumbers in {config['name']}: the files have no measurements besides the first one")
+
+    '''
+    Part 2: calibration and baseline correction
+    '''
+    if segments is not None:
+        mass_axis = segments.compact_mass(MassAxis(calibration["alpha"], calibration["t_off"], segments.n_samples))
+    else:
+        mass_axis = MassAxis(calibration["alpha"], calibration["t_off"], compiled_data.traces.shape[0])
+    if sparse is not None and segments is None:
+        # thresholded: the full traces are needed once to find the peaks
+        segments = TraceSegments.for_analysis(mass_axis, config["baseline"]["reference"], config["baseline"]["interval"], \
+                                              config["isotopes"], config["scan_width"], sparse.get("margin", 0.0)) \
+                 | TraceSegments.from_threshold(compiled_data.traces, mass_axis, config["baseline"]["reference"], config["baseline"]["interval"], \
+                                                sparse["threshold"], sparse.get("padding", 16))
+        compiled_data = segments.compact(compiled_data)
+        mass_axis = segments.compact_mass(mass_axis)
+    fullrange = baseline_fullrange(baseline_reference = config["baseline"]["reference"], interval = config["baseline"]["interval"], \
+                                   target_mass = mass_axis, compiled_data = compiled_data, \
+                                   window = config["baseline"].get("window"), smooth = config["baseline"].get("smooth"))
+    fullrange.run(cache)
+
+    '''
+    Part 3: depletion spectrum
+    '''
+    spectrum = depletion(mass_complex = config["isotopes"], scan_width = config["scan_width"], target_mass = mass_axis)
+    depletion_spectra = spectrum.make_depletion_spectra_batch(compiled_data.wavenumbers, fullrange.sums2.T)
+
+    if config["bootstrap"]:
+        index = integration_index(compiled_data, mass_axis)
+        uncertainty = index.bootstrap(config["isotopes"], config["scan_width"], config["baseline"]["reference"], config["baseline"]["interval"], \
+                                      n_resamples = config["bootstrap"], confidence = config["confidence"], seed = config["seed"])
+        # the spectrum itself, `integration_index` only agrees with it up to rounding
+        uncertainty["sum_withoutIR"] = depletion_spectra["sum_withoutIR"].to_numpy()
+        uncertainty.to_csv(os.path.join(output_directory, f"fullrange_depletion_uncertainty_{config['name']}.csv"), index=True)
+
+    if config["export_hdf5"]:
+        export_FELIX_HDF5(os.path.join(output_directory, f"processed_{config['name']}.h5"), compiled_data, fullrange, spectrum)
+
+    data = np.array(depletion_spectra)
+    depletion_spectra.to_csv(os.path.join(output_directory, f"fullrange_depletion_data_{config['name']}_{int(data[0,0])}-{int(data[-1,0])}.csv"), index=True)
+    with open(os.path.join(output_directory, f"config_{config['name']}.json"), "w") as file:
+        json.dump({**config, "files": files, "workers": workers, "output_directory": output_directory}, file, indent=4)
+    return depletion_spectra
+
+
+def main(arguments = None):
+    parser = argparse.ArgumentParser(prog = "python -m packages", description = "Runs the REMPI pipeline for one or more datasets, each described by a config file.")
+    parser.add_argument("configs", nargs = "+", help = "config files (.json or .toml), one per dataset")
+    parser.add_argument("--workers", type = int, default = None, help = "worker processes to read the HDF5 files with, overrides the config")
+    parser.add_argument("--output", default = None, help = "output directory, overrides the config (only with a single config file)")
+    arguments = parser.parse_args(arguments)
+    if arguments.output is not None and len(arguments.configs) > 1:
+        parser.error("--output can only be used with a single config file")
+
+    failed = []
+    for config_file in arguments.configs:
+        print(f"Processing {config_file}")
+        try:
+            depletion_spectra = run_REMPI_pipeline(config_file, workers = arguments.workers, output_directory = arguments.output)
+        except Exception as error:
+            # keep going with the other datasets, the exit code tells that one failed
+            print(f"Failed {config_file}: {error!r}")
+            if not isinstance(error, (OSError, ValueError, KeyError)):
+                # not a problem of the config or the files, show where it happened
+                traceback.print_exc()
+            failed.append(config_file)
+            continue
+        print(f"Done {config_file}: {len(depletion_spectra)} wavenumbers")
+    return 1 if failed else 0
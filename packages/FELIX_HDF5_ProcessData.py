@@ -1,42 +1,175 @@
 '''
 This block of code defines a "ProcessData_FELIX_HDF5" object.
 It contains functions to:
-1. extract wavenumber and signal data from the HDF5 files
-2. reorganize extracted data to a nested dictionary per wavenumber basis
+1. extract wavenumber and signal data from the HDF5 files, optionally with one worker process per file or with the next files read ahead
+2. reorganize extracted data per wavenumber basis into a `CompiledData_FELIX_HDF5` object
+   or convert the files once into a memory-mapped scratch folder and open that instead (see `FELIX_HDF5_Scratch.py`)
 3. checks for each function
 '''
 
+import os
+from multiprocessing import shared_memory
+
 import h5py
 import numpy as np
 import pandas as pd
 
 from .FELIX_HDF5_ReadData import *
-
-__all__ = ['ProcessData_FELIX_HDF5']
+from .FELIX_HDF5_CompiledData import *
+from .WavenumberGroups import *
+from .Instrumentation import *
+from .ReadAhead import *
+from .FELIX_HDF5_Scratch import *
+
+__all__ = ['ProcessData_FELIX_HDF5', 'extract_file']
+
+
+def _extract_into_shared_memory(file_name, shared_memory_name, shape, dtype, channel, n_samples, segments=None):
+    '''
+    Worker for the parallel ingest of `ProcessData_FELIX_HDF5.extract_FELIX_data`.
+    Opens one file and reads its signal straight into the shared memory block made by the parent process.
+    Only the (small) list of wavenumbers is sent back, the signal never gets pickled.
+    '''
+    block = shared_memory.SharedMemory(name=shared_memory_name)
+    try:
+        current_file = ReadData_FELIX_HDF5(file_name)
+        current_file.extract_data(channel=channel, n_samples=n_samples, verbose=False,
+                                  out=np.ndarray(shape, dtype=dtype, buffer=block.buf), dtype=dtype, segments=segments)
+        # release the view on the shared memory, otherwise the block cannot be closed
+        current_file.signal = None
+    finally:
+        block.close()
+    return current_file.group_names, current_file.wavenumbers
+
+
+def extract_file(job):
+    '''
+    Worker of the read-ahead of `ProcessData_FELIX_HDF5.iter_FELIX_data`, reads one file and sends its data back.
+    '''
+    file_name, channel, n_samples, dtype, segments = job
+    current_file = ReadData_FELIX_HDF5(file_name)
+    current_file.extract_data(channel=channel, n_samples=n_samples, verbose=False, dtype=dtype, segments=segments)
+    return current_file.group_names, current_file.wavenumbers, current_file.signal
 
 class ProcessData_FELIX_HDF5:
 
-    def __init__(self, list_of_files, directory=''):
+    def __init__(self, list_of_files, directory='', channel=0, n_samples=None, cache=None, precision=None, tolerance=0.0, segments=None):
         self.files = list_of_files
         self.data = []
         self.compiled_data = {}
         self.directory = directory
+        self.channel = channel # which column of the `Trace` dataset to read, 0 == signal without IR
+        self.n_samples = n_samples # number of samples to read per trace, None reads the full trace
+        self.cache = cache # optional `ProcessingCache` for `.cached_compile_FELIX_data()`
+        # dtype the traces are stored in, e.g. 'float32' to halve the memory. None keeps the dtype of the HDF5 files
+        self.precision = np.dtype(precision) if precision is not None else None
+        # readings closer than `tolerance` are merged into one wavenumber, see `WavenumberGroups`. 0 only merges identical readings
+        self.tolerance = tolerance
+        # `TraceSegments`: only the samples inside the segments are read, use `segments.compact_mass(...)` as the x-axis then
+        self.segments = segments
+        self.groups = None
         
 
-    def extract_FELIX_data(self):
+    @instrumented('extract_FELIX_data')
+    def extract_FELIX_data(self, workers=None, prefetch=None, memory_budget=None, verbose=True):
         '''
         This function takes all input files and iterates through them one by one.
         Each file is turned into a `ReadData_FELIX_HDF5` object so that wavenumbers and signal can be extracted.
         Afterwards, the object is appended to a list.
         The output is a list of `ReadData_FELIX_HDF5` objects where each element (file) of the list (total file names) has a `signal` and `wavenumbers` attribute.
+        Only the selected `channel` and the first `n_samples` of every trace are read, or only the samples inside `self.segments`.
+
+        With `workers` larger than 1, the files are opened and decoded in parallel, one worker process per file.
+        This needs `self.files` to be file paths (e.g. the output of `glob.glob`) instead of open `h5py.File` objects.
+        The workers write the signal into shared memory, so the large arrays are not pickled between processes.
+        The parent copies every block into its own array before the block is released, so each file is copied once more than when read sequentially.
+        The output is the same as for the sequential version, in the original file order.
+
+        With `prefetch`, the files are read by background workers, at most `prefetch` files ahead of the one being collected, see `.iter_FELIX_data()`.
+        Together with `workers` and `memory_budget` this is a parallel read that does not hold all files in memory twice.
+        With `verbose=False` the wavenumbers of every file are not printed, e.g. in a batch run.
         '''
-        for i, file in enumerate(self.files):
-            current_file = ReadData_FELIX_HDF5(file)
-            current_file.extract_wavenumbers()
-            current_file.extract_signal()
+        if workers is not None and workers > 1 and not prefetch:
+            return self.extract_FELIX_data_parallel(workers, verbose)
+
+        for current_file in self.iter_FELIX_data(prefetch, memory_budget, workers):
+            if verbose:
+                print(current_file.wavenumbers, len(current_file.wavenumbers))
             self.data.append(current_file)
         return self.data
+
+    def iter_FELIX_data(self, prefetch=None, memory_budget=None, workers=None):
+        '''
+        Yields one `ReadData_FELIX_HDF5` object (after `.extract_data()`) per file, in file order, without keeping them.
+        With `prefetch`, up to `prefetch` of the next files are read in the background (by `workers` processes, 1 by default)
+        while the current one is being used, e.g. baseline corrected. `memory_budget` (bytes) limits the signal that is read ahead.
+        This needs file paths instead of open `h5py.File` objects, as the parallel version.
+        '''
+        if not prefetch:
+            for file in self.files:
+                current_file = ReadData_FELIX_HDF5(file)
+                current_file.extract_data(channel=self.channel, n_samples=self.n_samples, verbose=False, dtype=self.precision, segments=self.segments)
+                yield current_file
+            return
+
+        if not all(isinstance(file, (str, os.PathLike)) for file in self.files):
+            raise TypeError("Reading ahead needs file paths, not open h5py.File objects")
+        readers = {file: ReadData_FELIX_HDF5(file) for file in self.files}
+
+        def size(job):
+            shape, dtype = readers[job[0]].extract_shape(self.channel, self.n_samples, self.precision, self.segments)
+            return int(np.prod(shape)) * dtype.itemsize
+
+        jobs = [(file, self.channel, self.n_samples, self.precision, self.segments) for file in self.files]
+        for (file, *_), (group_names, wavenumbers, signal) in ReadAhead(extract_file, jobs, prefetch, workers or 1, memory_budget, size):
+            current_file = readers[file]
+            current_file.group_names = group_names
+            current_file.wavenumbers.extend(wavenumbers)
+            current_file.signal = signal
+            instrumentation.add_decoded(signal.nbytes)
+            instrumentation.add_array(signal)
+            yield current_file
     
+    def extract_FELIX_data_parallel(self, workers, verbose=True):
+        '''
+        Parallel version of `.extract_FELIX_data()`. See there for details.
+        '''
+        if not all(isinstance(file, (str, os.PathLike)) for file in self.files):
+            raise TypeError("Parallel extraction needs file paths, not open h5py.File objects")
+
+        # the parent only reads the metadata of each file to allocate the shared memory blocks
+        readers = [ReadData_FELIX_HDF5(file) for file in self.files]
+        shapes = [reader.extract_shape(self.channel, self.n_samples, self.precision, self.segments) for reader in readers]
+        blocks = []
+        try:
+            for shape, dtype in shapes:
+                blocks.append(shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1)))
+
+            with process_pool(workers) as executor:
+                futures = [executor.submit(_extract_into_shared_memory, reader.file, block.name, shape, dtype, self.channel, self.n_samples, self.segments)
+                           for reader, block, (shape, dtype) in zip(readers, blocks, shapes)]
+
+                # collect in file order, each block is released as soon as its data has been taken over
+                for reader, block, (shape, dtype), future in zip(readers, blocks, shapes, futures):
+                    reader.group_names, wavenumbers = future.result()
+                    reader.wavenumbers.extend(wavenumbers)
+                    reader.signal = np.ndarray(shape, dtype=dtype, buffer=block.buf).copy()
+                    instrumentation.add_decoded(reader.signal.nbytes)
+                    instrumentation.add_array(reader.signal)
+                    block.close()
+                    block.unlink()
+                    if verbose:
+                        print(reader.wavenumbers, len(reader.wavenumbers))
+                    self.data.append(reader)
+        finally:
+            for block in blocks:
+                try:
+                    block.close()
+                    block.unlink()
+                except FileNotFoundError:
+                    pass
+        return self.data
+
     def check_extract_FELIX_data(self):
         '''
         This functions checks the output of the `.extract_FELIX_data()` method.
@@ -53,7 +186,15 @@ class ProcessData_FELIX_HDF5:
         print("\n")
         pass
 
-    def check_wavenumbers(self):
+    def temp_file(self, file_name):
+        '''
+        Path of `file_name` in the `temp` folder of `self.directory`, the folder is made if it does not exist.
+        '''
+        folder = os.path.join(self.directory, "temp")
+        os.makedirs(folder, exist_ok=True)
+        return os.path.join(folder, file_name)
+
+    def check_wavenumbers(self, show=True):
         '''
         This section of code lays out all the wavenumbers of the different measurements in a table. Vertical (HTML) and horizontal (cell ouput).
         The purpose is to examine line-by-line the different wavenumbers measured per scan/file.
@@ -71,6 +212,7 @@ class ProcessData_FELIX_HDF5:
         I choose to retain the code here because it might be useful in debugging.
 
         It is necessary to run `.extract_FELIX_data` first.
+        The table is saved in `directory/temp/TableWavenumbersCheck.html`, with `show=False` it is not opened in a web browser (e.g. on a cluster node).
         '''
 
         column_label = []
@@ -82,7 +224,7 @@ class ProcessData_FELIX_HDF5:
             max_length = max(max_length, len(self.data[i].wavenumbers))
 
         for i in range(len(self.files)):
-            column_label.append(self.files[i].filename[-12:-3])
+            column_label.append(file_label(self.files[i]))
             # Pad the wavenumbers array with NaN values to make them all the same length
             padded_wavenumbers = np.pad(self.data[i].wavenumbers, (0, max_length - len(self.data[i].wavenumbers)), 'constant', constant_values=np.nan)
             # table_wavenumbers[column_label[i]] = self.data[i].wavenumbers
@@ -99,10 +241,12 @@ class ProcessData_FELIX_HDF5:
         # Apply alternating row colors
         styled_table = table_wavenumbers.style.set_properties(**{'background-color': 'aquamarine'}, subset=pd.IndexSlice[::2])
         # Save to HTML
-        styled_table.to_html(f"{self.directory}\\temp\\TableWavenumbersCheck.html")
+        file_name = self.temp_file("TableWavenumbersCheck.html")
+        styled_table.to_html(file_name)
         # Open in a web browser
-        import webbrowser
-        webbrowser.open(f"{self.directory}\\temp\\TableWavenumbersCheck.html")
+        if show:
+            import webbrowser
+            webbrowser.open(os.path.abspath(file_name))
 
         '''
         Present the tables horizontally.
@@ -113,9 +257,10 @@ class ProcessData_FELIX_HDF5:
             print(column_label[i], self.data[i].wavenumbers)
         pass
 
-    def get_wavenumbers(self):
+    def get_wavenumbers(self, show=True):
         '''
-        This function gets all unique wavenumbers and presents it in an html file
+        This function gets all unique wavenumbers and presents it in an html file, `directory/temp/UniqueWavenumbers.html`.
+        With `show=False` the file is not opened in a web browser.
         '''
         all_wavenumbers = []
         for file in self.data:
@@ -131,57 +276,86 @@ class ProcessData_FELIX_HDF5:
         # Apply alternating row colors
         styled_table = unique_wavenumbers_df.style.set_properties(**{'background-color': 'aquamarine'}, subset=pd.IndexSlice[::2])
         # Save to HTML
-        styled_table.to_html(f"{self.directory}\\temp\\UniqueWavenumbers.html")
+        file_name = self.temp_file("UniqueWavenumbers.html")
+        styled_table.to_html(file_name)
         # Open in a web browser
-        import webbrowser
-        webbrowser.open(f"{self.directory}\\temp\\UniqueWavenumbers.html")
+        if show:
+            import webbrowser
+            webbrowser.open(os.path.abspath(file_name))
 
         return unique_wavenumbers
 
+    def group_wavenumbers(self):
+        '''
+        Groups the measurements of all files per wavenumber, merging readings within `self.tolerance` (a `WavenumberGroups` object).
+        `.groups.table()`, `.groups.skipped()` and `.groups.doubled()` give the skipped and doubly measured wavenumbers as tables.
+        It is necessary to run `.extract_FELIX_data()` method first.
+        '''
+        self.groups = WavenumberGroups.from_readers(self.data, self.tolerance, file_labels=[file_label(file) for file in self.files])
+        return self.groups
+
+    @instrumented('compile_FELIX_data')
     def compile_FELIX_data(self):
         '''
         This functions groups together columns (signal data) on a per wavenumber basis.
         It is necessary to run `.extract_FELIX_data()` method first.
-        The expected output is a nested dictionary on a per wavenumber basis
+        The output is a `CompiledData_FELIX_HDF5` object: all traces are stored in one preallocated 2D array with an index per wavenumber.
+        It can be used like the nested dictionary on a per wavenumber basis, `compiled_data[wavenumber]` gives a DataFrame with one column per file.
         '''
-        
-        # loop through all files
-        for file_index, file in enumerate(self.files):
-
-            # loop through the wavenumbers
-            for wavenumber in range(1,len(self.data[file_index].wavenumbers)):
-                
-                # declare new variables just to reduce verbosity
-                current_file = self.data[file_index]
-                current_wavenumber = current_file.wavenumbers[wavenumber]
-
-                # define signal with and without IR irradiation
-                signal_withoutIR = current_file.signal[wavenumber][:,0]
-                # signal_withIR = current_file.signal[wavenumber][:,1]
-                
-                # define wavenumber and file based label for signal with and without IR irradiation
-                label_withoutIR = str(current_wavenumber)+"_"+self.files[file_index].filename[-12:-3]+"_withoutIR"
-                # label_withIR = str(current_wavenumber)+"_"+self.files[file_index].filename[-12:-3]+"_withIR"
-
-                # if current wavenumber is not in the dictionary, make new entry
-                if current_wavenumber not in self.compiled_data:
-                    self.compiled_data[current_wavenumber] = pd.DataFrame({
-                        label_withoutIR: signal_withoutIR,
-                        # label_withIR: signal_withIR
-                    })
-
-                else:
-                # if the wavenumber already exists in the dictionary
-                # we define a new dictionary, and then merge it later with the main dictionary
-                # concat, axis = 1 == append by column
-                # otherwise its by row
-                    new_data = pd.DataFrame({
-                        label_withoutIR: signal_withoutIR,
-                        # label_withIR: signal_withIR
-                    })
-                    self.compiled_data[current_wavenumber] = pd.concat([self.compiled_data[current_wavenumber], new_data], axis=1)
+        self.compiled_data = CompiledData_FELIX_HDF5.from_readers(self.data, [file_label(file) for file in self.files], groups=self.group_wavenumbers())
         return self.compiled_data
     
+    @instrumented('cached_compile_FELIX_data')
+    def cached_compile_FELIX_data(self, workers=None, prefetch=None, memory_budget=None, verbose=True):
+        '''
+        Does `.extract_FELIX_data()` and `.compile_FELIX_data()`, but first looks into `self.cache` (a `ProcessingCache`).
+        The result is keyed on the content and the labels of the files (the column labels come from the file names)
+        and the reading parameters (`channel`, `n_samples`, `precision`, `tolerance`, `segments`).
+        If it is already in the cache, no HDF5 file is read at all and `self.data` stays empty.
+        Otherwise the data is extracted and compiled as usual, and saved in the cache for the next time.
+        '''
+        if self.cache is None:
+            self.extract_FELIX_data(workers, prefetch, memory_budget, verbose)
+            return self.compile_FELIX_data()
+
+        parameters = [self.channel, self.n_samples, str(self.precision), self.tolerance, WavenumberGroups.version]
+        if self.segments is not None:
+            parameters.append(self.cache.array_hash(self.segments.rows))
+        key = self.cache.key('compiled', [self.cache.file_hash(file) for file in self.files], [file_label(file) for file in self.files], *parameters)
+        cached = self.cache.load(key)
+        if cached is not None:
+            self.compiled_data = CompiledData_FELIX_HDF5.from_arrays(*cached)
+        else:
+            self.extract_FELIX_data(workers, prefetch, memory_budget, verbose)
+            self.compile_FELIX_data()
+            self.cache.store(key, *self.compiled_data.to_arrays())
+        self.compiled_data.cache_key = key
+        return self.compiled_data
+
+    def write_scratch(self, folder=None):
+        '''
+        Converts `self.files` (paths) into a memory-mapped scratch folder, `temp/scratch` by default, with the settings of this object.
+        Only needed once per dataset, afterwards `.open_scratch()` replaces `.extract_FELIX_data()` and `.compile_FELIX_data()`.
+        The scratch copy always has the full traces, `.open_scratch()` compacts them with `self.segments`.
+        '''
+        return write_FELIX_scratch(self.files, folder or self.temp_file("scratch"), self.channel, self.n_samples, self.precision, self.tolerance)
+
+    def open_scratch(self, folder=None, check=True):
+        '''
+        Opens a scratch folder of `.write_scratch()` as `self.compiled_data`, in constant time: the traces are memory-mapped, not read.
+        Slicing `self.compiled_data` gives views on the file, the OS keeps the used pages in its cache for the next session.
+        A ValueError is raised when the folder was written for other files or settings, or with `check` when one of the files changed since.
+        `n_samples=None` and `precision=None` are compared as what reading the first file would give (its trace length and dtype).
+        With `self.segments`, only the kept samples are copied into memory.
+        '''
+        # only the metadata of the first file is read
+        shape, dtype = ReadData_FELIX_HDF5(self.files[0]).extract_shape(self.channel, self.n_samples, self.precision)
+        self.compiled_data = open_FELIX_scratch(folder or self.temp_file("scratch"), check=check, list_of_files=self.files, channel=self.channel,
+                                                n_samples=shape[1], precision=str(dtype), tolerance=self.tolerance)
+        if self.segments is not None:
+            self.compiled_data = self.segments.compact(self.compiled_data)
+        return self.compiled_data
+
     def check_compiled_FELIX_data(self, wavenumber):
         '''
         This function checks the output of `.compile_FELIX_data()` method. It is necessary to run that method first.
@@ -2,14 +2,29 @@
 This block of code defines a "ReadData_FELIX_HDF5" object with functions to read data from FELIX HDF5 files
 It reads on a per file basis.
 Enter your H5 filename as an input to the object.
+This can be an open `h5py.File` or the path to the file, in which case the file is opened only while reading.
 Execute the functions as methods.
 '''
 
+import os
+from contextlib import contextmanager
+
 import h5py
 import numpy as np
 import pandas as pd
 
-__all__ = ['ReadData_FELIX_HDF5']
+from .Instrumentation import *
+
+__all__ = ['ReadData_FELIX_HDF5', 'file_label']
+
+
+def file_label(file):
+    '''
+    Short label of a measurement file, e.g. "Data.0005" for "240404_Data.0005.h5".
+    Works for open `h5py.File` objects as well as for file paths.
+    '''
+    return os.fspath(getattr(file, 'filename', file))[-12:-3]
+
 
 class ReadData_FELIX_HDF5:
 
@@ -17,41 +32,140 @@ class ReadData_FELIX_HDF5:
         self.file = file_name
         self.wavenumbers = [] # list of frequencies in inverse centimeters
         self.signal = [] # 3D numpy array of signal data corresponding to each wavenumber
+        self.group_names = [] # names of the measurement groups under 'Rawdat', in measurement order
+
+    @contextmanager
+    def open_file(self):
+        '''
+        Yields the open h5py file.
+        If the object was created with a path, the file is opened here and closed again afterwards.
+        '''
+        if isinstance(self.file, (str, os.PathLike)):
+            with h5py.File(self.file, 'r') as file:
+                yield file
+        else:
+            yield self.file
 
+    # All measurements are stored as groups under 'Rawdat', e.g. 'Rawdat/P00000_1500.1500'.
+    # Each group holds the dataset 'X' (X[0] is the wavenumber) and the dataset 'Trace' (the TOF trace, columns are the channels).
+    # Iterating over the group only reads the links, no data is loaded here.
+    def extract_groups(self):
+        '''
+        Collects the names of the measurement groups without reading any of the datasets.
+        '''
+        with self.open_file() as file:
+            self.group_names = [name for name, item in file['Rawdat'].items() if isinstance(item, h5py.Group)]
+        return self.group_names
 
     # The items() method reads out the key and value pairs of the h5 file
-    # If the value is an HDF5 "group" (directory), a for loop will be initiated
-    # The item() method is again applied to the the directory to extract another set of key and value pairs
-    # For each measurement frequency, the dataset 'x' is taken
-    # The value of 'x' is rounded down to the nearest integer via 'np.floor()'
-    # The "np.floor()" method however returns an np.array, to cancel the effect, we apply the 'int()' method. 
-    # An alternative is just to apply 'int()' method directly.
-    def extract_wavenumbers(self):
+    # For each measurement frequency, only the first element of the dataset 'X' is read
+    # The value of 'X[0]' is rounded to 2 decimals so that it can be used as a key for grouping.
+    def extract_wavenumbers(self, verbose=True):
         self.wavenumbers.clear() # this makes sure that the variable is reset at the start so that if you run it twice, the ouput isn't doubled.
-        for name, item in self.file.items():
-            # print(name, item)
-            if isinstance(item, h5py.Group):
-                for name2, item2 in item.items():
-                    # print(n2,i2)
-                    if isinstance(item2, h5py.Group):
-                        self.wavenumbers.append(round((self.file['Rawdat'][name2]["X"][:][0]),2))
-        print(self.wavenumbers, len(self.wavenumbers))
+        with self.open_file() as file:
+            rawdat = file['Rawdat']
+            for name in self.extract_groups():
+                self.wavenumbers.append(round(rawdat[name]["X"][0], 2))
+        if verbose:
+            print(self.wavenumbers, len(self.wavenumbers))
         return self.wavenumbers
 
-    # We again loop through the h5 groups.
-    # it's likely better to merge this code block with the previous codeblock, but I want first to break down everything simpler.
     # signal == Trace hdf5 dataset
-    # The signal is converted from list data type to numpy array data type for memory and computational efficiency
+    # The signal is read directly into a preallocated 3D numpy array instead of going through a list first.
     # The result is a 3D array of shape (86,100000,2)
     # The 86 corresponds to the total number of wavenumbers
     def extract_signal(self):
-        self.signal = [] # this makes sure that the variable is reset at the start so that if you run it twice, the ouput isn't doubled.
-        for name, item in self.file.items():
-            # print(name, item)
-            if isinstance(item, h5py.Group):
-                for name2, item2 in item.items():
-                    # print(n2,i2)
-                    if isinstance(item2, h5py.Group):
-                        self.signal.append((self.file['Rawdat'][name2]["Trace"][:]))
-        self.signal = np.array(self.signal) # convert into 3D numpy array
-        return self.signal
\ No newline at end of file
+        self.extract_data(channel=None, verbose=False)
+        return self.signal
+
+    def extract_shape(self, channel=0, n_samples=None, dtype=None, segments=None):
+        '''
+        Returns the shape and dtype of the array that `.extract_data()` fills, without reading any trace data.
+        The dtype is the one of the HDF5 dataset, unless another `dtype` is asked for.
+        With `segments` (a `TraceSegments`), every trace only has the samples inside the segments.
+        '''
+        if segments is not None:
+            shape, dtype = self.extract_shape(channel, n_samples, dtype)
+            return (shape[0], len(segments), shape[2]), dtype
+        with self.open_file() as file:
+            rawdat = file['Rawdat']
+            self.extract_groups()
+            if not self.group_names:
+                return (0, n_samples or 0, 0 if channel is None else len(np.atleast_1d(channel))), np.dtype(dtype or np.float64)
+            # the shape of the first trace sets the size of the output array
+            first_trace = rawdat[self.group_names[0]]["Trace"]
+            if n_samples is None:
+                n_samples = first_trace.shape[0]
+            n_channels = first_trace.shape[1] if channel is None else len(np.atleast_1d(channel))
+            return (len(self.group_names), n_samples, n_channels), np.dtype(dtype or first_trace.dtype)
+
+    @instrumented('ReadData_FELIX_HDF5.extract_data')
+    def extract_data(self, channel=0, n_samples=None, verbose=True, out=None, dtype=None, segments=None):
+        '''
+        Reads the wavenumbers and the signal of the file in a single pass over the measurement groups.
+
+        `channel` selects which columns of the `Trace` dataset are read (an int, a list of ints, or None for all of them).
+        `n_samples` limits how many samples of each trace are read (None reads the full trace).
+        The selection is read by h5py straight into a preallocated array, so no intermediate lists or copies are made.
+        The output is a 3D array of shape (wavenumbers, samples, channels); with `channel=0` it is (86,60000,1) for example,
+        so `signal[wavenumber][:,0]` keeps working as before.
+        An existing array of the shape given by `.extract_shape()` can be passed as `out`, e.g. one living in shared memory.
+        With `dtype`, e.g. np.float32, the traces are converted by HDF5 while reading instead of keeping the dtype of the file.
+        With `segments` (a `TraceSegments`), only the samples inside the segments are read, one after the other.
+        '''
+        shape, dtype = self.extract_shape(channel, n_samples, dtype, segments)
+        # (first sample in the file, last sample + 1, first sample in the output) of every part that is read
+        if segments is None:
+            parts = [(0, shape[1], 0)]
+        else:
+            parts = [(int(start), int(stop), int(position)) for start, stop, position in zip(segments.starts, segments.stops, segments.offsets)]
+        n_samples = max((stop for _, stop, _ in parts), default=0) # every trace needs at least this many samples
+        channels = list(range(shape[2])) if channel is None else list(np.atleast_1d(channel))
+
+        if out is None:
+            out = np.empty(shape, dtype=dtype)
+            instrumentation.add_array(out)
+        elif out.shape != shape:
+            raise ValueError(f"Output array has shape {out.shape}, expected {shape}")
+        self.signal = out
+        self.wavenumbers.clear()
+
+        with self.open_file() as file:
+            rawdat = file['Rawdat']
+            for index, name in enumerate(self.group_names):
+                group = rawdat[name]
+                self.wavenumbers.append(round(group["X"][0], 2))
+                trace = group["Trace"]
+                if trace.shape[0] < n_samples:
+                    raise ValueError(f"Trace of {name} has {trace.shape[0]} samples, expected at least {n_samples}")
+                for start, stop, position in parts:
+                    destination = slice(position, position + stop - start)
+                    if channel is None and trace.shape[1] == shape[2]:
+                        # all channels can be read in one go
+                        trace.read_direct(self.signal, source_sel=np.s_[start:stop, :], dest_sel=np.s_[index, destination, :])
+                    else:
+                        for column, current_channel in enumerate(channels):
+                            trace.read_direct(self.signal, source_sel=np.s_[start:stop, current_channel], dest_sel=np.s_[index, destination, column])
+
+        instrumentation.add_decoded(self.signal.nbytes)
+        if verbose:
+            print(self.wavenumbers, len(self.wavenumbers))
+        return self.wavenumbers, self.signal
+
+    def read_trace(self, group_name, channel=0, n_samples=None, out=None, dtype=None):
+        '''
+        Reads one channel of the `Trace` dataset of a single measurement group, e.g. for streaming one wavenumber at a time.
+        The data is read straight into `out` (a contiguous 1D array) if given.
+        '''
+        with self.open_file() as file:
+            trace = file['Rawdat'][group_name]["Trace"]
+            if n_samples is None:
+                n_samples = trace.shape[0]
+            if trace.shape[0] < n_samples:
+                raise ValueError(f"Trace of {group_name} has {trace.shape[0]} samples, expected at least {n_samples}")
+            if out is None:
+                out = np.empty(n_samples, dtype=dtype or trace.dtype)
+                instrumentation.add_array(out)
+            trace.read_direct(out, source_sel=np.s_[0:n_samples, channel])
+            instrumentation.add_decoded(out.nbytes)
+        return out
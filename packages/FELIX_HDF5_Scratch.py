@@ -0,0 +1,113 @@
+'''
+This section contains a memory-mapped scratch copy of the raw traces, for analysing the same dataset many times.
+`write_FELIX_scratch` converts a set of files once to an uncompressed `traces.npy`,
+`open_FELIX_scratch` maps it into memory and returns a `CompiledData_FELIX_HDF5`.
+'''
+
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from .FELIX_HDF5_ReadData import *
+from .FELIX_HDF5_CompiledData import *
+from .WavenumberGroups import *
+from .Instrumentation import *
+
+__all__ = ['write_FELIX_scratch', 'open_FELIX_scratch']
+
+SCRATCH_VERSION = 1 # changes when the layout of the folder or the grouping of the wavenumbers changes
+
+
+def _file_state(file_name):
+    # size and modification time of a source file, to notice when it changed after the conversion
+    stat = os.stat(file_name)
+    return [os.path.abspath(file_name), stat.st_size, stat.st_mtime_ns]
+
+
+@instrumented('write_FELIX_scratch')
+def write_FELIX_scratch(list_of_files, folder, channel = 0, n_samples = None, precision = None, tolerance = 0.0):
+    '''
+    Converts the HDF5 files (paths) into a scratch folder and returns the folder.
+    `channel`, `n_samples`, `precision` and `tolerance` are the settings of `ProcessData_FELIX_HDF5`.
+    The folder is written under a temporary name first, an interrupted conversion never leaves a broken scratch folder.
+    '''
+    list_of_files = [os.fspath(file) for file in list_of_files]
+    file_labels = [file_label(file) for file in list_of_files]
+    readers = [ReadData_FELIX_HDF5(file) for file in list_of_files]
+    for reader in readers:
+        reader.extract_wavenumbers(verbose=False)
+    groups = WavenumberGroups.from_readers(readers, tolerance, file_labels=file_labels)
+    # the first file sets the number of samples and the dtype
+    shape, dtype = readers[0].extract_shape(channel, n_samples, precision)
+    n_samples = shape[1]
+
+    temporary = os.path.normpath(folder) + '.tmp' + str(os.getpid())
+    shutil.rmtree(temporary, ignore_errors=True)
+    os.makedirs(temporary)
+    traces = np.lib.format.open_memmap(os.path.join(temporary, 'traces.npy'), mode='w+', dtype=dtype,
+                                       shape=(n_samples, len(groups.file_index)), fortran_order=True)
+    try:
+        # every file is opened once and its traces are read into their columns
+        for f, reader in enumerate(readers):
+            columns = np.flatnonzero(groups.file_index == f)
+            with reader.open_file() as file:
+                current_file = ReadData_FELIX_HDF5(file)
+                for column in columns:
+                    current_file.read_trace(reader.group_names[groups.measurement_index[column]], channel, n_samples, out=traces[:, column])
+        traces.flush()
+    finally:
+        # release the mapping, otherwise the folder cannot be renamed on Windows
+        del traces
+
+    labels = [str(readers[f].wavenumbers[measurement])+"_"+file_labels[f]+"_withoutIR" for f, measurement in zip(groups.file_index, groups.measurement_index)]
+    arrays = {
+        'wavenumbers': np.asarray(groups.wavenumbers, dtype=np.float64),
+        'offsets': groups.offsets,
+        'file_index': groups.file_index,
+        'measurement_index': groups.measurement_index,
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(temporary, name + '.npy'), array)
+    metadata = {
+        'labels': labels,
+        'files': [_file_state(file) for file in list_of_files],
+        'channel': channel, 'n_samples': n_samples, 'precision': str(np.dtype(dtype)), 'tolerance': tolerance,
+        'version': SCRATCH_VERSION,
+    }
+    with open(os.path.join(temporary, 'metadata.json'), 'w') as file:
+        json.dump({'arrays': ['traces', *arrays], 'metadata': metadata, 'created': time.time()}, file)
+
+    shutil.rmtree(folder, ignore_errors=True)
+    os.replace(temporary, folder)
+    return folder
+
+
+def open_FELIX_scratch(folder, mmap_mode = 'r', check = True, list_of_files = None, **settings):
+    '''
+    Opens a scratch folder of `write_FELIX_scratch` as a `CompiledData_FELIX_HDF5` whose traces are memory-mapped, no trace is read here.
+    With `check`, a ValueError is raised when a source file changed (size or modification time) since the conversion.
+    A ValueError is also raised when `list_of_files` or one of the `settings` (e.g. n_samples=60000) is not the one the folder was written with
+    (a setting that is None is not compared, `ProcessData_FELIX_HDF5.open_scratch` fills them in),
+    or when the folder was written by another version of `write_FELIX_scratch`.
+    `mmap_mode='c'` allows changing the traces in memory without writing to the scratch file.
+    '''
+    with open(os.path.join(folder, 'metadata.json')) as file:
+        content = json.load(file)
+    metadata = content['metadata']
+    if metadata.get('version') != SCRATCH_VERSION:
+        raise ValueError(f"The scratch folder {folder} was written by another version, write it again")
+    if check:
+        changed = [name for name, size, mtime in metadata['files'] if not os.path.isfile(name) or _file_state(name)[1:] != [size, mtime]]
+        if changed:
+            raise ValueError(f"{changed} changed since the scratch folder {folder} was written, write it again or use check=False")
+    if list_of_files is not None and [os.path.abspath(os.fspath(file)) for file in list_of_files] != [name for name, _, _ in metadata['files']]:
+        raise ValueError(f"The scratch folder {folder} was written for other files")
+    different = {key: metadata[key] for key, value in settings.items() if value is not None and metadata[key] != value}
+    if different:
+        raise ValueError(f"The scratch folder {folder} was written with {different}")
+
+    arrays = {name: np.load(os.path.join(folder, name + '.npy'), mmap_mode=mmap_mode if name == 'traces' else None) for name in content['arrays']}
+    return CompiledData_FELIX_HDF5.from_arrays(arrays, metadata)
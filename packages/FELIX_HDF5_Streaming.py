@@ -0,0 +1,157 @@
+'''
+This block of code defines a "StreamData_FELIX_HDF5" object.
+It goes from the HDF5 files to the REMPI spectrum one wavenumber at a time:
+the traces of a wavenumber are read, baseline corrected, summed and integrated, and then thrown away.
+Peak memory is proportional to one wavenumber instead of the whole dataset.
+'''
+
+from contextlib import ExitStack
+import os
+
+import h5py
+import numpy as np
+import pandas as pd
+
+from .FELIX_HDF5_ReadData import *
+from .FELIX_HDF5_CompiledData import *
+from .BaselineCorrection import *
+from .DepletionCalculator import *
+from .MassCalibration import *
+from .Instrumentation import *
+from .WavenumberGroups import *
+from .ReadAhead import *
+
+__all__ = ['StreamData_FELIX_HDF5']
+
+_worker_readers = {} # file path -> reader of the open file, kept by every read-ahead worker process during a run
+
+
+def _read_block(readers, members, channel, n_samples, dtype):
+    '''
+    Reads the traces of one wavenumber into a (samples x repeats) Fortran ordered array, one column per (file index, group name).
+    '''
+    block = np.empty((n_samples, len(members)), dtype=dtype, order='F')
+    instrumentation.add_array(block)
+    for column, (file_index, name) in enumerate(members):
+        readers[file_index].read_trace(name, channel, n_samples, out=block[:, column])
+    return block
+
+
+def _read_block_worker(job):
+    '''
+    Worker of the read-ahead with processes: reads one wavenumber, the files stay open for the next wavenumbers.
+    '''
+    files, members, channel, n_samples, dtype = job
+    readers = []
+    for file in map(os.fspath, files):
+        if file not in _worker_readers:
+            _worker_readers[file] = ReadData_FELIX_HDF5(h5py.File(file, 'r'))
+        readers.append(_worker_readers[file])
+    return _read_block(readers, members, channel, n_samples, dtype)
+
+
+class StreamData_FELIX_HDF5:
+
+    def __init__(self, list_of_files, target_mass = None, baseline_reference = None, interval = None, list_mass_isotope = None, scan_width = None, channel = 0, n_samples = None, keep_sums = False, precision = None, tolerance = 0.0, prefetch = None, memory_budget = None, workers = None):
+        self.files = list_of_files # open h5py.File objects or file paths
+        self.mass = MassAxis.from_mass(target_mass) if target_mass is not None else None
+        self.baseline_reference = baseline_reference
+        self.interval = interval
+        self.list_mass_isotope = list_mass_isotope
+        self.scan_width = scan_width
+        self.channel = channel
+        self.n_samples = n_samples
+        self.keep_sums = keep_sums # keep the summed, baseline corrected signal of every wavenumber (samples per wavenumber in memory)
+        self.precision = np.dtype(precision) if precision is not None else None # dtype of the traces, None keeps the dtype of the files
+        self.tolerance = tolerance # readings closer than this are the same wavenumber, see `WavenumberGroups`
+        self.prefetch = prefetch # number of wavenumbers read ahead in the background, None == read when needed
+        self.memory_budget = memory_budget # bytes of traces that may be read ahead, None == only limited by `prefetch`
+        self.workers = workers # number of background workers that read ahead, 1 by default
+
+        self.groups = {} # wavenumber -> list of (file index, group name), in file order
+        self.wavenumber_groups = None # `WavenumberGroups` of all files, with the skipped and doubly measured wavenumbers
+        self.sums = {} # wavenumber -> summed, baseline corrected signal (only with keep_sums)
+        self.peak_masses = {} # wavenumber -> actual peak mass of every isotope
+        self.depletion_spectra = pd.DataFrame()
+
+    def index_FELIX_data(self, readers):
+        '''
+        Groups the measurement groups of all files per wavenumber, reading only the wavenumbers.
+        As in `compile_FELIX_data`, the first measurement (index==0) of every file is skipped.
+        '''
+        for reader in readers:
+            reader.extract_wavenumbers(verbose=False)
+        self.wavenumber_groups = WavenumberGroups.from_readers(readers, self.tolerance)
+        self.groups = {}
+        for k, wavenumber in enumerate(self.wavenumber_groups.wavenumbers):
+            self.groups[wavenumber] = [(file_index, readers[file_index].group_names[measurement]) for file_index, measurement in self.wavenumber_groups.members(k)]
+        return self.groups
+
+    def iter_wavenumbers(self, readers):
+        '''
+        Yields (wavenumber, block) for one wavenumber at a time, where block is the (samples x repeats) array of its traces.
+        With `self.prefetch`, the next wavenumbers are read ahead by `self.workers`: worker processes if `self.files` are paths,
+        threads if they are open h5py.File objects (h5py keeps the GIL, so threads mostly help for slow disks).
+        Reading usually takes much longer than the baseline correction, more than one worker is what makes it faster.
+        '''
+        # the first file sets the number of samples and the dtype
+        shape, dtype = readers[0].extract_shape(self.channel, self.n_samples, self.precision)
+        if not self.prefetch:
+            for wavenumber, members in self.groups.items():
+                with instrumentation.stage('StreamData.read', wavenumber):
+                    block = _read_block(readers, members, self.channel, shape[1], dtype)
+                yield wavenumber, block
+            return
+
+        jobs = [(self.files, members, self.channel, shape[1], dtype) for members in self.groups.values()]
+        size = lambda job: job[3] * len(job[1]) * dtype.itemsize
+        if all(isinstance(file, (str, os.PathLike)) for file in self.files):
+            read_ahead = ReadAhead(_read_block_worker, jobs, self.prefetch, self.workers or 1, self.memory_budget, size)
+        else:
+            read_ahead = ReadAhead(lambda job: _read_block(readers, *job[1:]), jobs, self.prefetch, self.workers or 1, self.memory_budget, size, executor='thread')
+        for wavenumber, (_, block) in zip(self.groups, read_ahead):
+            with instrumentation.stage('StreamData.read', wavenumber):
+                instrumentation.add_decoded(block.nbytes)
+                instrumentation.add_array(block)
+            yield wavenumber, block
+
+    def process_wavenumber(self, wavenumber, block):
+        '''
+        Baseline corrects, sums and integrates the traces of one wavenumber. Returns the integrated signal.
+        '''
+        labels = [str(wavenumber)+"_"+str(column)+"_withoutIR" for column in range(block.shape[1])]
+        compiled_data = CompiledData_FELIX_HDF5(block, [wavenumber], [0, block.shape[1]], labels)
+        fullrange = baseline_fullrange(baseline_reference = self.baseline_reference, interval = self.interval, target_mass = self.mass, compiled_data = compiled_data)
+        fullrange.run()
+        sums2 = fullrange.sums2[:, 0]
+        signal_withoutIR, peak_masses, _ = integrate_isotope_windows(sums2[None, :], self.mass, self.list_mass_isotope, self.scan_width)
+        self.peak_masses[wavenumber] = peak_masses[0]
+        if self.keep_sums:
+            self.sums[wavenumber] = sums2
+        return signal_withoutIR[0]
+
+    @instrumented('StreamData.run')
+    def run(self):
+        '''
+        Streams all wavenumbers and returns the spectrum, a DataFrame with the columns `wavenumber` and `sum_withoutIR`
+        like `depletion.make_depletion_spectra_multi_peak`.
+        '''
+        with ExitStack() as stack:
+            # keep every file open during the run instead of reopening it for every wavenumber
+            files = [stack.enter_context(h5py.File(file, 'r')) if isinstance(file, (str, os.PathLike)) else file for file in self.files]
+            readers = [ReadData_FELIX_HDF5(file) for file in files]
+            self.index_FELIX_data(readers)
+
+            wavenumbers = []
+            signal_withoutIR = []
+            for wavenumber, block in self.iter_wavenumbers(readers):
+                with instrumentation.stage('StreamData.process_wavenumber', wavenumber):
+                    signal_withoutIR.append(self.process_wavenumber(wavenumber, block))
+                wavenumbers.append(wavenumber)
+                del block
+
+        self.depletion_spectra = pd.DataFrame({
+            "wavenumber": np.asarray(wavenumbers, dtype=np.float64),
+            "sum_withoutIR": np.asarray(signal_withoutIR),
+        })
+        return self.depletion_spectra
@@ -0,0 +1,201 @@
+'''
+This section contains opt-in timing and memory instrumentation of the pipeline.
+For every stage (and per wavenumber where it applies) it records the wall time, the bytes decoded from the HDF5 files,
+the arrays allocated and the change of the resident memory (RSS).
+Call `enable_instrumentation()`, run the pipeline and print `instrumentation_summary()`. It is disabled by default.
+'''
+
+import functools
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+__all__ = ['instrumentation', 'instrumented', 'enable_instrumentation', 'disable_instrumentation', 'reset_instrumentation', 'instrumentation_summary']
+
+
+def _peak_rss():
+    '''
+    Peak resident memory of the process in bytes, or None if it cannot be determined.
+    '''
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss)
+    except ImportError:
+        return None
+
+
+def _current_rss():
+    '''
+    Resident memory of the process in bytes right now, or None if it cannot be determined.
+    '''
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+
+class _null_stage:
+    # shared do-nothing context manager for when the instrumentation is disabled
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _null_stage()
+
+
+class _stage:
+
+    def __init__(self, recorder, name, wavenumber):
+        self.recorder = recorder
+        self.record = {"stage": name, "wavenumber": wavenumber, "time_s": 0.0, "bytes_decoded": 0, "arrays": 0, "array_bytes": 0,
+                       "rss_change_MB": None, "process_peak_rss_MB": None}
+
+    def __enter__(self):
+        self.recorder.active.append(self.record)
+        self.rss = _current_rss()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.record["time_s"] = time.perf_counter() - self.start
+        rss = _current_rss()
+        self.record["rss_change_MB"] = (rss - self.rss) / 1e6 if rss is not None and self.rss is not None else None
+        peak = _peak_rss()
+        self.record["process_peak_rss_MB"] = peak / 1e6 if peak is not None else None
+        self.recorder.active.remove(self.record)
+        self.recorder.records.append(self.record)
+        if self.recorder.callback is not None:
+            self.recorder.callback(dict(self.record))
+        return False
+
+
+class _instrumentation:
+
+    def __init__(self):
+        self.enabled = False
+        self.callback = None # called with a dictionary for every finished stage
+        self.records = [] # one dictionary per finished stage
+        self._local = threading.local() # every thread has its own running stages, e.g. the read-ahead threads
+
+    @property
+    def active(self):
+        # stages that are running in this thread, bytes and arrays are added to all of them
+        active = getattr(self._local, 'active', None)
+        if active is None:
+            active = self._local.active = []
+        return active
+
+    @active.setter
+    def active(self, stages):
+        self._local.active = stages
+
+    def stage(self, name, wavenumber = None):
+        '''
+        Context manager that records one stage. Does nothing when the instrumentation is disabled.
+        '''
+        if not self.enabled:
+            return _NULL_STAGE
+        return _stage(self, name, wavenumber)
+
+    def add_decoded(self, n_bytes):
+        '''
+        Adds bytes of trace data decoded from an HDF5 file (the size of the array it was read into) to the running stages.
+        '''
+        if self.enabled:
+            for record in self.active:
+                record["bytes_decoded"] += int(n_bytes)
+
+    def add_array(self, array):
+        '''
+        Adds an allocated array (or DataFrame) to the running stages.
+        '''
+        if self.enabled:
+            n_bytes = array.memory_usage(index=False).sum() if isinstance(array, pd.DataFrame) else np.asarray(array).nbytes
+            for record in self.active:
+                record["arrays"] += 1
+                record["array_bytes"] += int(n_bytes)
+
+
+instrumentation = _instrumentation()
+
+
+def instrumented(name):
+    '''
+    Decorator that records every call of a function or method as a stage called `name`.
+    Only meant for coarse stages: even when disabled it costs a function call, so not for lookups in inner loops such as `mass_window`.
+    For methods of objects with a `wavenumber` attribute (e.g. `baseline`, `depletion`), the wavenumber is recorded too.
+    '''
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not instrumentation.enabled:
+                return function(*args, **kwargs)
+            wavenumber = getattr(args[0], 'wavenumber', None) if args else None
+            with instrumentation.stage(name, wavenumber):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def enable_instrumentation(callback = None, reset = True):
+    '''
+    Switches the instrumentation on. `callback(record)` is called with a dictionary for every finished stage,
+    e.g. to forward the metrics to your own logging.
+    '''
+    if reset:
+        reset_instrumentation()
+    instrumentation.callback = callback
+    instrumentation.enabled = True
+
+
+def disable_instrumentation():
+    instrumentation.enabled = False
+    instrumentation.callback = None
+
+
+def reset_instrumentation():
+    instrumentation.records = []
+    instrumentation.active = []
+
+
+def instrumentation_summary(per_wavenumber = False):
+    '''
+    Summary table of all recorded stages.
+    By default one row per stage, with `per_wavenumber=True` one row per stage and wavenumber.
+    Nested stages are included in the numbers of the stage they run in.
+    `rss_change_MB` is what the stage left in the resident memory, `process_peak_rss_MB` the peak of the whole process up to the end of the stage.
+    '''
+    columns = ["stage", "wavenumber", "time_s", "bytes_decoded", "arrays", "array_bytes", "rss_change_MB", "process_peak_rss_MB"]
+    records = pd.DataFrame(instrumentation.records, columns=columns)
+    keys = ["stage", "wavenumber"] if per_wavenumber else ["stage"]
+    summary = records.groupby(keys, sort=False, dropna=False).agg(
+        calls = ("time_s", "size"),
+        time_s = ("time_s", "sum"),
+        MB_decoded = ("bytes_decoded", lambda value: value.sum()/1e6),
+        arrays = ("arrays", "sum"),
+        MB_allocated = ("array_bytes", lambda value: value.sum()/1e6),
+        rss_change_MB = ("rss_change_MB", "sum"),
+        process_peak_rss_MB = ("process_peak_rss_MB", "max"),
+    )
+    return summary.reset_index()
@@ -0,0 +1,115 @@
+'''
+This block of code defines a "MassAxis" object.
+It owns the calibration of the x-axis, mass = alpha*(x_counts - t_off)**2, and answers mass window queries.
+Past `t_off` the axis is monotonic, so a window is found with `np.searchsorted` and returned as a slice.
+'''
+
+import numpy as np
+
+__all__ = ['MassAxis', 'mass_window', 'as_slice']
+
+class MassAxis:
+
+    def __init__(self, alpha = None, t_off = None, n_samples = 60000, x_counts = None, mass = None):
+        self.alpha = alpha # counts/us^2
+        self.t_off = t_off # us
+        if mass is None:
+            # Generate an x-axis equivalent to the length of the dataset, it is not time
+            self.x_counts = np.linspace(1, n_samples, n_samples) if x_counts is None else np.asarray(x_counts, dtype=np.float64)
+            self.mass = alpha*(self.x_counts - t_off)**2
+        else:
+            self.x_counts = x_counts
+            self.mass = np.asarray(mass)
+
+        # the axis decreases until t_off and increases after it
+        # `start` is the first point of the monotonic part, `head_max` the largest mass before it
+        self.start = int(np.argmin(self.mass)) if len(self.mass) else 0
+        self.head_max = self.mass[:self.start].max() if self.start > 0 else -np.inf
+        self.tail = self.mass[self.start:]
+        self.cache = {}
+        self.cache_size = 4096
+
+    @classmethod
+    def from_mass(cls, mass):
+        '''
+        Makes a MassAxis from an already calibrated x-axis, e.g. `x_mass` in the notebook.
+        '''
+        if isinstance(mass, cls):
+            return mass
+        return cls(mass = mass)
+
+    def window(self, mass_min, mass_max):
+        '''
+        Returns the indices of all points with mass_min <= mass <= mass_max.
+        This is a slice when the window lies in the monotonic part of the axis (the usual case),
+        otherwise the index array of `np.where` is returned.
+        '''
+        key = (mass_min, mass_max)
+        if key in self.cache:
+            return self.cache[key]
+
+        if mass_min > self.head_max:
+            start = self.start + int(np.searchsorted(self.tail, mass_min, side='left'))
+            stop = self.start + int(np.searchsorted(self.tail, mass_max, side='right'))
+            indices = slice(start, max(start, stop))
+        else:
+            # the window reaches into the part before t_off, where the axis is not monotonic
+            indices = np.where((self.mass >= mass_min) & (self.mass <= mass_max))[0]
+
+        if len(self.cache) >= self.cache_size:
+            self.cache.clear()
+        self.cache[key] = indices
+        return indices
+
+    def index_range(self, mass_min, mass_max):
+        '''
+        Vectorized version of `.window()` for arrays of windows.
+        Returns the arrays `start` and `stop` so that window k is `start[k]:stop[k]`.
+        All windows must lie in the monotonic part of the axis.
+        '''
+        mass_min = np.asarray(mass_min, dtype=np.float64)
+        mass_max = np.asarray(mass_max, dtype=np.float64)
+        if np.any(mass_min <= self.head_max):
+            raise ValueError(f"Mass windows must start above {self.head_max} u, the part of the axis before t_off is not monotonic")
+        start = self.start + np.searchsorted(self.tail, mass_min, side='left')
+        stop = self.start + np.searchsorted(self.tail, mass_max, side='right')
+        return start, np.maximum(start, stop)
+
+    def __getitem__(self, indices):
+        return self.mass[indices]
+
+    def __len__(self):
+        return len(self.mass)
+
+    def __array__(self, dtype = None, copy = None):
+        # `np.array(axis)` asks for a copy, `np.asarray(axis)` gives the mass array itself (its windows are cached, do not change it)
+        dtype = self.mass.dtype if dtype is None else np.dtype(dtype)
+        if copy is False and dtype != self.mass.dtype:
+            raise ValueError(f"The mass axis cannot be converted to {dtype} without a copy")
+        return self.mass.astype(dtype, copy=bool(copy))
+
+    def __repr__(self):
+        return f"MassAxis(alpha={self.alpha}, t_off={self.t_off}, {len(self)} points)"
+
+
+def mass_window(mass, mass_min, mass_max):
+    '''
+    Indices of all points of the mass axis with mass_min <= mass <= mass_max.
+    `mass` can be a `MassAxis` object (fast, returns a slice) or a plain array (returns the index array of `np.where`).
+    '''
+    if isinstance(mass, MassAxis):
+        return mass.window(mass_min, mass_max)
+    return np.where((mass >= mass_min) & (mass <= mass_max))[0]
+
+
+def as_slice(indices):
+    '''
+    Turns an array of consecutive indices into a slice, so that indexing returns a view instead of a copy.
+    Anything else is returned unchanged.
+    '''
+    if isinstance(indices, slice):
+        return indices
+    indices = np.asarray(indices)
+    if len(indices) and indices[-1] - indices[0] == len(indices) - 1 and np.all(np.diff(indices) == 1):
+        return slice(int(indices[0]), int(indices[-1]) + 1)
+    return indices
@@ -0,0 +1,219 @@
+'''
+This section contains plotting helpers for overlays of many mass spectra.
+Every trace is reduced to about `n_points` points of the visible mass window, with min/max per bucket or LTTB.
+plotly and matplotlib are only imported when a figure is made.
+'''
+
+import numpy as np
+
+from .MassCalibration import *
+
+__all__ = ['decimate_minmax', 'decimate_lttb', 'DecimationPyramid', 'plot_mass_spectra']
+
+
+def decimate_minmax(x, y, n_points):
+    '''
+    Reduces (x, y) to at most `n_points` points: the minimum and the maximum of every bucket, in their original order.
+    Peaks survive the decimation, which is what matters for mass spectra.
+    '''
+    x = np.asarray(x)
+    y = np.asarray(y)
+    n_buckets = max(n_points // 2, 1)
+    if len(y) <= n_points:
+        return x, y
+    edges = np.linspace(0, len(y), n_buckets + 1).astype(np.int64)
+    lo = np.minimum.reduceat(y, edges[:-1])
+    hi = np.maximum.reduceat(y, edges[:-1])
+    # position of the first minimum / maximum inside every bucket
+    bucket = np.repeat(np.arange(n_buckets), np.diff(edges))
+    lo_position = _first_position(y == lo[bucket], edges)
+    hi_position = _first_position(y == hi[bucket], edges)
+    positions = np.sort(np.stack([lo_position, hi_position], axis=1), axis=1).reshape(-1)
+    return x[positions], y[positions]
+
+
+def _first_position(mask, edges):
+    # index of the first True of `mask` in every bucket [edges[k], edges[k+1])
+    candidates = np.where(mask, np.arange(len(mask)), len(mask))
+    return np.minimum.reduceat(candidates, edges[:-1])
+
+
+def decimate_lttb(x, y, n_points):
+    '''
+    Largest-Triangle-Three-Buckets: keeps the first and last point and, for every bucket in between,
+    the point that makes the largest triangle with the point kept before and the mean of the next bucket.
+    Looks closer to the original line than min/max, but a narrow peak can lose its height.
+    '''
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y)
+    if n_points < 3 or len(y) <= n_points:
+        return x, y
+    edges = np.linspace(1, len(y) - 1, n_points - 1).astype(np.int64)
+    positions = np.empty(n_points, dtype=np.int64)
+    positions[0] = 0
+    positions[-1] = len(y) - 1
+    y64 = y.astype(np.float64, copy=False)
+    for k in range(n_points - 2):
+        start, stop = edges[k], edges[k+1]
+        next_stop = edges[k+2] if k + 2 < len(edges) else len(y)
+        # mean of the next bucket (the last point for the last bucket)
+        mean_x = x[stop:next_stop].mean()
+        mean_y = y64[stop:next_stop].mean()
+        previous = positions[k]
+        area = np.abs((x[previous] - mean_x) * (y64[start:stop] - y64[previous]) - (x[previous] - x[start:stop]) * (mean_y - y64[previous]))
+        positions[k+1] = start + int(np.argmax(area))
+    return x[positions], y[positions]
+
+
+class DecimationPyramid:
+    '''
+    Multi-resolution min/max summary of a set of traces on the same mass axis.
+
+    `mass` == calibrated x-axis (array or `MassAxis`)
+    `traces` == (samples x traces) array, e.g. `baseline_fullrange.sums2`
+    `names` == legend entry of every trace, e.g. the wavenumbers
+    `factor` == ratio of the bucket sizes of two consecutive levels
+    `min_buckets` == levels with fewer buckets are not stored
+    '''
+
+    def __init__(self, mass, traces, names = None, factor = 4, min_buckets = 512):
+        self.mass = MassAxis.from_mass(mass)
+        traces = np.asarray(traces)
+        self.traces = traces[:, None] if traces.ndim == 1 else traces
+        if self.traces.shape[0] != len(self.mass):
+            raise ValueError(f"Traces have {self.traces.shape[0]} samples, the mass axis {len(self.mass)}")
+        self.names = list(names) if names is not None else [str(index) for index in range(self.traces.shape[1])]
+        self.factor = factor
+
+        # one entry per level: (bucket size, positions of the minima, positions of the maxima), positions have shape (buckets x traces)
+        self.levels = []
+        n_samples = self.traces.shape[0]
+        bucket_size = factor
+        lo, hi = None, None
+        while n_samples // bucket_size >= min_buckets:
+            lo, hi = self._next_level(lo, hi, bucket_size)
+            self.levels.append((bucket_size, lo, hi))
+            bucket_size *= factor
+
+    @classmethod
+    def from_tables(cls, mass, tables, wavenumbers = None, column = -1, **kwargs):
+        '''
+        Makes the pyramid from one column of every table of a wavenumber -> DataFrame mapping,
+        e.g. the summed trace (`column=-1`) of `compilation_baseline_corrected_data`.
+        '''
+        wavenumbers = list(tables) if wavenumbers is None else list(wavenumbers)
+        first = tables[wavenumbers[0]]
+        traces = np.empty((len(first), len(wavenumbers)), dtype=first.iloc[:, column].dtype, order='F')
+        names = []
+        for index, wavenumber in enumerate(wavenumbers):
+            traces[:, index] = tables[wavenumber].iloc[:, column].to_numpy()
+            names.append(tables[wavenumber].columns[column])
+        return cls(mass, traces, names, **kwargs)
+
+    def _next_level(self, lo, hi, bucket_size):
+        # all traces at once, on arrays of shape (buckets x samples or children per bucket x traces)
+        n_samples, n_traces = self.traces.shape
+        n_buckets = -(-n_samples // bucket_size)
+        columns = np.arange(n_traces)
+        if lo is None:
+            # first level from the raw traces, the last bucket is padded with the last sample
+            # (argmin/argmax return the first occurrence, so a position never points into the padding)
+            padded = np.pad(self.traces, ((0, n_buckets * bucket_size - n_samples), (0, 0)), mode='edge').reshape(n_buckets, bucket_size, n_traces)
+            offsets = (np.arange(n_buckets) * bucket_size)[:, None]
+            return offsets + np.argmin(padded, axis=1), offsets + np.argmax(padded, axis=1)
+
+        # merge `factor` buckets of the level below, the last group is padded with the last bucket
+        new = []
+        for previous, select in ((lo, np.argmin), (hi, np.argmax)):
+            children = np.pad(previous, ((0, n_buckets * self.factor - len(previous)), (0, 0)), mode='edge').reshape(n_buckets, self.factor, n_traces)
+            chosen = select(self.traces[children, columns], axis=1)
+            new.append(np.take_along_axis(children, chosen[:, None, :], axis=1)[:, 0, :])
+        return new[0], new[1]
+
+    def index_range(self, mass_min, mass_max):
+        '''
+        Returns the first and last index + 1 of the window, in the monotonic part of the axis only:
+        the part before t_off runs backwards and would draw the line back on itself.
+        '''
+        start = self.mass.start + int(np.searchsorted(self.mass.tail, mass_min, side='left'))
+        stop = self.mass.start + int(np.searchsorted(self.mass.tail, mass_max, side='right'))
+        return start, max(start, stop)
+
+    def decimate(self, mass_min = None, mass_max = None, n_points = 2000, method = 'minmax', traces = None):
+        '''
+        Returns a list of (x, y) arrays, one per trace, with at most `n_points` points inside [mass_min, mass_max].
+        Without limits the window starts at the minimum of the axis (t_off) and ends at its last point.
+        `method` is 'minmax' or 'lttb'. `traces` selects the traces (indices), all by default.
+        '''
+        start, stop = self.index_range(-np.inf if mass_min is None else mass_min, np.inf if mass_max is None else mass_max)
+        traces = range(self.traces.shape[1]) if traces is None else traces
+        reduce = {'minmax': decimate_minmax, 'lttb': decimate_lttb}[method]
+
+        # coarsest level that still has n_points/2 buckets in the window, otherwise the raw data
+        level = None
+        for bucket_size, lo, hi in self.levels:
+            if (stop - start) // bucket_size >= n_points // 2:
+                level = (bucket_size, lo, hi)
+
+        decimated = []
+        for index in traces:
+            trace = self.traces[:, index]
+            if level is None:
+                positions = np.arange(start, stop)
+            else:
+                # buckets that lie completely inside the window, the partial buckets at both ends are taken from the raw data
+                bucket_size, lo, hi = level
+                buckets = slice(-(-start // bucket_size), stop // bucket_size)
+                positions = np.concatenate([
+                    np.arange(start, buckets.start * bucket_size),
+                    np.sort(np.stack([lo[buckets, index], hi[buckets, index]], axis=1), axis=1).reshape(-1),
+                    np.arange(buckets.stop * bucket_size, stop),
+                ])
+            decimated.append(reduce(self.mass.mass[positions], trace[positions], n_points))
+        return decimated
+
+
+def plot_mass_spectra(pyramid, mass_min = None, mass_max = None, n_points = 2000, method = 'minmax', traces = None, \
+                      backend = 'plotly', filename = None, title = None, y_range = None, include_plotlyjs = True):
+    '''
+    Overlays the decimated traces of a `DecimationPyramid` in [mass_min, mass_max].
+
+    `backend='plotly'` returns a plotly Figure and writes it to `filename` as HTML if given
+    (`include_plotlyjs='cdn'` makes the file even smaller but needs internet to open it).
+    `backend='matplotlib'` returns the (figure, axes) and saves the figure to `filename` if given.
+    '''
+    names = pyramid.names if traces is None else [pyramid.names[index] for index in traces]
+    decimated = pyramid.decimate(mass_min, mass_max, n_points, method, traces)
+    x_range = [mass_min, mass_max] if mass_min is not None and mass_max is not None else None
+
+    if backend == 'plotly':
+        import plotly.graph_objs as go
+        fig = go.Figure(
+            data = [go.Scatter(x = x, y = y, mode = 'lines', name = str(name)) for name, (x, y) in zip(names, decimated)],
+            layout = go.Layout(
+                title = title,
+                xaxis = dict(title = 'Mass (amu)', range = x_range),
+                yaxis = dict(title = 'Intensity (a.u.)', range = y_range),
+            ),
+        )
+        if filename is not None:
+            fig.write_html(filename, include_plotlyjs = include_plotlyjs)
+        return fig
+
+    if backend == 'matplotlib':
+        import matplotlib.pyplot as plt
+        fig, ax = plt.subplots()
+        for name, (x, y) in zip(names, decimated):
+            ax.plot(x, y, linewidth = 0.8, label = str(name))
+        ax.set_xlim(x_range)
+        if y_range is not None:
+            ax.set_ylim(y_range)
+        ax.set_xlabel('Mass (amu)')
+        ax.set_ylabel('Intensity (a.u.)')
+        if title is not None:
+            ax.set_title(title)
+        if filename is not None:
+            fig.savefig(filename, dpi = 400)
+        return fig, ax
+
+    raise ValueError(f"Unknown backend {backend}, use 'plotly' or 'matplotlib'")
@@ -0,0 +1,63 @@
+'''
+This section contains a check for reduced-precision trace storage.
+Storing the traces as float32 halves the memory and doubles the effective bandwidth of the baseline and integration stages.
+The function below runs the same REMPI spectrum with float64 and with reduced-precision traces and reports how far apart they are.
+'''
+
+import numpy as np
+import pandas as pd
+
+from .FELIX_HDF5_CompiledData import *
+from .BaselineCorrection import *
+from .DepletionCalculator import *
+
+__all__ = ['compare_precision']
+
+def compare_precision(compiled_data, target_mass, baseline_reference, interval, list_mass_isotope, scan_width, precision = 'float32', verbose = True):
+    '''
+    Makes the REMPI spectrum from float64 traces and from traces stored as `precision`, and compares them.
+
+    `compiled_data` is the float64 output of `compile_FELIX_data` (read without `precision`), it is used as the reference.
+    Casting it to float32 gives the same values as reading the HDF5 files with `precision='float32'`.
+
+    Returns a dictionary with:
+    1. `max_abs_deviation` == maximum absolute deviation of the spectrum
+    2. `max_rel_deviation` == the same, relative to the largest absolute value of the float64 spectrum
+    3. `memory_float64`, `memory_reduced` == memory of the traces in bytes
+    4. `table` == DataFrame with both spectra and their difference per wavenumber
+    '''
+    if compiled_data.traces.dtype != np.float64:
+        raise ValueError(f"The reference needs float64 traces, got {compiled_data.traces.dtype}. Compile the data without `precision`")
+
+    spectra = []
+    memory = []
+    for dtype in (np.float64, np.dtype(precision)):
+        traces = np.asfortranarray(compiled_data.traces, dtype=dtype)
+        current_data = CompiledData_FELIX_HDF5(traces, compiled_data.wavenumbers, compiled_data.offsets, compiled_data.labels)
+        fullrange = baseline_fullrange(baseline_reference = baseline_reference, interval = interval, target_mass = target_mass, compiled_data = current_data)
+        fullrange.run()
+        spectrum = depletion(mass_complex = list_mass_isotope, scan_width = scan_width, target_mass = target_mass)
+        spectra.append(spectrum.make_depletion_spectra_batch(current_data.wavenumbers, fullrange.sums2.T))
+        memory.append(traces.nbytes)
+        del traces, current_data, fullrange
+
+    table = pd.DataFrame({
+        "wavenumber": spectra[0]["wavenumber"],
+        "sum_withoutIR_float64": spectra[0]["sum_withoutIR"],
+        "sum_withoutIR_"+np.dtype(precision).name: spectra[1]["sum_withoutIR"],
+    })
+    table["deviation"] = table.iloc[:, 2] - table.iloc[:, 1]
+
+    max_abs_deviation = float(table["deviation"].abs().max()) if len(table) else 0.0
+    scale = float(table.iloc[:, 1].abs().max()) if len(table) else 0.0
+    report = {
+        "max_abs_deviation": max_abs_deviation,
+        "max_rel_deviation": max_abs_deviation / scale if scale > 0 else 0.0,
+        "memory_float64": memory[0],
+        "memory_reduced": memory[1],
+        "table": table,
+    }
+    if verbose:
+        print(f"Maximum deviation of the REMPI spectrum ({np.dtype(precision).name} vs float64): {report['max_abs_deviation']:.3e} (relative {report['max_rel_deviation']:.3e})")
+        print(f"Memory of the traces: {memory[0]/1e6:.1f} MB (float64) vs {memory[1]/1e6:.1f} MB ({np.dtype(precision).name})")
+    return report
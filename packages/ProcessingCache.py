@@ -0,0 +1,148 @@
+'''
+This block of code defines a "ProcessingCache" object.
+It keeps the results of the slow processing stages on disk, keyed on the content of the input files and the parameters.
+Every result is a folder of `.npy` files (memory-mapped when loaded), the least recently used results are deleted first.
+By default everything is saved in the `temp\\cache` folder of your data directory.
+'''
+
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+__all__ = ['ProcessingCache']
+
+class ProcessingCache:
+
+    def __init__(self, directory='', max_bytes=4*1024**3, folder=None):
+        self.path = folder if folder is not None else os.path.join(directory, 'temp', 'cache')
+        self.max_bytes = max_bytes # size limit of the cache folder, in bytes
+        self.hash_index_file = os.path.join(self.path, 'file_hashes.json')
+        os.makedirs(self.path, exist_ok=True)
+
+    def file_hash(self, file_name):
+        '''
+        Returns the SHA-256 hash of the content of a file.
+        Hashing a large file takes time, so the hash is remembered together with the size and modification time of the file
+        and only recomputed when one of them changes.
+        '''
+        file_name = os.path.abspath(os.fspath(getattr(file_name, 'filename', file_name)))
+        stat = os.stat(file_name)
+        index = self._read_json(self.hash_index_file, {})
+        entry = index.get(file_name)
+        if entry is not None and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2]
+
+        digest = hashlib.sha256()
+        with open(file_name, 'rb') as file:
+            for chunk in iter(lambda: file.read(16*1024**2), b''):
+                digest.update(chunk)
+        index[file_name] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        self._write_json(self.hash_index_file, index)
+        return digest.hexdigest()
+
+    @staticmethod
+    def array_hash(array):
+        '''
+        Returns the SHA-256 hash of the content of a numpy array, e.g. a calibrated mass axis.
+        '''
+        array = np.ascontiguousarray(np.asarray(array))
+        digest = hashlib.sha256(str((array.shape, array.dtype.str)).encode())
+        digest.update(memoryview(array).cast('B'))
+        return digest.hexdigest()
+
+    @staticmethod
+    def key(*parts):
+        '''
+        Combines hashes and parameters into one key.
+        '''
+        text = json.dumps(parts, default=str, sort_keys=True)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def load(self, key, mmap_mode='r'):
+        '''
+        Returns (arrays, metadata) stored under `key`, or None if there is nothing.
+        '''
+        folder = os.path.join(self.path, key)
+        metadata_file = os.path.join(folder, 'metadata.json')
+        if not os.path.isfile(metadata_file):
+            return None
+        metadata = self._read_json(metadata_file, None)
+        if metadata is None:
+            return None
+        arrays = {name: np.load(os.path.join(folder, name + '.npy'), mmap_mode=mmap_mode) for name in metadata['arrays']}
+        # mark as recently used
+        os.utime(metadata_file)
+        return arrays, metadata['metadata']
+
+    def store(self, key, arrays, metadata=None):
+        '''
+        Saves a dictionary of numpy arrays (and a dictionary of JSON serializable metadata) under `key`.
+        The result is written to a temporary folder first, so an interrupted write never leaves a broken entry.
+        '''
+        folder = os.path.join(self.path, key)
+        temporary = folder + '.tmp' + str(os.getpid())
+        shutil.rmtree(temporary, ignore_errors=True)
+        os.makedirs(temporary)
+        for name, array in arrays.items():
+            np.save(os.path.join(temporary, name + '.npy'), np.asanyarray(array))
+        self._write_json(os.path.join(temporary, 'metadata.json'), {'arrays': list(arrays), 'metadata': metadata or {}, 'created': time.time()})
+        shutil.rmtree(folder, ignore_errors=True)
+        os.replace(temporary, folder)
+        self.evict(keep=key)
+        return folder
+
+    def entries(self):
+        '''
+        Lists all results in the cache as (key, size in bytes, last used) tuples, least recently used first.
+        '''
+        entries = []
+        for key in os.listdir(self.path):
+            metadata_file = os.path.join(self.path, key, 'metadata.json')
+            if not os.path.isfile(metadata_file):
+                continue
+            folder = os.path.join(self.path, key)
+            size = sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder))
+            entries.append((key, size, os.path.getmtime(metadata_file)))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def evict(self, keep=None):
+        '''
+        Deletes the least recently used results until the cache is smaller than `max_bytes`.
+        '''
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for key, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            try:
+                shutil.rmtree(os.path.join(self.path, key))
+                total -= size
+            except OSError:
+                # still memory-mapped somewhere (Windows), try again next time
+                pass
+        return total
+
+    def clear(self):
+        for key, _, _ in self.entries():
+            shutil.rmtree(os.path.join(self.path, key), ignore_errors=True)
+
+    @staticmethod
+    def _read_json(file_name, default):
+        try:
+            with open(file_name) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return default
+
+    @staticmethod
+    def _write_json(file_name, content):
+        temporary = file_name + '.tmp' + str(os.getpid())
+        with open(temporary, 'w') as file:
+            json.dump(content, file)
+        os.replace(temporary, file_name)
@@ -0,0 +1,87 @@
+'''
+This block of code defines a "ReadAhead" object.
+It reads the next items (files, wavenumbers) in background workers while the current one is being processed.
+At most `depth` items and `memory_budget` bytes are read ahead, items come out in the original order.
+The default workers are processes, so `load` must be a module level function and the items must be picklable.
+'''
+
+import collections
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
+
+from .Instrumentation import *
+
+__all__ = ['ReadAhead', 'process_pool']
+
+_NEXT = object() # no item taken from the iterator yet
+_END = object() # the iterator is exhausted
+
+
+def process_pool(workers):
+    '''
+    `ProcessPoolExecutor` whose workers start clean ('forkserver' or 'spawn'), so open h5py files of the main process are not inherited.
+    '''
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+
+
+class ReadAhead:
+
+    def __init__(self, load, items, depth = 2, workers = 1, memory_budget = None, size = None, executor = 'process'):
+        self.load = load # load(item) -> result, runs in a background worker
+        self.items = items
+        self.depth = max(int(depth), 1) # number of items read ahead
+        self.workers = workers
+        self.memory_budget = memory_budget # bytes that may be read ahead and not yet released, None == no limit
+        self.size = size # size(item) -> estimated bytes of the result, needed for `memory_budget`
+        if executor not in ('process', 'thread'):
+            raise ValueError(f"Unknown executor {executor}, use 'process' or 'thread'")
+        self.executor = executor
+        self.max_bytes_in_flight = 0 # largest number of bytes that were read ahead at the same time
+
+    def __iter__(self):
+        '''
+        Yields (item, result) in the order of `items`.
+        The bytes of an item count against the budget until the next item is requested.
+        '''
+        items = iter(self.items)
+        pending = collections.deque() # (item, bytes, future), in order
+        next_item = _NEXT
+        in_flight = 0
+
+        if self.executor == 'process':
+            executor = process_pool(self.workers)
+        else:
+            executor = ThreadPoolExecutor(max_workers=self.workers)
+
+        def fill():
+            # submit reads until `depth` items are pending or the budget is used up
+            nonlocal next_item, in_flight
+            while len(pending) < self.depth:
+                if next_item is _NEXT:
+                    next_item = next(items, _END)
+                if next_item is _END:
+                    return
+                n_bytes = self.size(next_item) if self.size is not None else 0
+                # an item is always read when nothing else is in flight, otherwise there is no progress
+                if self.memory_budget is not None and in_flight > 0 and in_flight + n_bytes > self.memory_budget:
+                    return
+                pending.append((next_item, n_bytes, executor.submit(self.load, next_item)))
+                in_flight += n_bytes
+                self.max_bytes_in_flight = max(self.max_bytes_in_flight, in_flight)
+                next_item = _NEXT
+
+        try:
+            fill()
+            while pending:
+                item, n_bytes, future = pending.popleft()
+                with instrumentation.stage('ReadAhead.wait'):
+                    result = future.result()
+                # start the next reads before the current item is handed over
+                fill()
+                yield item, result
+                del result
+                in_flight -= n_bytes
+                fill()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
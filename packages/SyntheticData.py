@@ -0,0 +1,75 @@
+'''
+This section contains a generator of synthetic FELIX HDF5 files, for testing and benchmarking without beamtime data.
+The files have the layout that `ReadData_FELIX_HDF5` expects, with skipped and doubly measured wavenumbers
+and negative TOF peaks on top of a noisy baseline.
+'''
+
+import os
+
+import h5py
+import numpy as np
+
+__all__ = ['generate_FELIX_HDF5']
+
+def generate_FELIX_HDF5(directory, n_files = 8, n_wavenumbers = 86, n_samples = 100000, wavenumber_start = 530, wavenumber_step = 0.1, \
+                        duplicated = 1, skipped = 1, isotope_peaks = ((393.3, 1.0), (394.3, 0.3)), alpha = 7.7092e-7, t_off = 106, \
+                        n_lines = 5, peak_width = 2.0, baseline_offset = 0.002, noise = 0.0005, dtype = np.float64, compression = 'gzip', seed = 0):
+    '''
+    Writes `n_files` synthetic HDF5 files into `directory` and returns the list of file names.
+
+    `n_wavenumbers` == number of wavenumbers of the scan, starting at `wavenumber_start` in steps of `wavenumber_step`
+    `n_samples` == length of every trace
+    `duplicated`, `skipped` == number of wavenumbers per file that are measured twice / not at all (chosen at random)
+    `isotope_peaks` == (mass in u, relative intensity) of every peak in the mass spectrum
+    `alpha`, `t_off` == mass calibration used to place the peaks, mass = alpha*(x_counts - t_off)**2
+    `n_lines` == number of REMPI lines in the spectrum, the peak intensity follows this spectrum
+    `peak_width` == width (sigma) of the TOF peaks in samples
+    '''
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    wavenumbers = np.round(wavenumber_start + wavenumber_step*np.arange(n_wavenumbers), 4)
+
+    # REMPI spectrum: a few Lorentzian lines on a small background
+    line_positions = rng.uniform(wavenumbers[0], wavenumbers[-1], n_lines)
+    line_widths = rng.uniform(1, 4, n_lines) * wavenumber_step
+    def spectrum(wavenumber):
+        return 0.05 + np.sum(1 / (1 + ((wavenumber - line_positions) / line_widths)**2))
+
+    # position of the peaks on the x-axis (x_counts starts at 1)
+    x_counts = np.arange(1, n_samples + 1, dtype=np.float64)
+    peaks = [(t_off + np.sqrt(mass / alpha), intensity) for mass, intensity in isotope_peaks]
+
+    file_names = []
+    for file_index in range(n_files):
+        # list of measured wavenumbers, with skipped and doubly measured points
+        measured = list(wavenumbers)
+        for _ in range(min(skipped, len(measured) - 1)):
+            del measured[rng.integers(len(measured))]
+        for _ in range(duplicated):
+            position = rng.integers(len(measured))
+            measured.insert(position, measured[position])
+        # the first measurement is where the laser was before the scan
+        measured.insert(0, wavenumbers[-1])
+
+        file_name = os.path.join(directory, f"240404_Data.{file_index:04d}.h5")
+        with h5py.File(file_name, 'w') as file:
+            rawdat = file.create_group('Rawdat')
+            for index, wavenumber in enumerate(measured):
+                group = rawdat.create_group(f"P{index:05d}_{wavenumber:.4f}")
+                group.create_dataset('X', data=np.array([wavenumber]))
+
+                trace = baseline_offset + noise * rng.standard_normal((n_samples, 2))
+                intensity = spectrum(wavenumber) * rng.uniform(0.8, 1.2)
+                for center, relative_intensity in peaks:
+                    # only evaluate the Gaussian close to its center
+                    lo = max(int(center - 8*peak_width), 0)
+                    hi = min(int(center + 8*peak_width) + 1, n_samples)
+                    if lo >= hi:
+                        continue
+                    shape = np.exp(-0.5*((x_counts[lo:hi] - center) / peak_width)**2)
+                    trace[lo:hi, 0] -= 0.01 * relative_intensity * intensity * shape
+                    # with IR irradiation part of the signal is depleted
+                    trace[lo:hi, 1] -= 0.01 * relative_intensity * intensity * shape * rng.uniform(0.5, 1.0)
+                group.create_dataset('Trace', data=trace.astype(dtype), compression=compression)
+        file_names.append(file_name)
+    return file_names
@@ -0,0 +1,120 @@
+'''
+This block of code defines a "TraceSegments" object.
+Segments are the sorted, non-overlapping sample ranges of a TOF trace that are kept: the mass windows of the analysis,
+and optionally every region where a trace rises above the noise.
+The baseline correction and the integration give the same numbers on the compact traces as on the full ones.
+'''
+
+import numpy as np
+
+from .MassCalibration import *
+from .FELIX_HDF5_CompiledData import *
+from .Instrumentation import *
+
+__all__ = ['TraceSegments']
+
+
+def _runs(keep):
+    # (starts, stops) of the runs of True in a boolean array
+    edges = np.diff(np.concatenate([[False], keep, [False]]).astype(np.int8))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+class TraceSegments:
+
+    def __init__(self, starts, stops, n_samples):
+        self.n_samples = n_samples # length of the full traces
+        keep = np.zeros(n_samples, dtype=bool)
+        for start, stop in zip(starts, stops):
+            keep[max(int(start), 0):min(int(stop), n_samples)] = True
+        # overlapping and touching segments are merged
+        self.starts, self.stops = _runs(keep)
+        lengths = self.stops - self.starts
+        self.offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.intp) # first sample of every segment in the compact trace
+        self.rows = np.flatnonzero(keep) # the kept samples of the full trace
+
+    @classmethod
+    def from_mass_windows(cls, mass, windows):
+        '''
+        Segments that cover the mass windows [(mass_min, mass_max), ...] of the calibrated x-axis `mass`.
+        '''
+        mass_axis = MassAxis.from_mass(mass)
+        starts, stops = [], []
+        for mass_min, mass_max in windows:
+            indices = as_slice(mass_axis.window(mass_min, mass_max))
+            if isinstance(indices, slice):
+                starts.append(indices.start)
+                stops.append(indices.stop)
+            else:
+                keep = np.zeros(len(mass_axis), dtype=bool)
+                keep[indices] = True
+                run_starts, run_stops = _runs(keep)
+                starts.extend(run_starts)
+                stops.extend(run_stops)
+        return cls(starts, stops, len(mass_axis))
+
+    @classmethod
+    def for_analysis(cls, mass, baseline_reference, interval, list_mass_isotope, scan_width, margin = 0.0):
+        '''
+        Segments with everything that `baseline_fullrange` and `depletion` use:
+        the baseline range and every isotope +- 2 scan widths (the peak can move one scan width, the integration is one scan width around it).
+        `margin` (in u) keeps some more on both sides of every isotope, e.g. to look at the peaks.
+        '''
+        windows = [(baseline_reference, baseline_reference + interval)]
+        windows += [(isotope - 2*scan_width - margin, isotope + 2*scan_width + margin) for isotope in np.atleast_1d(list_mass_isotope)]
+        return cls.from_mass_windows(mass, windows)
+
+    @classmethod
+    def from_threshold(cls, traces, mass, baseline_reference, interval, threshold = 5.0, padding = 16, block = 64):
+        '''
+        Segments where any trace (column of `traces`, samples x traces) is more than `threshold` standard deviations of its noise
+        above its baseline, widened by `padding` samples on both sides. Peaks are negative in the raw traces, as in `baseline_fullrange`.
+        The mean and the noise of every trace are taken inside [baseline_reference, baseline_reference + interval].
+        '''
+        baseline_rows = as_slice(mass_window(mass, baseline_reference, baseline_reference + interval))
+        above = np.zeros(traces.shape[0], dtype=bool)
+        for start in range(0, traces.shape[1], block):
+            columns = traces[:, start:start+block]
+            reference = columns[baseline_rows]
+            # inverted signal minus its baseline, compared with the noise
+            above |= np.any(reference.mean(axis=0, dtype=np.float64) - columns > threshold * reference.std(axis=0, dtype=np.float64), axis=1)
+        starts, stops = _runs(above)
+        return cls(starts - padding, stops + padding, traces.shape[0])
+
+    def __or__(self, other):
+        if self.n_samples != other.n_samples:
+            raise ValueError(f"Segments of traces with {self.n_samples} and {other.n_samples} samples cannot be combined")
+        return TraceSegments(np.concatenate([self.starts, other.starts]), np.concatenate([self.stops, other.stops]), self.n_samples)
+
+    def compact_mass(self, mass):
+        '''
+        The `MassAxis` of the compact traces: the masses of the kept samples, with the same calibration.
+        '''
+        if isinstance(mass, MassAxis) and mass.alpha is not None and mass.x_counts is not None:
+            return MassAxis(mass.alpha, mass.t_off, x_counts=np.asarray(mass.x_counts)[self.rows])
+        return MassAxis(mass=np.asarray(mass)[self.rows])
+
+    def compact(self, compiled_data):
+        '''
+        Returns a `CompiledData_FELIX_HDF5` with only the kept samples of every trace. The traces are copied.
+        '''
+        traces = np.asfortranarray(compiled_data.traces[self.rows])
+        instrumentation.add_array(traces)
+        return CompiledData_FELIX_HDF5(traces, compiled_data.wavenumbers, compiled_data.offsets, compiled_data.labels,
+                                       compiled_data.file_index, compiled_data.measurement_index)
+
+    def expand(self, data, fill = np.nan):
+        '''
+        Puts compact data (kept samples x ...) back on the full trace, e.g. `baseline_fullrange.sums2` for plotting.
+        The samples that were not kept get `fill`.
+        '''
+        data = np.asarray(data)
+        full = np.full((self.n_samples,) + data.shape[1:], fill, dtype=np.result_type(data, np.asarray(fill)))
+        full[self.rows] = data
+        return full
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __repr__(self):
+        return f"TraceSegments({len(self.starts)} segments, {len(self)} of {self.n_samples} samples)"
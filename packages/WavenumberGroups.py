@@ -0,0 +1,122 @@
+'''
+This block of code defines a "WavenumberGroups" object.
+It decides which measurements of all files belong to the same wavenumber, with one sort over all measurements.
+A group never spans more than `tolerance` and is named after its most frequent reading.
+Skipped and doubly measured wavenumbers per file are reported as tables.
+'''
+
+import numpy as np
+import pandas as pd
+
+__all__ = ['WavenumberGroups']
+
+class WavenumberGroups:
+
+    version = 1 # changes when the same readings and tolerance give other groups, for the keys of cached results
+
+    def __init__(self, wavenumbers_per_file, tolerance = 0.0, skip_first = True, file_labels = None):
+        self.tolerance = tolerance
+        self.file_labels = list(file_labels) if file_labels is not None else [str(index) for index in range(len(wavenumbers_per_file))]
+        start = 1 if skip_first else 0
+
+        values = []
+        file_index = []
+        measurement_index = []
+        for index, wavenumbers in enumerate(wavenumbers_per_file):
+            values.extend(wavenumbers[start:])
+            file_index.extend([index] * max(len(wavenumbers) - start, 0))
+            measurement_index.extend(range(start, len(wavenumbers)))
+        values = np.asarray(values, dtype=np.float64)
+
+        # 1. one stable sort over all measurements, the measurements of one group stay in file order
+        order = np.argsort(values, kind='stable')
+        self.readings = values[order] # measured wavenumber of every measurement, sorted
+        self.file_index = np.asarray(file_index, dtype=np.intp)[order] # file of every measurement
+        self.measurement_index = np.asarray(measurement_index, dtype=np.intp)[order] # index of the measurement within its file
+
+        # 2. every group ends at the first reading more than `tolerance` above its first reading, one binary search per group
+        starts = []
+        first = 0
+        while first < len(self.readings):
+            starts.append(first)
+            first = int(np.searchsorted(self.readings, self.readings[first] + tolerance, side='right'))
+        starts = np.asarray(starts, dtype=np.intp)
+        new_group = np.zeros(len(self.readings), dtype=bool)
+        new_group[starts] = True
+        self.offsets = np.append(starts, len(self.readings)) # measurements of group k are [offsets[k], offsets[k+1])
+        self.group = np.cumsum(new_group) - 1 # group of every measurement
+
+        # 3. name of every group: its most frequent reading, the smallest one if there is a tie
+        self.wavenumbers = self.readings[starts].tolist()
+        if tolerance > 0 and len(starts):
+            new_run = new_group.copy()
+            new_run[1:] |= self.readings[1:] != self.readings[:-1]
+            run_starts = np.flatnonzero(new_run)
+            run_lengths = np.diff(np.append(run_starts, len(self.readings)))
+            run_group = self.group[run_starts]
+            best = np.lexsort((self.readings[run_starts], -run_lengths, run_group))
+            first = np.ones(len(best), dtype=bool)
+            first[1:] = run_group[best][1:] != run_group[best][:-1]
+            self.wavenumbers = self.readings[run_starts[best[first]]].tolist()
+
+    @classmethod
+    def from_readers(cls, readers, tolerance = 0.0, skip_first = True, file_labels = None):
+        '''
+        Groups the wavenumbers of a list of `ReadData_FELIX_HDF5` objects (after `extract_data` or `extract_wavenumbers`).
+        '''
+        return cls([reader.wavenumbers for reader in readers], tolerance, skip_first, file_labels)
+
+    def members(self, k):
+        '''
+        Returns the (file index, measurement index) of every measurement of group k, in file order.
+        '''
+        members = slice(self.offsets[k], self.offsets[k+1])
+        return list(zip(self.file_index[members].tolist(), self.measurement_index[members].tolist()))
+
+    def counts(self):
+        '''
+        Number of measurements of every group in every file, (groups x files).
+        '''
+        counts = np.zeros((len(self.wavenumbers), len(self.file_labels)), dtype=np.intp)
+        np.add.at(counts, (self.group, self.file_index), 1)
+        return counts
+
+    def table(self):
+        '''
+        One row per wavenumber with the number of measurements in every file, 0 == skipped and 2 or more == doubly measured.
+        `spread` is the difference between the largest and smallest reading that were merged, at most `tolerance`.
+        '''
+        table = pd.DataFrame(self.counts(), columns=self.file_labels)
+        table.insert(0, "wavenumber", self.wavenumbers)
+        starts = self.offsets[:-1]
+        stops = self.offsets[1:] - 1
+        table["measurements"] = np.diff(self.offsets)
+        table["spread"] = self.readings[stops] - self.readings[starts] if len(starts) else np.zeros(0)
+        return table
+
+    def _long_table(self, selection):
+        counts = self.counts()
+        group, file = np.nonzero(selection(counts))
+        return pd.DataFrame({
+            "wavenumber": np.asarray(self.wavenumbers, dtype=np.float64)[group],
+            "file": [self.file_labels[index] for index in file],
+            "measurements": counts[group, file],
+        })
+
+    def skipped(self):
+        '''
+        The wavenumbers that were not measured in a file, one row per (wavenumber, file).
+        '''
+        return self._long_table(lambda counts: counts == 0)
+
+    def doubled(self):
+        '''
+        The wavenumbers that were measured more than once in a file, one row per (wavenumber, file).
+        '''
+        return self._long_table(lambda counts: counts > 1)
+
+    def __len__(self):
+        return len(self.wavenumbers)
+
+    def __repr__(self):
+        return f"WavenumberGroups({len(self)} wavenumbers from {len(self.readings)} measurements, tolerance={self.tolerance})"
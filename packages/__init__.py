@@ -1,5 +1,21 @@
 # specifies which classes or functions should be imported when using `from module import *`.
+from .Instrumentation import *
+from .MassCalibration import *
+from .WavenumberGroups import *
+from .ProcessingCache import *
+from .ReadAhead import *
 from .FELIX_HDF5_ReadData import *
+from .FELIX_HDF5_CompiledData import *
+from .FELIX_HDF5_Scratch import *
 from .FELIX_HDF5_ProcessData import *
 from .BaselineCorrection import *
-from .DepletionCalculator import *
\ No newline at end of file
+from .DepletionCalculator import *
+from .TraceSegments import *
+from .FELIX_HDF5_Streaming import *
+from .FELIX_HDF5_LiveMonitor import *
+from .FELIX_HDF5_Export import *
+from .FELIX_HDF5_Pipeline import *
+from .FELIX_HDF5_LazyPipeline import *
+from .PrecisionComparison import *
+from .SyntheticData import *
+from .MassSpectraPlot import *
@@ -0,0 +1,10 @@
+'''
+Command line entry point of the REMPI pipeline, see `FELIX_HDF5_Pipeline.py`:
+    python -m packages config.json --workers 8
+'''
+
+import sys
+
+from .FELIX_HDF5_Pipeline import main
+
+sys.exit(main())
@@ -0,0 +1,93 @@
+'''
+Shared fixtures of the tests: a few small synthetic FELIX HDF5 files (see `packages/SyntheticData.py`),
+the loops of the notebook and the in-memory batch pipeline that the other implementations are compared with.
+The benchmark uses the same loops.
+
+Run from the main folder of the repository:
+    python -m pytest tests
+'''
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from packages import *
+
+# calibration of the synthetic files and analysis settings, the isotopes are around sample 22700
+ALPHA, T_OFF = 7.7092e-7, 106
+N_SAMPLES = 23000
+BASELINE_REFERENCE, INTERVAL = 390, 0.5
+LIST_MASS_ISOTOPE, SCAN_WIDTH = [393.3, 394.3], 0.1
+
+
+def baseline_loop(compiled_data, baseline_reference, interval, x_mass):
+    # the full range baseline loop of the notebook, over every column
+    fullrange = baseline(baseline_reference = baseline_reference, interval = interval, target_mass = x_mass)
+    output = {}
+    for wavenumber in compiled_data:
+        table = compiled_data[wavenumber]
+        for i in range(len(table.columns)):
+            fullrange.wavenumber = wavenumber
+            fullrange.column_withoutIR = table.columns[i]
+            fullrange.data_withoutIR = table.iloc[:, i]
+            fullrange.baseline_range()
+            fullrange.baseline_mean()
+            fullrange.baseline_correction()
+            fullrange.baseline_compile()
+        fullrange.baseline_sum()
+        output[wavenumber] = fullrange.baseline_sum_correction()
+    return output
+
+
+def depletion_loop(tables, list_mass_isotope, scan_width, x_mass):
+    # the multi peak depletion loop of the notebook
+    spectrum = depletion(mass_complex = list_mass_isotope, scan_width = scan_width, target_mass = x_mass)
+    output = None
+    for wavenumber in tables:
+        spectrum.wavenumber = wavenumber
+        spectrum.data_withoutIR = tables[wavenumber].iloc[:, -1]
+        output = spectrum.make_depletion_spectra_multi_peak()
+    return output
+
+
+def batch_spectrum(compiled_data, mass_axis, list_mass_isotope = LIST_MASS_ISOTOPE, scan_width = SCAN_WIDTH, baseline_reference = BASELINE_REFERENCE, interval = INTERVAL):
+    # the in-memory pipeline: baseline_fullrange + make_depletion_spectra_batch, the spectrum is `spectrum.depletion_spectra`
+    fullrange = baseline_fullrange(baseline_reference = baseline_reference, interval = interval, target_mass = mass_axis, compiled_data = compiled_data)
+    fullrange.run()
+    spectrum = depletion(mass_complex = list_mass_isotope, scan_width = scan_width, target_mass = mass_axis)
+    spectrum.make_depletion_spectra_batch(compiled_data.wavenumbers, fullrange.sums2.T)
+    return fullrange, spectrum
+
+
+def make_config(files, output_directory, **settings):
+    # a config of `run_REMPI_pipeline` with the settings of the tests
+    return {"files": list(files), "output_directory": str(output_directory), "calibration": {"alpha": ALPHA, "t_off": T_OFF},
+            "baseline": {"reference": BASELINE_REFERENCE, "interval": INTERVAL}, "isotopes": LIST_MASS_ISOTOPE, "scan_width": SCAN_WIDTH,
+            "name": "test", **settings}
+
+
+@pytest.fixture(scope='session')
+def synthetic_files(tmp_path_factory):
+    # 3 files x 8 wavenumbers, with a skipped and a doubly measured wavenumber per file
+    directory = tmp_path_factory.mktemp('synthetic')
+    return generate_FELIX_HDF5(str(directory), n_files = 3, n_wavenumbers = 8, n_samples = N_SAMPLES, alpha = ALPHA, t_off = T_OFF, seed = 1)
+
+
+@pytest.fixture(scope='session')
+def compiled_data(synthetic_files):
+    raw_data = ProcessData_FELIX_HDF5(synthetic_files)
+    raw_data.extract_FELIX_data()
+    return raw_data.compile_FELIX_data()
+
+
+@pytest.fixture(scope='session')
+def mass_axis():
+    return MassAxis(ALPHA, T_OFF, N_SAMPLES)
+
+
+@pytest.fixture(scope='session')
+def batch(compiled_data, mass_axis):
+    # (baseline_fullrange, depletion) of the batch pipeline with the default settings, do not change them
+    return batch_spectrum(compiled_data, mass_axis)
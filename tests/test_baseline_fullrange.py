@@ -0,0 +1,24 @@
+import numpy as np
+
+from packages import *
+from conftest import BASELINE_REFERENCE, INTERVAL, baseline_loop
+
+
+def test_fullrange_equals_baseline_loop(compiled_data, mass_axis):
+    expected = baseline_loop(compiled_data, BASELINE_REFERENCE, INTERVAL, np.asarray(mass_axis))
+    fullrange = baseline_fullrange(baseline_reference = BASELINE_REFERENCE, interval = INTERVAL, target_mass = mass_axis, compiled_data = compiled_data)
+    tables = fullrange.run()
+
+    assert list(tables) == list(expected)
+    for wavenumber, table in expected.items():
+        assert list(tables[wavenumber].columns) == list(table.columns)
+        np.testing.assert_array_equal(tables[wavenumber].to_numpy(), table.to_numpy())
+
+
+def test_fullrange_with_mass_array(compiled_data, mass_axis):
+    # a plain x_mass array (index arrays instead of slices) gives the same sums as the MassAxis
+    with_axis = baseline_fullrange(baseline_reference = BASELINE_REFERENCE, interval = INTERVAL, target_mass = mass_axis, compiled_data = compiled_data)
+    with_array = baseline_fullrange(baseline_reference = BASELINE_REFERENCE, interval = INTERVAL, target_mass = np.asarray(mass_axis), compiled_data = compiled_data)
+    with_axis.run()
+    with_array.run()
+    np.testing.assert_array_equal(with_array.sums2, with_axis.sums2)
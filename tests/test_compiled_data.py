@@ -0,0 +1,43 @@
+import h5py
+import numpy as np
+import pandas as pd
+
+from packages import *
+
+
+def old_compile(files, data):
+    # the dictionary of the original compile_FELIX_data, with pd.concat for every repeated wavenumber
+    compiled_data = {}
+    for file_index, file in enumerate(files):
+        for wavenumber in range(1, len(data[file_index].wavenumbers)):
+            current_file = data[file_index]
+            current_wavenumber = current_file.wavenumbers[wavenumber]
+            signal_withoutIR = current_file.signal[wavenumber][:, 0]
+            label_withoutIR = str(current_wavenumber)+"_"+file.filename[-12:-3]+"_withoutIR"
+            new_data = pd.DataFrame({label_withoutIR: signal_withoutIR})
+            if current_wavenumber not in compiled_data:
+                compiled_data[current_wavenumber] = new_data
+            else:
+                compiled_data[current_wavenumber] = pd.concat([compiled_data[current_wavenumber], new_data], axis=1)
+    return compiled_data
+
+
+def test_mapping_equals_concat_dictionary(synthetic_files):
+    files = [h5py.File(file_name, 'r') for file_name in synthetic_files]
+    try:
+        raw_data = ProcessData_FELIX_HDF5(files)
+        raw_data.extract_FELIX_data(verbose = False)
+        compiled_data = raw_data.compile_FELIX_data()
+        expected = old_compile(files, raw_data.data)
+    finally:
+        for file in files:
+            file.close()
+
+    assert sorted(compiled_data) == sorted(expected)
+    assert list(compiled_data) == sorted(expected)
+    # the synthetic files have doubly measured wavenumbers, which give two columns with the same label
+    assert any(table.columns.duplicated().any() for table in expected.values())
+    for wavenumber, table in expected.items():
+        assert list(compiled_data[wavenumber].columns) == list(table.columns)
+        np.testing.assert_array_equal(compiled_data[wavenumber].to_numpy(), table.to_numpy())
+        assert np.shares_memory(compiled_data[wavenumber].to_numpy(), compiled_data.traces)
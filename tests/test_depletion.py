@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from packages import *
+from conftest import LIST_MASS_ISOTOPE, SCAN_WIDTH, depletion_loop
+
+
+@pytest.fixture(scope='module')
+def fullrange(batch):
+    return batch[0]
+
+
+def test_batch_equals_multi_peak_loop(mass_axis, fullrange, batch):
+    expected = depletion_loop(fullrange.compiled_data2, LIST_MASS_ISOTOPE, SCAN_WIDTH, np.asarray(mass_axis))
+    actual = batch[1].depletion_spectra
+    assert list(actual.columns) == list(expected.columns)
+    np.testing.assert_array_equal(actual.to_numpy(), expected.to_numpy())
+
+
+def test_grid_agrees_with_isotope_windows(compiled_data, mass_axis, fullrange):
+    # a light messenger keeps Fe1-Ar1 on the short synthetic mass axis, Fe2 is beyond its end
+    complexes = complex_grid([1, 2], [0, 1], 393.3, 1.0, isotope_offsets = (0, 1))
+    complexes["outside"] = [393.3, 2000.0]
+    spectrum = depletion(scan_width = SCAN_WIDTH, target_mass = mass_axis)
+    table = spectrum.make_depletion_spectra_grid(compiled_data.wavenumbers, fullrange.sums2.T, complexes)
+
+    assert list(table.columns) == ["wavenumber", "Fe1-Ar0", "Fe1-Ar1", "Fe2-Ar0", "Fe2-Ar1", "outside"]
+    assert table[["Fe2-Ar0", "Fe2-Ar1", "outside"]].isna().all().all()
+    expected, _, _ = integrate_isotope_windows(fullrange.sums2.T, mass_axis, complexes["Fe1-Ar0"], SCAN_WIDTH)
+    np.testing.assert_allclose(table["Fe1-Ar0"].to_numpy(), expected, rtol = 1e-12)
+    expected, _, _ = integrate_isotope_windows(fullrange.sums2.T, mass_axis, complexes["Fe1-Ar1"], SCAN_WIDTH)
+    np.testing.assert_allclose(table["Fe1-Ar1"].to_numpy(), expected, rtol = 1e-12)
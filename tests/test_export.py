@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from packages import *
+from conftest import ALPHA, T_OFF, BASELINE_REFERENCE, INTERVAL, LIST_MASS_ISOTOPE, SCAN_WIDTH
+
+
+@pytest.fixture(scope='module')
+def exported(batch, tmp_path_factory):
+    fullrange, spectrum = batch
+    file_name = export_FELIX_HDF5(str(tmp_path_factory.mktemp('export') / 'processed.h5'), fullrange = fullrange, spectrum = spectrum)
+    with ExportedData_FELIX_HDF5(file_name) as exported:
+        yield exported
+
+
+@pytest.mark.parametrize('wavenumber_min, wavenumber_max', [(None, None), (530.2, 530.5), (530.25, 530.25), (529.0, 530.0), (530.7, None)])
+def test_round_trip_of_a_range(exported, batch, wavenumber_min, wavenumber_max):
+    fullrange, spectrum = batch
+    compiled_data = fullrange.compiled_data
+    wavenumbers = np.asarray(compiled_data.wavenumbers)
+    selected = [wavenumber for wavenumber in compiled_data.wavenumbers
+                if (wavenumber_min is None or wavenumber >= wavenumber_min) and (wavenumber_max is None or wavenumber <= wavenumber_max)]
+    ks = np.flatnonzero(np.isin(wavenumbers, selected))
+
+    expected = compiled_data.select(selected)
+    actual = exported.compiled(wavenumber_min, wavenumber_max)
+    assert list(actual.wavenumbers) == selected
+    assert actual.labels == expected.labels
+    np.testing.assert_array_equal(actual.offsets, expected.offsets)
+    np.testing.assert_array_equal(actual.file_index, expected.file_index)
+    np.testing.assert_array_equal(actual.measurement_index, expected.measurement_index)
+    np.testing.assert_array_equal(actual.traces, expected.traces)
+    assert actual.traces.flags.f_contiguous
+
+    columns = np.concatenate([np.arange(compiled_data.offsets[k], compiled_data.offsets[k+1]) for k in ks]) if len(ks) else np.zeros(0, dtype=int)
+    np.testing.assert_array_equal(exported.mean_values(wavenumber_min, wavenumber_max), fullrange.mean_values[columns])
+    for name in ('sums', 'sums2'):
+        actual_wavenumbers, sums = getattr(exported, name)(wavenumber_min, wavenumber_max)
+        np.testing.assert_array_equal(actual_wavenumbers, selected)
+        np.testing.assert_array_equal(sums, getattr(fullrange, name)[:, ks])
+
+    depletion_spectra = exported.depletion_spectra(wavenumber_min, wavenumber_max)
+    assert list(depletion_spectra.columns) == list(spectrum.depletion_spectra.columns)
+    np.testing.assert_array_equal(depletion_spectra.to_numpy(), spectrum.depletion_spectra.to_numpy()[ks])
+    np.testing.assert_array_equal(exported.peak_masses(wavenumber_min, wavenumber_max), np.asarray(spectrum.peak_masses)[ks])
+
+
+def test_mass_axis_and_metadata(exported, mass_axis):
+    axis = exported.mass_axis()
+    np.testing.assert_array_equal(np.asarray(axis), np.asarray(mass_axis))
+    assert (axis.alpha, axis.t_off) == (ALPHA, T_OFF)
+    # every part keeps its own settings
+    assert exported.metadata['calibration'] == {'alpha': ALPHA, 't_off': T_OFF}
+    assert exported.metadata['baseline'] == {'baseline_reference': BASELINE_REFERENCE, 'interval': INTERVAL}
+    assert exported.metadata['depletion'] == {'isotopes': LIST_MASS_ISOTOPE, 'scan_width': SCAN_WIDTH}
+
+
+def test_missing_parts_raise(batch, tmp_path):
+    fullrange, spectrum = batch
+    with ExportedData_FELIX_HDF5(export_FELIX_HDF5(str(tmp_path / 'spectrum.h5'), spectrum = spectrum)) as exported:
+        assert len(exported.depletion_spectra()) == len(spectrum.depletion_spectra)
+        for read, part in ((exported.compiled, 'compiled'), (exported.sums, 'baseline'), (exported.sums2, 'baseline'), (exported.mean_values, 'baseline')):
+            with pytest.raises(ValueError, match=f"no '{part}' part"):
+                read()
+    with ExportedData_FELIX_HDF5(export_FELIX_HDF5(str(tmp_path / 'compiled.h5'), compiled_data = fullrange.compiled_data)) as exported:
+        assert len(exported.compiled().wavenumbers) == len(fullrange.compiled_data)
+        for read, part in ((exported.depletion_spectra, 'depletion'), (exported.peak_masses, 'depletion'), (exported.mass_axis, 'calibration')):
+            with pytest.raises(ValueError, match=f"no '{part}' part"):
+                read()
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from packages import *
+from conftest import BASELINE_REFERENCE, INTERVAL
+
+
+def test_stages_and_decoded_bytes(synthetic_files, mass_axis):
+    enable_instrumentation()
+    try:
+        raw_data = ProcessData_FELIX_HDF5(synthetic_files)
+        raw_data.extract_FELIX_data()
+        compiled_data = raw_data.compile_FELIX_data()
+        baseline_fullrange(baseline_reference = BASELINE_REFERENCE, interval = INTERVAL, target_mass = mass_axis, compiled_data = compiled_data).run()
+    finally:
+        disable_instrumentation()
+
+    summary = instrumentation_summary().set_index("stage")
+    assert summary.loc["extract_FELIX_data", "MB_decoded"] * 1e6 == sum(reader.signal.nbytes for reader in raw_data.data)
+    assert summary.loc["baseline_fullrange.run", "calls"] == 1
+    # lookups are not stages
+    assert "mass_window" not in summary.index
+    assert "baseline_fullrange.baseline_range" not in summary.index
+
+
+def test_disabled_records_nothing(synthetic_files):
+    reset_instrumentation()
+    ProcessData_FELIX_HDF5(synthetic_files[:1]).extract_FELIX_data()
+    assert len(instrumentation_summary()) == 0
+
+
+def test_rss_change_per_stage():
+    enable_instrumentation()
+    try:
+        with instrumentation.stage("allocate"):
+            kept = np.ones(50_000_000 // 8)
+        with instrumentation.stage("nothing"):
+            pass
+    finally:
+        disable_instrumentation()
+    if instrumentation.records[0]["rss_change_MB"] is None:
+        pytest.skip("the resident memory cannot be read here")
+    summary = instrumentation_summary().set_index("stage")
+    assert summary.loc["allocate", "rss_change_MB"] > 40
+    assert abs(summary.loc["nothing", "rss_change_MB"]) < 10
+    # the process peak does not go down for a later stage
+    assert summary.loc["nothing", "process_peak_rss_MB"] >= summary.loc["allocate", "process_peak_rss_MB"]
+    del kept
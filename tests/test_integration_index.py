@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from packages import *
+from conftest import BASELINE_REFERENCE, INTERVAL, LIST_MASS_ISOTOPE, SCAN_WIDTH, batch_spectrum
+
+
+@pytest.fixture(scope='module')
+def index(compiled_data, mass_axis):
+    return integration_index(compiled_data, mass_axis)
+
+
+def test_spectrum_matches_batch(index, batch):
+    fullrange, spectrum = batch
+    expected = spectrum.depletion_spectra
+    np.testing.assert_allclose(index.sums2(BASELINE_REFERENCE, INTERVAL), fullrange.sums2, rtol = 1e-12, atol = 1e-15)
+    actual = index.spectrum(LIST_MASS_ISOTOPE, SCAN_WIDTH, BASELINE_REFERENCE, INTERVAL)
+    np.testing.assert_array_equal(actual["wavenumber"], expected["wavenumber"])
+    np.testing.assert_allclose(actual["sum_withoutIR"], expected["sum_withoutIR"], rtol = 1e-12)
+
+
+def test_sweep_matches_batch(compiled_data, mass_axis, index):
+    isotope_sets, scan_widths, references, intervals = [LIST_MASS_ISOTOPE, [393.3]], [0.05, 0.2], [385, 390], [0.5, 2]
+    table = index.sweep(isotope_sets, scan_widths, references, intervals)
+    assert len(table) == 16 * len(compiled_data)
+    for (isotopes, scan_width, reference, interval), rows in table.groupby(["isotopes", "scan_width", "baseline_reference", "interval"]):
+        _, expected = batch_spectrum(compiled_data, mass_axis, isotope_sets[isotopes], scan_width, reference, interval)
+        np.testing.assert_allclose(rows["sum_withoutIR"].to_numpy(), expected.depletion_spectra["sum_withoutIR"].to_numpy(), rtol = 1e-12)
+
+
+def test_bootstrap_resamples_match_recomputed(compiled_data, mass_axis, index):
+    n_resamples, seed = 4, 7
+    table = index.bootstrap(LIST_MASS_ISOTOPE, SCAN_WIDTH, BASELINE_REFERENCE, INTERVAL, n_resamples = n_resamples, seed = seed)
+    assert (table["lower"] <= table["upper"]).all()
+
+    # redo every resample by correcting and integrating the drawn traces, with the windows of the full data
+    rng = np.random.default_rng(seed)
+    windows = [index.peaks(isotope, SCAN_WIDTH) for isotope in LIST_MASS_ISOTOPE]
+    offsets = compiled_data.offsets
+    for k, wavenumber in enumerate(compiled_data.wavenumbers):
+        block = compiled_data.traces[:, offsets[k]:offsets[k+1]]
+        counts = rng.multinomial(block.shape[1], np.full(block.shape[1], 1/block.shape[1]), size = n_resamples)
+        for r in range(n_resamples):
+            traces = np.asfortranarray(np.repeat(block, counts[r], axis = 1))
+            resample = CompiledData_FELIX_HDF5(traces, [wavenumber], [0, traces.shape[1]], [str(column) for column in range(traces.shape[1])])
+            fullrange = baseline_fullrange(baseline_reference = BASELINE_REFERENCE, interval = INTERVAL, target_mass = mass_axis, compiled_data = resample)
+            fullrange.run()
+            expected = sum(fullrange.sums2[start[k]:stop[k], 0].sum() for _, start, stop in windows)
+            np.testing.assert_allclose(index.bootstrap_resamples[r, k], expected, rtol = 1e-10)
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from packages import *
+from conftest import ALPHA, T_OFF, BASELINE_REFERENCE, INTERVAL, LIST_MASS_ISOTOPE, SCAN_WIDTH, batch_spectrum
+
+
+def make_pipeline(synthetic_files):
+    return LazyPipeline_FELIX_HDF5(synthetic_files, alpha = ALPHA, t_off = T_OFF, baseline_reference = BASELINE_REFERENCE, interval = INTERVAL,
+                                   list_mass_isotope = LIST_MASS_ISOTOPE, scan_width = SCAN_WIDTH)
+
+
+def test_spectrum_equals_batch_and_set_recomputes_downstream(synthetic_files, compiled_data, mass_axis, batch):
+    pipeline = make_pipeline(synthetic_files)
+    assert pipeline.history == []
+    _, expected = batch
+    np.testing.assert_array_equal(pipeline.spectrum().to_numpy(), expected.depletion_spectra.to_numpy())
+    np.testing.assert_array_equal(pipeline.peak_masses(), expected.peak_masses)
+    n = len(compiled_data)
+    assert pipeline.history == [('compiled', n), ('mass_axis', None), ('baseline', n), ('spectrum', n)]
+
+    # the same value keeps everything, a new scan width only integrates again
+    assert pipeline.set(scan_width = SCAN_WIDTH) == []
+    assert pipeline.set(scan_width = 0.2) == ['spectrum']
+    _, expected = batch_spectrum(compiled_data, mass_axis, scan_width = 0.2)
+    np.testing.assert_array_equal(pipeline.spectrum().to_numpy(), expected.depletion_spectra.to_numpy())
+    assert pipeline.history[4:] == [('spectrum', n)]
+
+    assert pipeline.set(interval = 0.4) == ['baseline', 'spectrum']
+    assert pipeline.set(n_samples = 20000) == ['compiled', 'mass_axis', 'baseline', 'spectrum']
+    with pytest.raises(TypeError, match="Unknown parameters"):
+        pipeline.set(scanwidth = 0.1)
+
+
+def test_subset_of_wavenumbers_gives_the_same_values(synthetic_files, compiled_data, batch):
+    pipeline = make_pipeline(synthetic_files)
+    expected = batch[1].depletion_spectra.set_index("wavenumber")["sum_withoutIR"]
+    wavenumbers = list(compiled_data.wavenumbers)
+
+    subset = wavenumbers[3:6]
+    np.testing.assert_array_equal(pipeline.spectrum(subset)["sum_withoutIR"].to_numpy(), expected[subset].to_numpy())
+    assert pipeline.history[-2:] == [('baseline', 3), ('spectrum', 3)]
+
+    # the rest follows when needed, in any order
+    reordered = wavenumbers[::-1]
+    np.testing.assert_array_equal(pipeline.spectrum(reordered)["sum_withoutIR"].to_numpy(), expected[reordered].to_numpy())
+    assert pipeline.history[-2:] == [('baseline', len(wavenumbers) - 3), ('spectrum', len(wavenumbers) - 3)]
+    np.testing.assert_array_equal(pipeline.sums2(reordered)[:, ::-1], pipeline.sums2())
@@ -0,0 +1,93 @@
+import os
+import shutil
+
+import h5py
+import numpy as np
+import pytest
+
+from packages import *
+from conftest import BASELINE_REFERENCE, INTERVAL, LIST_MASS_ISOTOPE, SCAN_WIDTH
+
+
+def live(directory, mass_axis, **options):
+    return LiveData_FELIX_HDF5(str(directory), target_mass = mass_axis, baseline_reference = BASELINE_REFERENCE, interval = INTERVAL,
+                               list_mass_isotope = LIST_MASS_ISOTOPE, scan_width = SCAN_WIDTH, wait_for_complete = False, **options)
+
+
+@pytest.mark.parametrize('prefetch', [None, 2])
+def test_live_equals_batch(synthetic_files, mass_axis, batch, tmp_path, prefetch):
+    expected = batch[1].depletion_spectra
+
+    monitor = live(tmp_path, mass_axis, prefetch = prefetch)
+    # the files arrive one after the other
+    for file in synthetic_files:
+        shutil.copy(file, tmp_path)
+        assert monitor.poll() == [os.path.join(str(tmp_path), os.path.basename(file))]
+    assert monitor.poll() == []
+    # the running sums add the traces of a wavenumber file by file, the batch one by one
+    np.testing.assert_allclose(monitor.depletion_spectra.to_numpy(), expected.to_numpy(), rtol = 1e-12)
+
+
+@pytest.mark.parametrize('prefetch', [None, 2])
+def test_short_traces_are_not_ready(synthetic_files, mass_axis, tmp_path, prefetch):
+    monitor = live(tmp_path, mass_axis, prefetch = prefetch)
+    shutil.copy(synthetic_files[0], tmp_path)
+    assert len(monitor.poll()) == 1
+
+    # a file that is still being written has shorter traces than the first file
+    partial = generate_FELIX_HDF5(str(tmp_path / 'partial'), n_files = 1, n_wavenumbers = 3, n_samples = 1000)[0]
+    shutil.move(partial, tmp_path / 'zz_Data.0099.h5')
+    assert monitor.watch(poll_interval = 0, max_polls = 2) is monitor.depletion_spectra
+    assert monitor.files == [os.path.join(str(tmp_path), os.path.basename(synthetic_files[0]))]
+    assert monitor.seen == set(monitor.files)
+
+
+def test_failed_file_is_not_half_added(synthetic_files, mass_axis, tmp_path, capsys):
+    reference = live(tmp_path / 'reference', mass_axis)
+    os.makedirs(tmp_path / 'reference')
+    shutil.copy(synthetic_files[0], tmp_path / 'reference')
+    reference.poll()
+
+    # read ahead in the same poll as the first file, the short file is read before the number of samples is known
+    # its first wavenumbers are new, the later ones were in the first file
+    shutil.copy(synthetic_files[0], tmp_path)
+    partial = generate_FELIX_HDF5(str(tmp_path / 'partial'), n_files = 1, n_wavenumbers = 5, wavenumber_start = 529.8, n_samples = 22900)[0]
+    shutil.move(partial, tmp_path / 'zz_Data.0099.h5')
+    monitor = live(tmp_path, mass_axis, prefetch = 2, max_retries = 3)
+    for _ in range(5):
+        monitor.poll()
+    assert monitor.n_samples == reference.n_samples
+    assert sorted(monitor.sums) == sorted(reference.sums)
+    for wavenumber, sums in reference.sums.items():
+        np.testing.assert_array_equal(monitor.sums[wavenumber], sums)
+        assert monitor.counts[wavenumber] == reference.counts[wavenumber]
+
+    # reported once after 3 failed polls and left out until the file changes
+    assert capsys.readouterr().out.count("zz_Data.0099.h5") == 1
+    assert monitor.retries[str(tmp_path / 'zz_Data.0099.h5')] == 3
+    shutil.copy(synthetic_files[1], tmp_path / 'zz_Data.0099.h5')
+    assert monitor.poll() == [str(tmp_path / 'zz_Data.0099.h5')]
+    assert monitor.failed == {}
+
+
+def test_corrupt_file_is_left_out(synthetic_files, mass_axis, tmp_path, capsys):
+    with h5py.File(tmp_path / 'broken.h5', 'w') as file:
+        file.create_group('Other')
+    monitor = live(tmp_path, mass_axis, max_retries = 2)
+    for _ in range(4):
+        assert monitor.poll() == []
+    assert list(monitor.failed) == [str(tmp_path / 'broken.h5')]
+    assert isinstance(monitor.failed[str(tmp_path / 'broken.h5')][1], KeyError)
+    assert "broken.h5" in capsys.readouterr().out
+
+
+def test_known_wavenumber_is_the_nearest(mass_axis, tmp_path):
+    monitor = live(tmp_path, mass_axis, tolerance = 0.02)
+    rng = np.random.default_rng(0)
+    known = np.round(530 + 0.1*np.arange(50) + rng.uniform(-0.005, 0.005, 50), 4)
+    monitor.sums = {wavenumber: None for wavenumber in known}
+    monitor.known = np.sort(known)
+    for wavenumber in np.round(rng.uniform(529.9, 535.1, 200), 4):
+        nearest = min(monitor.sums, key=lambda value: abs(value - wavenumber))
+        expected = nearest if abs(nearest - wavenumber) <= 0.02 else wavenumber
+        assert monitor.known_wavenumber(wavenumber) == expected
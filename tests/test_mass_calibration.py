@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from packages import *
+from conftest import ALPHA, T_OFF
+
+
+@pytest.mark.parametrize('mass_min, mass_max', [(390, 390.5), (393.2, 393.4), (0, 0.01), (0, 50), (5000, 6000), (394.3, 394.3)])
+def test_window_matches_where(mass_min, mass_max):
+    x_mass = ALPHA*(np.linspace(1, 60000, 60000) - T_OFF)**2
+    mass_axis = MassAxis(ALPHA, T_OFF, 60000)
+    expected = np.where((x_mass >= mass_min) & (x_mass <= mass_max))[0]
+    np.testing.assert_array_equal(np.arange(60000)[mass_axis.window(mass_min, mass_max)], expected)
+    np.testing.assert_array_equal(np.asarray(mass_axis), x_mass)
+
+
+def test_index_range_matches_window():
+    mass_axis = MassAxis(ALPHA, T_OFF, 60000)
+    mass_min = np.array([390, 393.2, 394.2])
+    start, stop = mass_axis.index_range(mass_min, mass_min + 0.2)
+    for k in range(len(mass_min)):
+        assert slice(start[k], stop[k]) == mass_axis.window(mass_min[k], mass_min[k] + 0.2)
+
+
+def test_array_copy_leaves_the_axis():
+    mass_axis = MassAxis(ALPHA, T_OFF, 60000)
+    window = mass_axis.window(393.2, 393.4)
+    copy = np.array(mass_axis)
+    copy[:] = 0
+    assert np.asarray(mass_axis).max() > 0
+    assert mass_axis.window(393.2, 393.4) == window
+    assert np.asarray(mass_axis) is mass_axis.mass
+    assert np.asarray(mass_axis, dtype=np.float32).dtype == np.float32
+    np.testing.assert_array_equal(np.array(mass_axis, copy=True, dtype=np.float64), mass_axis.mass)
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from packages import *
+from conftest import ALPHA, T_OFF, N_SAMPLES
+
+
+@pytest.fixture(scope='module')
+def spiked():
+    # noise with one narrow spike up and one down in every trace, at different places
+    rng = np.random.default_rng(0)
+    traces = rng.normal(scale=0.01, size=(N_SAMPLES, 5))
+    spikes = rng.integers(1000, N_SAMPLES - 1000, size=(2, 5))
+    traces[spikes[0], np.arange(5)] = 1.0
+    traces[spikes[1], np.arange(5)] = -1.0
+    return MassAxis(ALPHA, T_OFF, N_SAMPLES), traces, spikes
+
+
+def test_spikes_survive_every_level(spiked):
+    mass_axis, traces, spikes = spiked
+    pyramid = DecimationPyramid(mass_axis, traces, factor = 4, min_buckets = 16)
+    assert len(pyramid.levels) >= 3
+    for bucket_size, lo, hi in pyramid.levels:
+        for index in range(traces.shape[1]):
+            assert hi[spikes[0, index] // bucket_size, index] == spikes[0, index]
+            assert lo[spikes[1, index] // bucket_size, index] == spikes[1, index]
+    for n_points in (20, 100, 1000, 5000):
+        for x, y in pyramid.decimate(n_points = n_points):
+            assert y.max() == 1.0 and y.min() == -1.0
+
+
+@pytest.mark.parametrize('n_points', [50, 301, 2000])
+@pytest.mark.parametrize('window', [(None, None), (10, 400), (393.0, 394.5)])
+def test_pyramid_equals_raw_decimation(spiked, n_points, window):
+    mass_axis, traces, _ = spiked
+    pyramid = DecimationPyramid(mass_axis, traces, min_buckets = 16)
+    start, stop = pyramid.index_range(-np.inf if window[0] is None else window[0], np.inf if window[1] is None else window[1])
+    for method in ('minmax', 'lttb'):
+        for index, (x, y) in enumerate(pyramid.decimate(*window, n_points = n_points, method = method)):
+            assert len(x) == len(y) <= n_points
+            assert np.all(np.diff(x) > 0)
+            assert x[0] >= mass_axis[start] and x[-1] <= mass_axis[stop - 1]
+            if method == 'minmax':
+                _, raw_y = decimate_minmax(np.asarray(mass_axis)[start:stop], traces[start:stop, index], n_points)
+                assert (y.min(), y.max()) == (raw_y.min(), raw_y.max())
+
+
+def test_default_window_starts_at_the_minimum(spiked):
+    mass_axis, traces, _ = spiked
+    x, _ = DecimationPyramid(mass_axis, traces, min_buckets = 16).decimate(n_points = 500)[0]
+    # the calibration runs backwards before t_off, the line must not draw back on itself
+    assert x[0] == np.asarray(mass_axis).min()
+    assert np.all(np.diff(x) > 0)
+
+
+def test_window_smaller_than_a_bucket(spiked):
+    mass_axis, traces, _ = spiked
+    pyramid = DecimationPyramid(mass_axis, traces, min_buckets = 16)
+    start, stop = pyramid.index_range(393.3, 393.32)
+    assert 0 < stop - start < pyramid.levels[0][0] * 4
+    for method in ('minmax', 'lttb'):
+        for index, (x, y) in enumerate(pyramid.decimate(393.3, 393.32, n_points = 2, method = method)):
+            assert len(y) <= max(2, stop - start) and len(y) > 0
+            np.testing.assert_array_equal(y, traces[start:stop, index][np.searchsorted(np.asarray(mass_axis)[start:stop], x)])
+    assert all(len(x) == 0 for x, _ in pyramid.decimate(393.32, 393.3))
+
+
+def test_lttb_keeps_the_ends():
+    x = np.arange(1000, dtype=np.float64)
+    y = np.sin(x / 50)
+    decimated_x, decimated_y = decimate_lttb(x, y, 100)
+    assert len(decimated_x) == 100
+    assert decimated_x[0] == 0 and decimated_x[-1] == 999
+    assert np.all(np.diff(decimated_x) > 0)
+
+
+def test_plot_matplotlib(spiked, tmp_path):
+    matplotlib = pytest.importorskip('matplotlib')
+    matplotlib.use('Agg')
+    mass_axis, traces, _ = spiked
+    pyramid = DecimationPyramid(mass_axis, traces, names = [530.0, 530.1, 530.2, 530.3, 530.4], min_buckets = 16)
+    fig, ax = plot_mass_spectra(pyramid, 390, 395, n_points = 200, backend = 'matplotlib', filename = str(tmp_path / 'overlay.png'))
+    assert len(ax.lines) == 5
+    assert (tmp_path / 'overlay.png').is_file()
+    with pytest.raises(ValueError, match="Unknown backend"):
+        plot_mass_spectra(pyramid, backend = 'bokeh')
@@ -0,0 +1,27 @@
+import numpy as np
+
+from packages import *
+
+
+def test_parallel_extract_matches_sequential(synthetic_files):
+    sequential = ProcessData_FELIX_HDF5(synthetic_files, n_samples = 20000).extract_FELIX_data()
+    parallel = ProcessData_FELIX_HDF5(synthetic_files, n_samples = 20000).extract_FELIX_data(workers = 2)
+
+    assert [reader.file for reader in parallel] == list(synthetic_files)
+    for expected, actual in zip(sequential, parallel):
+        assert actual.group_names == expected.group_names
+        assert actual.wavenumbers == expected.wavenumbers
+        assert actual.signal.dtype == expected.signal.dtype
+        np.testing.assert_array_equal(actual.signal, expected.signal)
+
+
+def test_parallel_compile_matches_sequential(synthetic_files):
+    sequential = ProcessData_FELIX_HDF5(synthetic_files)
+    sequential.extract_FELIX_data()
+    parallel = ProcessData_FELIX_HDF5(synthetic_files)
+    parallel.extract_FELIX_data(workers = 2)
+
+    expected, actual = sequential.compile_FELIX_data(), parallel.compile_FELIX_data()
+    assert actual.labels == expected.labels
+    np.testing.assert_array_equal(actual.wavenumbers, expected.wavenumbers)
+    np.testing.assert_array_equal(actual.traces, expected.traces)
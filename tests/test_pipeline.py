@@ -0,0 +1,64 @@
+import json
+import sys
+
+import h5py
+import numpy as np
+import pytest
+
+from packages import *
+from packages.FELIX_HDF5_Pipeline import main
+from conftest import make_config
+
+
+def test_pipeline_equals_batch_and_is_quiet(synthetic_files, batch, tmp_path, capsys):
+    spectrum = run_REMPI_pipeline(make_config(synthetic_files, tmp_path))
+    np.testing.assert_array_equal(spectrum.to_numpy(), batch[1].depletion_spectra.to_numpy())
+    # the wavenumbers of every file are not printed in a batch run
+    assert capsys.readouterr().out == ""
+
+
+def test_empty_spectrum_fails_only_that_config(synthetic_files, tmp_path):
+    # a file with only the first measurement (where the laser was before the scan)
+    empty = str(tmp_path / "240404_Data.0050.h5")
+    with h5py.File(empty, 'w') as file:
+        group = file.create_group('Rawdat').create_group('P00000_530.0000')
+        group.create_dataset('X', data=np.array([530.0]))
+        group.create_dataset('Trace', data=np.zeros((100, 2)))
+    with pytest.raises(ValueError, match="No wavenumbers"):
+        run_REMPI_pipeline(make_config([empty], tmp_path / "empty"))
+
+    configs = []
+    for name, files in (("empty", [empty]), ("full", synthetic_files)):
+        configs.append(str(tmp_path / f"{name}.json"))
+        with open(configs[-1], 'w') as file:
+            json.dump(make_config(files, tmp_path / name, name = name), file)
+    assert main(configs) == 1
+    assert (tmp_path / "full" / "config_full.json").is_file()
+
+
+def test_toml_needs_python_311(tmp_path, monkeypatch):
+    config_file = tmp_path / "config.toml"
+    config_file.write_text('files = "*.h5"\n')
+    monkeypatch.setitem(sys.modules, 'tomllib', None)
+    with pytest.raises(ValueError, match="3.11"):
+        load_pipeline_config(str(config_file))
+
+
+def test_unexpected_error_fails_only_that_config(synthetic_files, tmp_path, monkeypatch, capsys):
+    import packages.FELIX_HDF5_Pipeline as pipeline
+    run = pipeline.run_REMPI_pipeline
+    def run_or_fail(config_file, **kwargs):
+        if config_file.endswith("broken.json"):
+            raise RuntimeError("bug")
+        return run(config_file, **kwargs)
+    monkeypatch.setattr(pipeline, "run_REMPI_pipeline", run_or_fail)
+
+    configs = []
+    for name in ("broken", "full"):
+        configs.append(str(tmp_path / f"{name}.json"))
+        with open(configs[-1], 'w') as file:
+            json.dump(make_config(synthetic_files, tmp_path / name, name = name), file)
+    assert main(configs) == 1
+    assert (tmp_path / "full" / "config_full.json").is_file()
+    captured = capsys.readouterr()
+    assert "Failed" in captured.out and "RuntimeError" in captured.err
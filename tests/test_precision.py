@@ -0,0 +1,23 @@
+import numpy as np
+
+from packages import *
+from conftest import BASELINE_REFERENCE, INTERVAL, LIST_MASS_ISOTOPE, SCAN_WIDTH
+
+
+def test_float64_precision_is_unchanged(synthetic_files, compiled_data):
+    raw_data = ProcessData_FELIX_HDF5(synthetic_files, precision = 'float64')
+    raw_data.extract_FELIX_data()
+    np.testing.assert_array_equal(raw_data.compile_FELIX_data().traces, compiled_data.traces)
+
+
+def test_float32_read_equals_cast(synthetic_files, compiled_data, mass_axis):
+    raw_data = ProcessData_FELIX_HDF5(synthetic_files, precision = 'float32')
+    raw_data.extract_FELIX_data()
+    traces = raw_data.compile_FELIX_data().traces
+    assert traces.dtype == np.float32
+    # what compare_precision assumes: reading as float32 == casting the float64 traces
+    np.testing.assert_array_equal(traces, compiled_data.traces.astype(np.float32))
+
+    report = compare_precision(compiled_data, mass_axis, BASELINE_REFERENCE, INTERVAL, LIST_MASS_ISOTOPE, SCAN_WIDTH, verbose = False)
+    assert report["memory_reduced"] * 2 == report["memory_float64"]
+    assert report["max_rel_deviation"] < 1e-5
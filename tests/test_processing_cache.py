@@ -0,0 +1,45 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from packages import *
+from conftest import BASELINE_REFERENCE, INTERVAL
+
+
+@pytest.mark.parametrize('window', [None, 201])
+def test_baseline_cache_hit_skips_correction(compiled_data, mass_axis, tmp_path, monkeypatch, window):
+    cache = ProcessingCache(folder = str(tmp_path))
+    cold = baseline_fullrange(baseline_reference = BASELINE_REFERENCE, interval = INTERVAL, target_mass = mass_axis, compiled_data = compiled_data, window = window)
+    cold.run(cache)
+
+    def fail(self):
+        raise AssertionError("a cache hit must not correct the full dataset")
+    monkeypatch.setattr(baseline_fullrange, 'baseline_correction', fail)
+    warm = baseline_fullrange(baseline_reference = BASELINE_REFERENCE, interval = INTERVAL, target_mass = mass_axis, compiled_data = compiled_data, window = window)
+    tables = warm.run(cache)
+
+    assert warm.corrected is None
+    np.testing.assert_array_equal(warm.mean_values, cold.mean_values)
+    np.testing.assert_array_equal(warm.sums2, cold.sums2)
+    for wavenumber, table in cold.compiled_data2.items():
+        np.testing.assert_array_equal(tables[wavenumber].to_numpy(), table.to_numpy())
+
+
+def test_compiled_cache_follows_file_names(synthetic_files, tmp_path):
+    cache = ProcessingCache(folder = str(tmp_path / 'cache'))
+    first = ProcessData_FELIX_HDF5(synthetic_files, cache = cache).cached_compile_FELIX_data()
+
+    # the same content under other names gets the labels of the new names
+    renamed = []
+    for index, file in enumerate(synthetic_files):
+        renamed.append(str(tmp_path / f"240405_Data.{index + 10:04d}.h5"))
+        shutil.copyfile(file, renamed[-1])
+    raw_data = ProcessData_FELIX_HDF5(renamed, cache = cache)
+    second = raw_data.cached_compile_FELIX_data()
+
+    assert raw_data.data, "renamed files must not be taken from the cache"
+    assert second.labels != first.labels
+    assert all(label.split('_')[1] in {os.path.basename(file)[7:16] for file in renamed} for label in second.labels)
+    np.testing.assert_array_equal(second.traces, first.traces)
@@ -0,0 +1,45 @@
+import h5py
+import numpy as np
+import pytest
+
+from packages import *
+from conftest import BASELINE_REFERENCE, INTERVAL, LIST_MASS_ISOTOPE, SCAN_WIDTH
+
+
+def _square(item):
+    return item * item
+
+
+@pytest.mark.parametrize('executor', ['process', 'thread'])
+def test_read_ahead_keeps_order_and_budget(executor):
+    read_ahead = ReadAhead(_square, range(10), depth = 4, workers = 2, memory_budget = 25, size = lambda item: 10, executor = executor)
+    assert list(read_ahead) == [(item, item * item) for item in range(10)]
+    assert read_ahead.max_bytes_in_flight == 20
+
+
+def test_prefetch_extract_equals_sequential(synthetic_files, compiled_data):
+    raw_data = ProcessData_FELIX_HDF5(synthetic_files)
+    raw_data.extract_FELIX_data(prefetch = 2, memory_budget = 1, verbose = False)
+    actual = raw_data.compile_FELIX_data()
+    assert actual.labels == compiled_data.labels
+    np.testing.assert_array_equal(actual.traces, compiled_data.traces)
+
+
+@pytest.mark.parametrize('open_files', [False, True])
+def test_prefetch_stream_equals_sequential(synthetic_files, mass_axis, open_files):
+    def stream(files, **options):
+        return StreamData_FELIX_HDF5(files, target_mass = mass_axis, baseline_reference = BASELINE_REFERENCE, interval = INTERVAL,
+                                     list_mass_isotope = LIST_MASS_ISOTOPE, scan_width = SCAN_WIDTH, **options).run()
+
+    expected = stream(synthetic_files)
+    if open_files:
+        # open h5py.File objects are read ahead by threads
+        files = [h5py.File(file, 'r') for file in synthetic_files]
+        try:
+            actual = stream(files, prefetch = 3)
+        finally:
+            for file in files:
+                file.close()
+    else:
+        actual = stream(synthetic_files, prefetch = 3, workers = 2)
+    np.testing.assert_array_equal(actual.to_numpy(), expected.to_numpy())
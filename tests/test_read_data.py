@@ -0,0 +1,47 @@
+import h5py
+import numpy as np
+
+from packages import *
+from conftest import N_SAMPLES
+
+
+def old_read(file):
+    # the full read of the original extract_wavenumbers and extract_signal, over every group of the file
+    wavenumbers, signal = [], []
+    for name, item in file.items():
+        if isinstance(item, h5py.Group):
+            for name2, item2 in item.items():
+                if isinstance(item2, h5py.Group):
+                    wavenumbers.append(round((file['Rawdat'][name2]["X"][:][0]), 2))
+                    signal.append(file['Rawdat'][name2]["Trace"][:])
+    return wavenumbers, np.array(signal)
+
+
+def test_selection_reads_equal_full_read(synthetic_files):
+    for file_name in synthetic_files:
+        with h5py.File(file_name, 'r') as file:
+            wavenumbers, signal = old_read(file)
+            names = [name for name in file['Rawdat']]
+
+        current_file = ReadData_FELIX_HDF5(file_name)
+        assert current_file.extract_wavenumbers(verbose = False) == wavenumbers
+        assert current_file.group_names == names
+        np.testing.assert_array_equal(current_file.extract_signal(), signal)
+
+        actual_wavenumbers, actual = current_file.extract_data(channel = 0, n_samples = 1000, verbose = False)
+        assert actual_wavenumbers == wavenumbers
+        np.testing.assert_array_equal(actual, signal[:, :1000, :1])
+        _, actual = current_file.extract_data(channel = [1, 0], verbose = False)
+        np.testing.assert_array_equal(actual, signal[:, :, [1, 0]])
+        np.testing.assert_array_equal(current_file.read_trace(names[2], channel = 1), signal[2, :, 1])
+
+
+def test_open_file_and_shape(synthetic_files):
+    with h5py.File(synthetic_files[0], 'r') as file:
+        current_file = ReadData_FELIX_HDF5(file)
+        shape, dtype = current_file.extract_shape(channel = None)
+        _, signal = current_file.extract_data(channel = None, verbose = False)
+        # the open file is not closed by the reader
+        assert file.id.valid
+    assert shape == signal.shape == (len(current_file.group_names), N_SAMPLES, 2)
+    assert dtype == signal.dtype == np.float64
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from packages import *
+from packages.BaselineCorrection import _rolling_extreme
+from conftest import BASELINE_REFERENCE, INTERVAL
+
+
+@pytest.mark.parametrize('function', [np.minimum, np.maximum])
+@pytest.mark.parametrize('window', [1, 3, 7, 51])
+def test_rolling_extreme_matches_loop(function, window):
+    data = np.random.default_rng(0).normal(size=(200, 3))
+    half = window // 2
+    expected = np.array([function.reduce(data[max(i-half, 0):i+half+1], axis=0) for i in range(len(data))])
+    np.testing.assert_array_equal(_rolling_extreme(data, window, function), expected)
+
+
+def test_drift_is_recovered_under_narrow_peaks():
+    samples = np.arange(5000)
+    drift = 0.2 + 1e-4*samples + 0.05*np.sin(samples/800)
+    peaks = sum(np.exp(-0.5*((samples - center)/3)**2) for center in (1000, 2500, 4000))
+    data = np.column_stack([drift + peaks, 2*drift])
+    curves = rolling_baseline(data, 101)
+    # the windows are cut off at the ends, next to a peak the flat window lifts the curve by about slope x peak width
+    inside = slice(150, -150)
+    np.testing.assert_allclose(curves[inside, 0], drift[inside], atol=5e-3)
+    np.testing.assert_allclose(curves[inside, 1], 2*drift[inside], atol=1e-4)
+    # the columns are independent of how they are blocked
+    np.testing.assert_array_equal(rolling_baseline(data, 101, block = 1), curves)
+    np.testing.assert_array_equal(rolling_baseline(data[:, 0], 101), curves[:, 0])
+
+
+def test_window_mode_corrects_every_column_on_its_own(compiled_data, mass_axis):
+    fullrange = baseline_fullrange(baseline_reference = BASELINE_REFERENCE, interval = INTERVAL, target_mass = mass_axis, compiled_data = compiled_data, window = 201)
+    fullrange.run()
+    columns = np.arange(0, compiled_data.traces.shape[1], 5)
+    np.testing.assert_array_equal(fullrange.correct_columns(columns), fullrange.corrected[:, columns])
+    assert np.isfinite(fullrange.sums2).all()
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from packages import *
+from conftest import BASELINE_REFERENCE, INTERVAL
+
+
+def test_scratch_equals_compiled(synthetic_files, compiled_data, mass_axis, tmp_path):
+    raw_data = ProcessData_FELIX_HDF5(synthetic_files)
+    raw_data.write_scratch(str(tmp_path / 'scratch'))
+    opened = raw_data.open_scratch(str(tmp_path / 'scratch'))
+    assert isinstance(opened.traces, np.memmap)
+    assert opened.labels == compiled_data.labels
+    np.testing.assert_array_equal(opened.wavenumbers, compiled_data.wavenumbers)
+    np.testing.assert_array_equal(opened.offsets, compiled_data.offsets)
+    np.testing.assert_array_equal(opened.traces, compiled_data.traces)
+
+    sums2 = []
+    for data in (compiled_data, opened):
+        fullrange = baseline_fullrange(baseline_reference = BASELINE_REFERENCE, interval = INTERVAL, target_mass = mass_axis, compiled_data = data)
+        fullrange.run()
+        sums2.append(fullrange.sums2)
+    np.testing.assert_array_equal(sums2[1], sums2[0])
+
+
+def test_scratch_checks_precision_and_samples(synthetic_files, tmp_path):
+    folder = str(tmp_path / 'scratch32')
+    ProcessData_FELIX_HDF5(synthetic_files, precision = 'float32').write_scratch(folder)
+    assert ProcessData_FELIX_HDF5(synthetic_files, precision = 'float32').open_scratch(folder).traces.dtype == np.float32
+    # the default reads the float64 of the files, a float32 copy does not fit
+    with pytest.raises(ValueError, match="precision"):
+        ProcessData_FELIX_HDF5(synthetic_files).open_scratch(folder)
+
+    folder = str(tmp_path / 'scratch_short')
+    ProcessData_FELIX_HDF5(synthetic_files, n_samples = 1000).write_scratch(folder)
+    with pytest.raises(ValueError, match="n_samples"):
+        ProcessData_FELIX_HDF5(synthetic_files).open_scratch(folder)
@@ -0,0 +1,17 @@
+import numpy as np
+
+from packages import *
+from conftest import BASELINE_REFERENCE, INTERVAL, LIST_MASS_ISOTOPE, SCAN_WIDTH
+
+
+def stream(files, mass_axis, **options):
+    return StreamData_FELIX_HDF5(files, target_mass = mass_axis, baseline_reference = BASELINE_REFERENCE, interval = INTERVAL,
+                                 list_mass_isotope = LIST_MASS_ISOTOPE, scan_width = SCAN_WIDTH, keep_sums = True, **options)
+
+
+def test_stream_equals_batch(synthetic_files, mass_axis, batch):
+    fullrange, spectrum = batch
+    streamed = stream(synthetic_files, mass_axis)
+    np.testing.assert_array_equal(streamed.run().to_numpy(), spectrum.depletion_spectra.to_numpy())
+    for k, wavenumber in enumerate(fullrange.compiled_data.wavenumbers):
+        np.testing.assert_array_equal(streamed.sums[wavenumber], fullrange.sums2[:, k])
@@ -0,0 +1,47 @@
+from collections import Counter
+
+import h5py
+import numpy as np
+
+from packages import *
+from conftest import N_SAMPLES
+
+
+def test_layout_of_the_synthetic_files(synthetic_files):
+    scan = [round(wavenumber, 2) for wavenumber in 530 + 0.1*np.arange(8)]
+    readers = []
+    expected_skipped, expected_doubled = [], []
+    for file_name in synthetic_files:
+        with h5py.File(file_name, 'r') as file:
+            names = list(file['Rawdat'])
+            assert file['Rawdat'][names[0]]['Trace'].shape == (N_SAMPLES, 2)
+        reader = ReadData_FELIX_HDF5(file_name)
+        reader.extract_wavenumbers(verbose = False)
+        readers.append(reader)
+        # the group names carry the wavenumber that X[0] holds
+        assert reader.wavenumbers == [round(float(name.split('_')[1]), 2) for name in names]
+        # the first measurement is at the end of the scan, then one wavenumber is skipped and one measured twice
+        assert reader.wavenumbers[0] == scan[-1]
+        counts = Counter(reader.wavenumbers[1:])
+        label = file_label(file_name)
+        expected_skipped += [(wavenumber, label) for wavenumber in scan if counts[wavenumber] == 0]
+        expected_doubled += [(wavenumber, label) for wavenumber in scan if counts[wavenumber] == 2]
+        assert len(reader.wavenumbers) == len(scan) + 1
+        assert sorted(counts.values()) == [1]*(len(scan) - 2) + [2]
+
+    groups = WavenumberGroups.from_readers(readers, file_labels = [file_label(file) for file in synthetic_files])
+    # every wavenumber of the scan was measured in some file
+    assert groups.wavenumbers == scan
+    assert sorted(map(tuple, groups.skipped()[["wavenumber", "file"]].values.tolist())) == sorted(expected_skipped)
+    assert sorted(map(tuple, groups.doubled()[["wavenumber", "file"]].values.tolist())) == sorted(expected_doubled)
+    assert (groups.doubled()["measurements"] == 2).all()
+    assert len(expected_skipped) == len(expected_doubled) == len(synthetic_files)
+
+
+def test_same_seed_same_files(tmp_path):
+    first = generate_FELIX_HDF5(str(tmp_path / 'a'), n_files = 1, n_wavenumbers = 4, n_samples = 500, seed = 5)[0]
+    second = generate_FELIX_HDF5(str(tmp_path / 'b'), n_files = 1, n_wavenumbers = 4, n_samples = 500, seed = 5)[0]
+    with h5py.File(first, 'r') as a, h5py.File(second, 'r') as b:
+        assert list(a['Rawdat']) == list(b['Rawdat'])
+        for name in a['Rawdat']:
+            np.testing.assert_array_equal(a['Rawdat'][name]['Trace'][()], b['Rawdat'][name]['Trace'][()])
@@ -0,0 +1,58 @@
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from packages import *
+from conftest import N_SAMPLES, BASELINE_REFERENCE, INTERVAL, LIST_MASS_ISOTOPE, SCAN_WIDTH, make_config
+
+SPARSE = [True, {"threshold": 5}, {"threshold": 5, "padding": 4, "margin": 0.3}]
+# the second baseline window overlaps the isotope window 393.3 +- 2 scan widths
+BASELINES = [{"reference": BASELINE_REFERENCE, "interval": INTERVAL}, {"reference": 393.0, "interval": INTERVAL}]
+
+
+def read_output(directory, prefix):
+    return pd.read_csv(glob.glob(os.path.join(directory, f"{prefix}_*.csv"))[0], index_col=0, float_precision="round_trip")
+
+
+@pytest.fixture(scope='module')
+def dense(synthetic_files, tmp_path_factory):
+    # dense spectrum and bootstrap of every baseline window, with their output folders
+    output = {}
+    for k, baseline in enumerate(BASELINES):
+        directory = tmp_path_factory.mktemp(f'dense{k}')
+        spectrum = run_REMPI_pipeline(make_config(synthetic_files, directory, baseline = baseline, bootstrap = 20, seed = 3))
+        output[k] = spectrum, str(directory)
+    return output
+
+
+@pytest.mark.parametrize('k', range(len(BASELINES)))
+@pytest.mark.parametrize('sparse', SPARSE)
+def test_sparse_equals_dense(synthetic_files, dense, tmp_path, k, sparse):
+    spectrum = run_REMPI_pipeline(make_config(synthetic_files, tmp_path, baseline = BASELINES[k], sparse = sparse, bootstrap = 20, seed = 3))
+    expected, directory = dense[k]
+    np.testing.assert_array_equal(spectrum.to_numpy(), expected.to_numpy())
+    for prefix in ("fullrange_depletion_data", "fullrange_depletion_uncertainty"):
+        pd.testing.assert_frame_equal(read_output(str(tmp_path), prefix), read_output(directory, prefix), check_exact=True)
+    # both files have the same spectrum
+    np.testing.assert_array_equal(read_output(str(tmp_path), "fullrange_depletion_uncertainty")["sum_withoutIR"].to_numpy(), spectrum["sum_withoutIR"].to_numpy())
+
+
+def test_segmented_read_equals_compact(synthetic_files, compiled_data, mass_axis):
+    segments = TraceSegments.for_analysis(mass_axis, BASELINE_REFERENCE, INTERVAL, LIST_MASS_ISOTOPE, SCAN_WIDTH)
+    assert len(segments) < N_SAMPLES
+    raw_data = ProcessData_FELIX_HDF5(synthetic_files, segments = segments)
+    raw_data.extract_FELIX_data()
+    actual, expected = raw_data.compile_FELIX_data(), segments.compact(compiled_data)
+    assert actual.labels == expected.labels
+    np.testing.assert_array_equal(actual.traces, expected.traces)
+    np.testing.assert_array_equal(segments.expand(actual.traces)[segments.rows], compiled_data.traces[segments.rows])
+    np.testing.assert_array_equal(np.asarray(segments.compact_mass(mass_axis)), np.asarray(mass_axis)[segments.rows])
+
+
+def test_as_slice():
+    assert as_slice(np.arange(3, 7)) == slice(3, 7)
+    np.testing.assert_array_equal(as_slice([1, 2, 4]), [1, 2, 4])
+    assert len(as_slice(np.array([], dtype=int))) == 0
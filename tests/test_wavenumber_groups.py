@@ -0,0 +1,58 @@
+import os
+import shutil
+
+import h5py
+import numpy as np
+import pytest
+
+from packages import *
+from conftest import BASELINE_REFERENCE, INTERVAL, LIST_MASS_ISOTOPE, SCAN_WIDTH
+
+
+def test_zero_tolerance_groups_identical_readings():
+    wavenumbers_per_file = [[531.0, 530.0, 530.1, 530.1, 530.3], [531.0, 530.0, 530.2, 530.3]]
+    groups = WavenumberGroups(wavenumbers_per_file)
+    assert groups.wavenumbers == [530.0, 530.1, 530.2, 530.3]
+    assert groups.members(1) == [(0, 2), (0, 3)]
+    assert groups.members(3) == [(0, 4), (1, 3)]
+    assert groups.skipped()[["wavenumber", "file"]].values.tolist() == [[530.1, "1"], [530.2, "0"]]
+    assert groups.doubled()["wavenumber"].tolist() == [530.1]
+
+
+def test_drifting_readings_do_not_chain():
+    # neighbouring readings are closer than the tolerance, a gap rule would merge all of them into one wavenumber
+    readings = list(np.round(530 + 0.015*np.arange(10), 4))
+    groups = WavenumberGroups([[0.0] + readings], tolerance = 0.02)
+    assert len(groups) == 5
+    assert (groups.table()["spread"] <= 0.02).all()
+
+
+def jitter(files, directory, amount, seed = 0):
+    # copies of the files with every reading moved by up to +-amount, the group names stay
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok = True)
+    copies = []
+    for file in files:
+        copies.append(os.path.join(directory, os.path.basename(file)))
+        shutil.copy(file, copies[-1])
+        with h5py.File(copies[-1], 'r+') as copy:
+            for group in copy['Rawdat'].values():
+                group['X'][0] = np.round(group['X'][0] + rng.uniform(-amount, amount), 4)
+    return copies
+
+
+def test_live_groups_like_batch(synthetic_files, mass_axis, tmp_path):
+    files = jitter(synthetic_files, str(tmp_path / 'jittered'), 0.004)
+    raw_data = ProcessData_FELIX_HDF5(files, tolerance = 0.02)
+    raw_data.extract_FELIX_data(verbose = False)
+    compiled_data = raw_data.compile_FELIX_data()
+    assert len(compiled_data) == 8
+
+    monitor = LiveData_FELIX_HDF5(str(tmp_path / 'jittered'), target_mass = mass_axis, baseline_reference = BASELINE_REFERENCE, interval = INTERVAL,
+                                  list_mass_isotope = LIST_MASS_ISOTOPE, scan_width = SCAN_WIDTH, wait_for_complete = False, tolerance = 0.02)
+    assert len(monitor.poll()) == len(files)
+    assert len(monitor.sums) == len(compiled_data)
+    # the live wavenumbers are the first readings, the batch ones the most frequent readings of the same groups
+    live = sorted(monitor.counts.items())
+    np.testing.assert_allclose([wavenumber for wavenumber, _ in live], compiled_data.wavenumbers, atol = 0.02)
+    assert [count for _, count in live] == np.diff(compiled_data.offsets).tolist()